@@ -0,0 +1,233 @@
+import os
+import re
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import indicators as ta
+import feature_graph as fg
+import panel_engine as pe
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+OUTPUT_DIR = 'results/bar_sequence'
+CHUNK_SIZE = 300             # 全历史统计时每批装载的股票数，控制内存
+
+# 具名谓词：无法写成“两个操作数比较”的单根K线条件，(所需字段, 函数)
+PREDICATES = {
+    'drop_body2': (['open', 'close'], lambda v: (v['open'] - v['close']) / ta.shift(v['close']) > 0.02),
+}
+
+
+class BarPattern:
+    """
+    声明式K线序列：alternatives 中每一项是一个等长的步骤列表，任一项成立即命中。
+    每个步骤是若干条件 (全部成立)，条件可以是 PREDICATES 中的名字，或比较式：
+        'close < open'           阴线
+        'volume < volume@2'      @k 表示 k 根K线之前的值
+        'volume > 1.8*volume@1'  操作数可带系数
+        '!pct_chg < 7'           ! 取反 (缺失值视为“不小于”，与逐行 if 判断一致)
+    操作数为原始列或 feature_graph 的参数化特征 (ma10 / vol_ma5 / close_max3 ...)。
+    跨K线的关系 (缩量、不破某根开盘价) 都写成“本根相对前 k 根”的条件，序列只负责按位置对齐。
+    """
+
+    def __init__(self, name, *alternatives, min_bars=1):
+        self.name = name
+        self.alternatives = [[[step] if isinstance(step, str) else list(step) for step in alt] for alt in alternatives]
+        self.min_bars = min_bars
+
+    @property
+    def conditions(self):
+        return [c for alt in self.alternatives for step in alt for c in step]
+
+    @property
+    def length(self):
+        return max(len(alt) for alt in self.alternatives)
+
+    def __repr__(self):
+        return f"BarPattern({self.name}, {len(self.alternatives)} 种排列, 最长 {self.length} 根)"
+
+
+PATTERNS = [
+    # 三阴生阳：大阳线 (>=7%) 后连续三根阴线，量能逐级萎缩，收盘不破大阳线开盘价
+    BarPattern('three_yin_one_yang', [
+        '!pct_chg < 7',
+        ['close < open', 'volume < volume@1'],
+        'close < open',
+        ['close < open', 'volume < volume@2', '!close < open@3'],
+    ], min_bars=10),
+    # 阴阳双板：涨停 + 回调阴线 + 反包
+    BarPattern('double_plate', ['pct_chg > 9.5', 'close < open', 'pct_chg > 5']),
+    # 倒拔垂杨柳：10日线上方的高开低走放量大阴线，跌幅不超过 2%
+    BarPattern('willow_pull', [
+        ['close > ma10', 'open > close', 'drop_body2', 'volume > 1.8*vol_ma5@1',
+         'pct_chg > -2', 'close >= 5', 'close <= 20'],
+    ], min_bars=20),
+    # 连阳缩倍量：近9根中的最大量阳线 (距今 2~4 根)，其后缩量洗盘至最大量一半以下，今日倍量阳线站上洗盘区高点
+    BarPattern('consecutive_sun', *[
+        [['close > open', f'volume > volume_max{9 - d}@1']]
+        + [f'volume <= volume@{s}' for s in range(1, d)]
+        + [['close > open', 'volume > 1.8*volume@1', f'close >= close_max{d - 1}@1',
+            f'!volume_min{d - 1}@1 > 0.5*volume@{d}', 'close >= 5', 'close <= 20']]
+        for d in (2, 3, 4)
+    ], min_bars=15),
+]
+
+_CONDITION = re.compile(r'^(!?)\s*(\S+)\s*(>=|<=|==|>|<)\s*(\S+)$')
+_OPERAND = re.compile(r'^(?:(\d+(?:\.\d+)?)\*)?([a-z_][a-z0-9_]*?)(?:@(\d+))?$')
+_COMPARE = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal, '==': np.equal}
+
+
+def _parse_operand(text):
+    try:
+        return ('const', float(text))
+    except ValueError:
+        pass
+    m = _OPERAND.match(text)
+    if not m:
+        raise ValueError(f"无法解析的操作数: {text}")
+    factor = float(m.group(1)) if m.group(1) else None
+    return ('feature', m.group(2), int(m.group(3) or 0), factor)
+
+
+def parse_condition(cond):
+    """条件 -> (是否取反, 左操作数, 比较符, 右操作数) 或 ('named', 名字)"""
+    if cond in PREDICATES:
+        return ('named', cond)
+    m = _CONDITION.match(cond.strip())
+    if not m:
+        raise ValueError(f"无法解析的条件: {cond} (应为 PREDICATES 中的名字或 '左 比较符 右')")
+    return (bool(m.group(1)), _parse_operand(m.group(2)), m.group(3), _parse_operand(m.group(4)))
+
+
+def _features(parsed):
+    if parsed[0] == 'named':
+        return list(PREDICATES[parsed[1]][0])
+    return [op[1] for op in (parsed[1], parsed[3]) if op[0] == 'feature']
+
+
+class SequenceMatcher:
+    """
+    把一组 BarPattern 编译成位掩码匹配：
+    - 所有条件去重后各占一个比特，每根K线编码为一个 uint64 (第 0 位为“有效K线”)；
+    - 每种排列的每个步骤是一个掩码，长度 L 的排列在 L 根滑动窗口上做一次 (窗口 & 掩码) == 掩码；
+    - 输入可以是单只股票的一维数组，也可以是 (T, N) 面板，一次得到所有股票所有日期的命中位置。
+    """
+
+    def __init__(self, patterns=None):
+        self.patterns = {p.name: p for p in (patterns or PATTERNS)}
+        conds = list(dict.fromkeys(c for p in self.patterns.values() for c in p.conditions))
+        if len(conds) > 63:
+            raise ValueError(f"单个匹配器最多 63 个条件，当前 {len(conds)} 个，请拆分")
+        self.parsed = {c: parse_condition(c) for c in conds}
+        self.bits = {c: np.uint64(1) << np.uint64(i + 1) for i, c in enumerate(conds)}
+        feats = list(dict.fromkeys(f for p in self.parsed.values() for f in _features(p)))
+        self.plan = fg.FeaturePlan({'sequence': (feats + ['close'], None)})
+        self.masks = {
+            name: [np.array([self._mask(step) for step in alt], dtype=np.uint64) for alt in p.alternatives]
+            for name, p in self.patterns.items()
+        }
+
+    def _mask(self, step):
+        mask = np.uint64(1)
+        for c in step:
+            mask |= self.bits[c]
+        return mask
+
+    @property
+    def raw_fields(self):
+        return self.plan.raw_fields
+
+    def _operand(self, values, op):
+        if op[0] == 'const':
+            return op[1]
+        _, name, lag, factor = op
+        x = values[name] if lag == 0 else ta.shift(values[name], lag)
+        return x if factor is None else factor * x
+
+    def _evaluate(self, values, parsed):
+        if parsed[0] == 'named':
+            return PREDICATES[parsed[1]][1](values)
+        negate, lhs, op, rhs = parsed
+        out = _COMPARE[op](self._operand(values, lhs), self._operand(values, rhs))
+        return ~out if negate else out
+
+    def encode(self, source):
+        """source: {字段: 数组} 或 Panel，返回 (每根K线的条件编码, 截至每根的有效K线数)"""
+        values = self.plan.compute(source)
+        valid = ~np.isnan(values['close'])
+        codes = valid.astype(np.uint64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for c, parsed in self.parsed.items():
+                codes |= np.where(self._evaluate(values, parsed) & valid, self.bits[c], np.uint64(0))
+        return codes, np.cumsum(valid, axis=0)
+
+    def match(self, source, names=None):
+        """返回 {形态名: 与输入同形的布尔数组}，True 表示形态在该K线结束"""
+        codes, bars = self.encode(source)
+        out = {}
+        for name in names or self.patterns:
+            hit = np.zeros(codes.shape, dtype=bool)
+            for masks in self.masks[name]:
+                L = len(masks)
+                if len(codes) < L:
+                    continue
+                windows = np.lib.stride_tricks.sliding_window_view(codes, L, axis=0)
+                hit[L - 1:] |= ((windows & masks) == masks).all(axis=-1)
+            out[name] = hit & (bars >= self.patterns[name].min_bars)
+        return out
+
+
+_MATCHERS = {}
+
+def get_matcher(*names):
+    """按形态名取编译好的匹配器 (进程内缓存)"""
+    if names not in _MATCHERS:
+        _MATCHERS[names] = SequenceMatcher([p for p in PATTERNS if p.name in names])
+    return _MATCHERS[names]
+
+
+def match_last(df, name):
+    """单只股票 (英文字段名) 的最新一根K线是否以该形态结尾，供各战法脚本复用"""
+    matcher = get_matcher(name)
+    source = {k: pd.to_numeric(df[k], errors='coerce').values for k in matcher.raw_fields}
+    return bool(matcher.match(source)[name][-1])
+
+
+def positions(hit, panel=None):
+    """命中位置列表：一维返回行号，面板返回 (日期, 代码) 对"""
+    if hit.ndim == 1:
+        return np.flatnonzero(hit).tolist()
+    rows, cols = np.nonzero(hit)
+    if panel is None:
+        return list(zip(rows.tolist(), cols.tolist()))
+    dates = panel.dates[rows, cols] if panel.align == 'bar' else panel.dates[rows]
+    return [(d, panel.codes[j]) for d, j in zip(dates, cols)]
+
+
+def main():
+    """全市场全历史统计各形态的出现次数，以及最新一根K线上的命中股票数"""
+    matcher = SequenceMatcher()
+    files = sorted(f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0].isdigit())
+    codes = [f.split('.')[0] for f in files]
+    total = {name: 0 for name in matcher.patterns}
+    latest = {name: [] for name in matcher.patterns}
+    t0 = time.perf_counter()
+    for i in range(0, len(codes), CHUNK_SIZE):
+        panel = pe.load_panel(DATA_DIR, codes=codes[i:i + CHUNK_SIZE], fields=matcher.raw_fields, align='bar')
+        for name, hit in matcher.match(panel).items():
+            total[name] += int(hit.sum())
+            latest[name] += [c for c, h in zip(panel.codes, hit[-1]) if h]
+    print(f"K线序列统计完成：{len(codes)} 只股票，耗时 {time.perf_counter() - t0:.1f}s")
+
+    rows = [{'pattern': name, 'history_matches': total[name], 'latest_hits': len(latest[name]),
+             'latest_codes': ' '.join(latest[name])} for name in matcher.patterns]
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"pattern_counts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    pd.DataFrame(rows).to_csv(path, index=False, encoding='utf-8-sig')
+    for r in rows:
+        print(f"  {r['pattern']:<20}历史 {r['history_matches']:>7} 次，最新K线 {r['latest_hits']:>4} 只")
+
+
+if __name__ == "__main__":
+    main()
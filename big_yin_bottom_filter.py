@@ -1,8 +1,9 @@
 import os
 import pandas as pd
 import numpy as np
+import indicators as ta
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import strategy_registry as sr
 
 # --- 配置参数 ---
 DATA_DIR = 'stock_data'
@@ -15,7 +16,7 @@ COL_MAP = {
     '最低': 'low', '收盘': 'close', '成交量': 'volume', '涨跌幅': 'pct_chg'
 }
 
-def check_big_yin_logic(df):
+def check_big_yin_logic(df, symbol=None):
     """
     战法名称：大阴线黄金坑战法（精简版）
     包含形态：
@@ -39,7 +40,7 @@ def check_big_yin_logic(df):
         return None
 
     # 计算均线
-    ma10 = df['close'].rolling(10).mean().values
+    ma10 = ta.Indicators(df, symbol).ma(10)
 
     # --- 形态一：支撑线上的“牛回头” ---
     # 逻辑：10日线上行，今日是大阴线(<-3%)，触碰10日线不破，且显著缩量
@@ -64,62 +65,23 @@ def check_big_yin_logic(df):
 
     return None
 
-def process_stock(file_name):
-    """单只股票处理逻辑"""
-    code = file_name.split('.')[0]
-    # 默认过滤创业板(30开头)，如需包含请删除此行
-    if code.startswith('30'): 
-        return None 
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做判定 (单独运行与统一调度器共用)"""
+    df = df.rename(columns=COL_MAP)
+    if df.empty or len(df) < 10: 
+        return None
     
-    file_path = os.path.join(DATA_DIR, file_name)
-    try:
-        df = pd.read_csv(file_path)
-        df = df.rename(columns=COL_MAP)
-        if df.empty or len(df) < 10: 
-            return None
+    # 统一处理百分比（去除 % 符号并转为 float）
+    if 'pct_chg' in df.columns and df['pct_chg'].dtype == object:
+        df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
         
-        # 统一处理百分比（去除 % 符号并转为 float）
-        if 'pct_chg' in df.columns and df['pct_chg'].dtype == object:
-            df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
-            
-        signal = check_big_yin_logic(df)
-        if signal:
-            return {'code': code, 'type': signal}
-    except Exception as e:
-        # print(f"处理 {code} 时出错: {e}")
-        return None
+    signal = check_big_yin_logic(df, code)
+    if signal:
+        return {'code': code, 'type': signal}
     return None
 
-def main():
-    # 1. 环境准备
-    if not os.path.exists(NAMES_FILE):
-        print(f"错误：找不到名称映射文件 {NAMES_FILE}")
-        return
-    
-    if not os.path.exists(DATA_DIR):
-        print(f"错误：找不到数据目录 {DATA_DIR}")
-        return
-
-    # 2. 加载名称并过滤 ST 股
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    # 过滤掉名称中带 ST 的股票
-    valid_names_df = names_df[~names_df['name'].str.contains('ST|st', na=False)]
-    valid_codes = set(valid_names_df['code'])
-
-    # 3. 筛选待处理文件
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
-    
-    print(f"开始扫描 {len(files)} 只个股...")
-
-    # 4. 多进程并行处理
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_stock, files))
-    
-    # 5. 过滤掉 None 结果
-    found = [r for r in results if r is not None]
-    
-    # 6. 保存并输出结果
+def save_results(found, names_df):
+    # 合并名称并保存
     now = datetime.now()
     month_dir = os.path.join(OUTPUT_BASE, now.strftime('%Y%m'))
     if not os.path.exists(month_dir):
@@ -130,7 +92,7 @@ def main():
     if found:
         res_df = pd.DataFrame(found)
         # 合并股票名称
-        final_df = pd.merge(res_df, valid_names_df, on='code', how='left')
+        final_df = pd.merge(res_df, names_df, on='code', how='left')
         file_path = os.path.join(month_dir, f'big_yin_bottom_{ts}.csv')
         final_df.to_csv(file_path, index=False, encoding='utf-8-sig')
         print("-" * 30)
@@ -141,5 +103,20 @@ def main():
     else:
         print("扫描完成，未发现符合条件的信号。")
 
+# 默认过滤创业板(30开头)与 ST 股，如需包含创业板请删除 exclude_prefixes
+STRATEGY = sr.register('big_yin_bottom', evaluate, save_results, lookback=60,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE):
+        print(f"错误：找不到名称映射文件 {NAMES_FILE}")
+        return
+    
+    if not os.path.exists(DATA_DIR):
+        print(f"错误：找不到数据目录 {DATA_DIR}")
+        return
+
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,335 @@
+import os
+import glob
+import pickle
+import time
+import numpy as np
+import pandas as pd
+import indicators as ta
+from indicator_state import EwmState, MACD_FAST, MACD_SLOW, MACD_SIGNAL
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+STATE_FILE = 'cache/chan_state.pkl'
+STROKE_MIN_GAP = 4           # 一笔两端分型的中间K线 (包含处理后) 序号至少相差 4，即不共用K线且中间至少隔一根
+SEGMENT_MIN_STROKES = 3      # 一段至少 3 笔
+
+
+class Point:
+    """笔的端点 (顶/底分型的极值K线)，同时记下该K线的 DIF 与红柱/绿柱各自的累计面积，供背驰比较"""
+    __slots__ = ('kind', 'price', 'bar', 'date', 'k', 'dif', 'cum_red', 'cum_green')
+
+    def __init__(self, kind, price, bar, date, k, dif, cum_red, cum_green):
+        self.kind, self.price, self.bar, self.date = kind, price, bar, date
+        self.k, self.dif, self.cum_red, self.cum_green = k, dif, cum_red, cum_green
+
+    def beyond(self, other):
+        """同类端点比较：顶更高 / 底更低"""
+        return self.price > other.price if self.kind == 'top' else self.price < other.price
+
+    def __repr__(self):
+        return f"Point({self.kind} {self.price} @ {self.date})"
+
+    def as_dict(self):
+        return {'date': self.date, 'bar': self.bar, 'kind': self.kind, 'price': self.price, 'dif': self.dif}
+
+
+class ChanState:
+    """
+    单只股票的缠论结构状态，逐根K线推进，每根均摊 O(1)：
+    1. 包含处理：只保留最后 3 根合并K线 (高/低点各自记录来源K线)；
+    2. 分型：新的合并K线出现时，前一根合并K线定型，检查它是否为顶/底分型；
+    3. 笔：顶底交替且间隔足够时追加端点，同类分型更极端时替换最后一个端点 (只有最后一个端点未确认)；
+    4. 线段/中枢：只在笔端点确认时推进，线段端点同理只有最后一个未确认。
+    """
+    VERSION = 2                  # 状态结构变化时加一，旧状态自动重建
+
+    def __init__(self):
+        self.version = self.VERSION
+        self.n_bars = 0
+        self.first_date = None
+        self.first_close = np.nan
+        self.last_date = None
+        self.last_close = np.nan
+        self.ema_fast = EwmState(2.0 / (MACD_FAST + 1), False)
+        self.ema_slow = EwmState(2.0 / (MACD_SLOW + 1), False)
+        self.dea = EwmState(2.0 / (MACD_SIGNAL + 1), False)
+        self.cum_red = 0.0           # MACD 红柱 (hist > 0) 累计面积
+        self.cum_green = 0.0         # MACD 绿柱 (hist < 0) 累计面积 (取绝对值)
+        self.n_merged = 0
+        self.merged = []             # [高点, 低点, 序号 k]，高/低点为 (价格, K线序号, 日期, DIF, 柱累计)
+        self.points = []             # 笔端点，最后一个可被替换
+        self.seg_points = []         # 线段端点在 points 中的下标，最后一个可被替换
+        self.seg_counter = None      # 当前线段末端之后反向笔端点的极值 (判断反向是否创新低/新高)
+        self.pivots = []             # 已完成的中枢
+        self.pivot = None            # 正在延伸的中枢
+        self.pivot_window = []       # 尚未组成中枢的已确认笔
+
+    # ---------- 推进 ----------
+    def matches(self, dates, closes):
+        """已处理部分的首尾K线未被改写，才允许增量；否则视为历史修订，需要全量重算"""
+        if self.n_bars == 0 or len(dates) < self.n_bars:
+            return False
+        i = self.n_bars - 1
+        return (dates[0] == self.first_date and closes[0] == self.first_close
+                and dates[i] == self.last_date and closes[i] == self.last_close)
+
+    def push(self, date, high, low, close):
+        diff = self.ema_fast.push(close) - self.ema_slow.push(close)
+        hist = (diff - self.dea.push(diff)) * 2
+        if hist > 0:
+            self.cum_red += hist
+        elif hist < 0:
+            self.cum_green -= hist
+        if self.n_bars == 0:
+            self.first_date, self.first_close = date, close
+        bar = self.n_bars
+        self.n_bars += 1
+        self.last_date, self.last_close = date, close
+        if not (high == high and low == low):
+            return
+        info_h = (high, bar, date, diff, self.cum_red, self.cum_green)
+        info_l = (low, bar, date, diff, self.cum_red, self.cum_green)
+
+        m = self.merged
+        if m and ((high <= m[-1][0][0] and low >= m[-1][1][0]) or (high >= m[-1][0][0] and low <= m[-1][1][0])):
+            # 包含关系：向上取高高、向下取低低
+            up = len(m) < 2 or m[-1][0][0] > m[-2][0][0]
+            last = m[-1]
+            if up:
+                last[0] = max(last[0], info_h, key=lambda x: x[0])
+                last[1] = max(last[1], info_l, key=lambda x: x[0])
+            else:
+                last[0] = min(last[0], info_h, key=lambda x: x[0])
+                last[1] = min(last[1], info_l, key=lambda x: x[0])
+            return
+
+        m.append([info_h, info_l, self.n_merged])
+        self.n_merged += 1
+        if len(m) > 3:
+            del m[0]
+        if len(m) == 3:
+            left, mid, right = m
+            if mid[0][0] > left[0][0] and mid[0][0] > right[0][0]:
+                self._on_fractal(Point('top', *mid[0][:3], mid[2], *mid[0][3:]))
+            elif mid[1][0] < left[1][0] and mid[1][0] < right[1][0]:
+                self._on_fractal(Point('bottom', *mid[1][:3], mid[2], *mid[1][3:]))
+
+    def _on_fractal(self, p):
+        pts = self.points
+        if not pts:
+            pts.append(p)
+            return
+        last = pts[-1]
+        if p.kind == last.kind:
+            if p.beyond(last):
+                pts[-1] = p
+            return
+        if p.k - last.k >= STROKE_MIN_GAP and (p.price > last.price if p.kind == 'top' else p.price < last.price):
+            pts.append(p)
+            self._on_point_confirmed(len(pts) - 2)
+
+    def _on_point_confirmed(self, i):
+        """points[i] 不会再变化：推进线段与中枢"""
+        pts = self.points
+        p = pts[i]
+
+        # 线段：同类更极端则延伸；反向端点距末端至少 3 笔且比末端之后的反向端点更极端 (特征序列的分型) 则成段
+        seg = self.seg_points
+        if not seg:
+            seg.append(i)
+        elif p.kind == pts[seg[-1]].kind:
+            if p.beyond(pts[seg[-1]]):
+                seg[-1] = i
+                self.seg_counter = None
+        elif self.seg_counter is None or p.beyond(self.seg_counter):
+            if i - seg[-1] >= SEGMENT_MIN_STROKES:
+                seg.append(i)
+                self.seg_counter = None
+            else:
+                self.seg_counter = p
+
+        # 中枢：连续 3 笔的重叠区间 [ZD, ZG]，后续笔与之重叠则延伸，离开则结束
+        if i == 0:
+            return
+        a, b = pts[i - 1], pts[i]
+        stroke = (min(a.price, b.price), max(a.price, b.price), i - 1, i)
+        zv = self.pivot
+        if zv is not None:
+            if stroke[0] <= zv['zg'] and stroke[1] >= zv['zd']:
+                zv['end'] = i
+                zv['gg'], zv['dd'] = max(zv['gg'], stroke[1]), min(zv['dd'], stroke[0])
+            else:
+                self.pivots.append(zv)
+                self.pivot = None
+            return
+        win = self.pivot_window
+        win.append(stroke)
+        if len(win) > 3:
+            del win[0]
+        if len(win) == 3:
+            zg, zd = min(s[1] for s in win), max(s[0] for s in win)
+            if zg > zd:
+                self.pivot = {'zg': zg, 'zd': zd, 'gg': max(s[1] for s in win), 'dd': min(s[0] for s in win),
+                              'start': win[0][2], 'end': i}
+                self.pivot_window = []
+
+    # ---------- 查询 ----------
+    def swing_points(self, confirmed=False):
+        """笔端点 (摆动高低点)，DataFrame[date, bar, kind, price, dif, ago]"""
+        pts = self.points[:-1] if confirmed else self.points
+        out = pd.DataFrame([p.as_dict() for p in pts], columns=['date', 'bar', 'kind', 'price', 'dif'])
+        out['ago'] = self.n_bars - 1 - out['bar']
+        return out
+
+    def last_swing(self, kind, within=None, confirmed=False):
+        """最近一个顶 ('top') / 底 ('bottom') 端点；within 限定距今K线数"""
+        pts = self.points[:-1] if confirmed else self.points
+        for p in reversed(pts):
+            if within is not None and self.n_bars - 1 - p.bar > within:
+                return None
+            if p.kind == kind:
+                return p
+        return None
+
+    def strokes(self):
+        """笔列表，最后一笔的终点可能仍在延伸"""
+        pts = self.points
+        return pd.DataFrame([{'start_date': a.date, 'end_date': b.date, 'start_bar': a.bar, 'end_bar': b.bar,
+                              'direction': 'up' if b.kind == 'top' else 'down', 'start': a.price, 'end': b.price}
+                             for a, b in zip(pts[:-1], pts[1:])])
+
+    def segments(self):
+        """线段列表 (端点取自笔端点)，最后一段的终点可能仍在延伸"""
+        pts = [self.points[i] for i in self.seg_points]
+        return pd.DataFrame([{'start_date': a.date, 'end_date': b.date, 'start_bar': a.bar, 'end_bar': b.bar,
+                              'direction': 'up' if b.kind == 'top' else 'down', 'start': a.price, 'end': b.price}
+                             for a, b in zip(pts[:-1], pts[1:])])
+
+    def pivot_zones(self):
+        """笔中枢列表：ZG/ZD 为中枢上下沿，GG/DD 为中枢内最高/最低，起止为笔端点日期"""
+        zones = self.pivots + ([self.pivot] if self.pivot else [])
+        return pd.DataFrame([{'start_date': self.points[z['start']].date, 'end_date': self.points[z['end']].date,
+                              'zg': z['zg'], 'zd': z['zd'], 'gg': z['gg'], 'dd': z['dd'],
+                              'active': z is self.pivot} for z in zones])
+
+    def divergence(self, kind='bottom', measure='dif', confirmed=False):
+        """
+        最近两个同类端点的背驰：
+        - measure='dif'  : 底背驰为价格创新低但 DIF 不创新低 (顶背驰相反)；
+        - measure='area' : 价格创新低/新高，但到达该端点的这一笔的同向 MACD 柱面积 (下跌笔为绿柱、上涨笔为红柱，
+                           反向柱不抵消) 小于上一同向笔。
+        返回 (是否背驰, 前一端点, 最近端点)。
+        """
+        pts = self.points[:-1] if confirmed else self.points
+        idx = [i for i in range(len(pts) - 1, 0, -1) if pts[i].kind == kind][:2]
+        if len(idx) < 2:
+            return False, None, None
+        i2, i1 = idx
+        p1, p2 = pts[i1], pts[i2]
+        if not p2.beyond(p1):
+            return False, p1, p2
+        if measure == 'dif':
+            weaker = p2.dif > p1.dif if kind == 'bottom' else p2.dif < p1.dif
+        else:
+            cum = (lambda p: p.cum_green) if kind == 'bottom' else (lambda p: p.cum_red)
+            area1 = cum(p1) - cum(pts[i1 - 1])
+            area2 = cum(p2) - cum(pts[i2 - 1])
+            weaker = area2 < area1
+        return bool(weaker), p1, p2
+
+
+def _columns(df):
+    def col(name):
+        if name in df.columns:
+            return df[name]
+        return df[ta.COL_ALIAS[name]]
+    return col('date').astype(str).tolist(), [col(k).astype(float).tolist() for k in ('high', 'low', 'close')]
+
+
+def advance(state, df):
+    """
+    把 state 推进到 df 的最后一根K线并返回 (state, 是否全量重算)。
+    只有新追加的K线被处理；若已处理的历史被改写则从头重建。
+    """
+    dates, (high, low, close) = _columns(df)
+    rebuilt = state is None or getattr(state, 'version', 1) != ChanState.VERSION or not state.matches(dates, close)
+    if rebuilt:
+        state = ChanState()
+    for i in range(state.n_bars, len(dates)):
+        state.push(dates[i], high[i], low[i], close[i])
+    return state, rebuilt
+
+
+class ChanStore:
+    """全市场缠论结构状态库，整体持久化为一个 pickle 文件"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.states = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    self.states = pickle.load(f)
+            except Exception as e:
+                print(f"读取缠论状态失败，将全量重建: {e}")
+
+    def get(self, symbol):
+        return self.states.get(symbol)
+
+    def update(self, symbol, df):
+        state, rebuilt = advance(self.states.get(symbol), df)
+        self.states[symbol] = state
+        return state, rebuilt
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.states, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+_STORE = None
+
+def symbol_chan(df, code):
+    """
+    战法脚本使用的入口：状态库已推进到传入K线的最后日期时直接返回，
+    否则 (未建立或落后) 用传入的K线现场推演一遍 (只用传入的这段历史)。
+    """
+    global _STORE
+    if _STORE is None:
+        _STORE = ChanStore()
+    state = _STORE.get(code)
+    date_col = '日期' if '日期' in df.columns else 'date'
+    if state is not None and state.last_date == str(df[date_col].iloc[-1]):
+        return state
+    return advance(None, df)[0]
+
+
+def main():
+    store = ChanStore()
+    files = glob.glob(os.path.join(DATA_DIR, '*.csv'))
+    t0 = time.perf_counter()
+    rebuilt_count, divergent = 0, []
+    for f in files:
+        code = os.path.basename(f).split('.')[0]
+        if not code.isdigit(): continue
+        try:
+            df = pd.read_csv(f)
+            if df.empty: continue
+            state, rebuilt = store.update(code, df)
+            rebuilt_count += rebuilt
+            hit, _, p2 = state.divergence('bottom')
+            if hit and state.n_bars - 1 - p2.bar <= 3:
+                divergent.append(code)
+        except Exception as e:
+            print(f"更新 {code} 缠论状态失败: {e}")
+    store.save()
+    print(f"缠论结构更新完成：{len(store.states)} 只，其中全量重建 {rebuilt_count} 只，耗时 {time.perf_counter() - t0:.1f}s")
+    print(f"近 3 根K线内出现笔底背驰 (DIF) 的股票 {len(divergent)} 只: {' '.join(sorted(divergent)[:30])}")
+
+
+if __name__ == "__main__":
+    # 以模块身份运行，保证 pickle 里的类路径是 chan_engine.* 而非 __main__.*
+    import chan_engine
+    chan_engine.main()
@@ -0,0 +1,239 @@
+import os
+import pickle
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+STATE_FILE = 'cache/chip_distribution.pkl'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/chip_distribution'
+WINDOW = 500                 # 计入筹码的K线数 (换手 1%/日时 500 根前的筹码只剩约 0.7%)
+DECAY = 1.0                  # 换手衰减系数：每根K线旧筹码按 换手率 × DECAY 移出
+CATCHUP = 60                 # 一次增量最多追补的K线数，落后更多则重算
+REBUILD_EVERY = 250          # 增量累计推进这么多根后重算一次，清掉加减带来的浮点误差
+P_MIN, P_MAX = 0.5, 5000.0   # 价格桶覆盖范围 (元)，超出的价格归入两端的桶
+STEP = 0.01                  # 价格桶宽度 (对数价格，约 1%)
+
+K = int(np.ceil(np.log(P_MAX / P_MIN) / STEP))
+MID = P_MIN * np.exp((np.arange(K) + 0.5) * STEP)     # 各价格桶的中值价
+
+# 筹码模型：每根K线先把已有筹码按换手率整体衰减，再把当日换手的筹码均匀摊到当日 [最低价, 最高价] 覆盖的价格桶。
+# 第 s 根K线留到最新一根的筹码 = 换手_s × Π(1 - 换手_u)，u 取 s 之后的各根；分布只计最近 WINDOW 根，按总量归一。
+
+
+def bucket(price):
+    """价格 -> 价格桶下标 (超出范围的夹到两端)"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        b = np.floor(np.log(np.asarray(price, dtype=float) / P_MIN) / STEP)
+    return np.clip(np.nan_to_num(b), 0, K - 1).astype(np.int64)
+
+
+def _rates(high, low, turnover):
+    """每根K线的换手比例 (0~1)，以及当日价格区间对应的 (起, 止) 价格桶；价格或换手缺失/非正的K线换手记为 0"""
+    high, low, turnover = (np.asarray(x, dtype=float) for x in (high, low, turnover))
+    with np.errstate(invalid='ignore'):
+        ok = (low > 0) & (high >= low) & (turnover > 0)
+    rate = np.where(ok, np.clip(np.where(ok, turnover, 0.0) * DECAY / 100, 0.0, 1.0), 0.0)
+    return rate, bucket(np.where(ok, low, P_MIN)), bucket(np.where(ok, high, P_MIN))
+
+
+def _survival(rate):
+    """各根K线之后 (不含自身) 直到最后一根的留存比例 Π(1 - 换手)，形状同 rate"""
+    keep = np.cumprod((1 - rate)[::-1], axis=0)[::-1]
+    return np.vstack([keep[1:], np.ones((1,) + rate.shape[1:])])
+
+
+def _scatter(weight, lo, hi):
+    """(T, N) 的筹码量按各自价格区间均匀摊到价格桶，返回 (N, K)；差分数组 + 前缀和，只处理非零项"""
+    r, c = np.nonzero(weight)
+    w = weight[r, c] / (hi[r, c] - lo[r, c] + 1)
+    n = weight.shape[1]
+    diff = np.bincount(c * (K + 1) + lo[r, c], weights=w, minlength=n * (K + 1))
+    diff -= np.bincount(c * (K + 1) + hi[r, c] + 1, weights=w, minlength=n * (K + 1))
+    return np.cumsum(diff.reshape(n, K + 1), axis=1)[:, :K]
+
+
+def distribution(high, low, turnover, window=WINDOW):
+    """由 (T, N) 的K线直接计算最新一根的筹码分布 (N, K) (未归一)"""
+    rate, lo, hi = _rates(high, low, turnover)
+    weight = rate * _survival(rate)
+    weight[:-window] = 0
+    return _scatter(weight, lo, hi)
+
+
+def features(dist, close):
+    """
+    筹码分布 (N, K) 与最新收盘价给出：
+    winner   获利比例，成本低于收盘价的筹码占比 (所在价格桶内按对数价格线性插值)；
+    avg_cost 平均成本；cost5/15/50/85/95 成本分位价；
+    conc70/conc90 筹码集中度 = (高分位 - 低分位) / (高分位 + 低分位)，越小越集中。
+    """
+    dist = np.atleast_2d(np.asarray(dist, dtype=float))
+    close = np.atleast_1d(np.asarray(close, dtype=float))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mass = dist.sum(axis=1)
+        share = dist / mass[:, None]
+        cdf = np.cumsum(share, axis=1)
+        below = np.hstack([np.zeros((len(dist), 1)), cdf])          # below[:, b] = 桶 b 之前的累计占比
+        rows = np.arange(len(dist))
+        pos = np.log(close / P_MIN) / STEP
+        b = np.clip(np.floor(np.nan_to_num(pos)), 0, K - 1).astype(np.int64)
+        winner = np.clip(below[rows, b] + share[rows, b] * np.clip(pos - b, 0, 1), 0, 1)
+        out = {'winner': np.where(np.isnan(close) | ~(mass > 0), np.nan, winner),
+               'avg_cost': (dist * MID).sum(axis=1) / mass}
+        for q in (5, 15, 50, 85, 95):
+            b = np.minimum((cdf < q / 100).sum(axis=1), K - 1)
+            frac = np.clip((q / 100 - below[rows, b]) / share[rows, b], 0, 1)
+            out[f'cost{q}'] = np.where(mass > 0, P_MIN * np.exp((b + frac) * STEP), np.nan)
+        out['conc70'] = (out['cost85'] - out['cost15']) / (out['cost85'] + out['cost15'])
+        out['conc90'] = (out['cost95'] - out['cost5']) / (out['cost95'] + out['cost5'])
+    return out
+
+
+class ChipStore:
+    """
+    全市场筹码分布，每只股票一行长度 K 的价格桶数组 (保存为 float32)。
+    增量推进 k 根K线时：旧分布整体乘以这 k 根的留存比例，加上新K线留到现在的筹码，
+    再减去滑出 WINDOW 的 k 根K线留到现在的筹码——三者都来自同一个右对齐面板，一次散布完成，
+    结果与按最近 WINDOW 根重算一致。K线被改写 (如除权后前复权价格整体变化) 时重算。
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.codes = []
+        self.n_bars = np.zeros(0, dtype=np.int64)
+        self.last_date = np.empty(0, dtype=object)
+        self.last_close = np.zeros(0)
+        self.stepped = np.zeros(0, dtype=np.int64)       # 上次重算以来增量推进的K线数
+        self.dist = np.zeros((0, K))
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    saved = pickle.load(f)
+                if saved.get('params') == (WINDOW, DECAY, P_MIN, P_MAX, STEP):
+                    self.__dict__.update(saved['state'])
+                    self.dist = self.dist.astype(float)
+                else:
+                    print("筹码分布参数已变化，将全量重建")
+            except Exception as e:
+                print(f"读取筹码分布失败，将全量重建: {e}")
+        self.row = {c: i for i, c in enumerate(self.codes)}
+
+    def _ensure(self, codes):
+        new = [c for c in codes if c not in self.row]
+        if not new:
+            return
+        n = len(new)
+        for c in new:
+            self.row[c] = len(self.codes)
+            self.codes.append(c)
+        self.n_bars = np.concatenate([self.n_bars, np.zeros(n, dtype=np.int64)])
+        self.last_date = np.concatenate([self.last_date, np.full(n, None, dtype=object)])
+        self.last_close = np.concatenate([self.last_close, np.full(n, np.nan)])
+        self.stepped = np.concatenate([self.stepped, np.zeros(n, dtype=np.int64)])
+        self.dist = np.vstack([self.dist, np.zeros((n, K))])
+
+    def update_panel(self, panel):
+        """用右对齐面板 (tail >= WINDOW + CATCHUP，含 high/low/close/turnover) 推进，返回 (增量推进的股票数, 重算的股票数)"""
+        self._ensure(panel.codes)
+        T = panel.shape[0]
+        rows = np.array([self.row[c] for c in panel.codes])
+        close = panel['close']
+        k = panel.length - self.n_bars[rows]
+
+        # 原来的最后一根K线必须还在原位且未被改写，否则重算
+        prev = np.clip(T - 1 - k, 0, T - 1)
+        cols = np.arange(len(rows))
+        same = ((panel.dates[prev, cols] == self.last_date[rows])
+                & (close[prev, cols] == self.last_close[rows]))
+        rebuild = ((self.n_bars[rows] == 0) | (k < 0) | (k > min(CATCHUP, T - WINDOW)) | ~same
+                   | (self.stepped[rows] + k > REBUILD_EVERY))
+        step = ~rebuild & (k > 0)
+
+        rate, lo, hi = _rates(panel['high'], panel['low'], panel['turnover'])
+        held = rate * _survival(rate)                   # 每根K线留到最新一根的筹码量
+        r = np.arange(T)[:, None]
+        kk = np.where(step, k, 0)
+        weight = np.where(rebuild, np.where(r >= T - WINDOW, held, 0.0),
+                          np.where(r >= T - kk, held, 0.0)
+                          - np.where((r >= T - WINDOW - kk) & (r < T - WINDOW), held, 0.0))
+        delta = _scatter(weight, lo, hi)
+        decay = np.prod(np.where(r >= T - kk, 1 - rate, 1.0), axis=0)
+
+        sel = np.flatnonzero(step)
+        self.dist[rows[sel]] = self.dist[rows[sel]] * decay[sel, None] + delta[sel]
+        self.stepped[rows[sel]] += k[sel]
+        sel = np.flatnonzero(rebuild)
+        self.dist[rows[sel]] = delta[sel]
+        self.stepped[rows[sel]] = 0
+
+        done = step | rebuild
+        self.n_bars[rows[done]] = panel.length[done]
+        self.last_date[rows[done]] = panel.dates[-1, done]
+        self.last_close[rows[done]] = close[-1, done]
+        return int(step.sum()), int(rebuild.sum())
+
+    def table(self):
+        """每只股票最新一根K线的筹码特征，DataFrame (索引为代码，close 为该K线收盘价)"""
+        out = {'date': self.last_date, 'close': self.last_close}
+        out.update(features(np.maximum(self.dist, 0.0), self.last_close))
+        return pd.DataFrame(out, index=pd.Index(self.codes, name='code'))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        state = {k: getattr(self, k) for k in ('codes', 'n_bars', 'last_date', 'last_close', 'stepped')}
+        state['dist'] = self.dist.astype(np.float32)
+        with open(tmp, 'wb') as f:
+            pickle.dump({'params': (WINDOW, DECAY, P_MIN, P_MAX, STEP), 'state': state}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+_TABLE = None
+
+def symbol_chips(df, code):
+    """
+    战法脚本使用的入口：该股最新一根K线的筹码特征 (Series：winner 获利比例、avg_cost、conc90 等)。
+    状态库已更新到传入K线的最后日期时直接查表，否则用传入K线的最近 WINDOW 根现场计算。
+    """
+    global _TABLE
+    if _TABLE is None:
+        _TABLE = ChipStore().table()
+    df = pe.normalize_columns(df)
+    last = str(df['date'].iloc[-1])
+    if code in _TABLE.index and _TABLE.at[code, 'date'] == last:
+        return _TABLE.loc[code]
+    tail = df.iloc[-WINDOW:]
+    cols = [pd.to_numeric(tail[c], errors='coerce').values[:, None] for c in ('high', 'low', 'turnover', 'close')]
+    feats = features(distribution(*cols[:3]), cols[3][-1])
+    return pd.Series({'date': last, 'close': cols[3][-1, 0], **{k: v[0] for k, v in feats.items()}}, name=code)
+
+
+def main():
+    store = ChipStore()
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['high', 'low', 'close', 'turnover'], tail=WINDOW + CATCHUP, align='bar')
+    t1 = time.perf_counter()
+    stepped, rebuilt = store.update_panel(panel)
+    store.save()
+    print(f"筹码分布更新完成：{len(panel.codes)} 只，增量 {stepped} 只，重算 {rebuilt} 只，"
+          f"装载 {t1 - t0:.1f}s，计算 {time.perf_counter() - t1:.2f}s")
+
+    table = store.table().reset_index()
+    names_df = sr.load_names(NAMES_FILE)
+    table.insert(1, 'name', table['code'].map(dict(zip(names_df['code'], names_df['name']))))
+    table = table.sort_values('conc90')
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"chip_distribution_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    table.round(4).to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"筹码特征表已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
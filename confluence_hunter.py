@@ -2,6 +2,7 @@ import pandas as pd
 import os
 import glob
 from datetime import datetime
+import correlation_clusters as cc
 
 # --- 配置区 ---
 RESULTS_DIR = 'results'
@@ -75,9 +76,13 @@ def run_confluence_hunter():
     
     # 按共振强度从高到低排序
     summary = summary.sort_values(by='count', ascending=False)
+
+    # 标注相关簇 (correlation_clusters.py 维护)，同簇股票走势联动，本质上是同一笔押注；无聚类数据时为 -1
+    clusters = cc.load_clusters()
+    summary['cluster'] = summary['code'].map(clusters).fillna(-1).astype(int)
     
     # 重命名列名以便阅读
-    summary.columns = ['股票代码', '股票名称', '命中战法汇总', '最新价', '共振强度']
+    summary.columns = ['股票代码', '股票名称', '命中战法汇总', '最新价', '共振强度', '相关簇']
 
     # 5. 保存汇总结果
     if not os.path.exists(REPORT_DIR):
@@ -101,6 +106,11 @@ def run_confluence_hunter():
             f.write(strong_signals.to_markdown(index=False))
         else:
             f.write("今日暂无双重及以上共振的标的。\n")
+
+        # 每个相关簇只保留共振最强的一只
+        distinct = summary[summary['股票代码'].isin(cc.dedupe(summary['股票代码'], clusters))]
+        f.write("\n\n## 🧩 同簇去重清单 (每个相关簇保留共振最强的一只)\n")
+        f.write(distinct.to_markdown(index=False))
             
         f.write("\n\n## 📋 全量入选清单 (按强度排序)\n")
         f.write(summary.to_markdown(index=False))
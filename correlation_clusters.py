@@ -0,0 +1,298 @@
+import os
+import pickle
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+STATE_FILE = 'cache/correlation.pkl'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/correlation_clusters'
+WINDOW = 120                     # 滚动相关的交易日数
+CATCHUP = 20                     # 一次增量最多追补的交易日数，落后更多则整体重算
+REBUILD_EVERY = 250              # 增量加减的浮点残差：累计推进这么多个交易日后整体重算一次
+MIN_VALID = 0.8                  # 窗口内有效收益不足该比例的股票 (次新/长期停牌) 不参与聚类
+RET_CLIP = 0.2                   # 日收益截断 (新股首日、复牌补涨等极端值不主导相关性)
+CLUSTER_CORR = 0.4               # 聚类截断：簇间平均相关系数低于该值不再合并 (average linkage)
+N_NEIGHBORS = 5                  # 输出的最相关股票数
+
+# 收益先减去当日全市场等权平均收益，相关性反映板块/题材联动而不是大盘的共同涨跌
+
+
+def _raw_returns(panel):
+    """按交易日对齐面板的日收益 (涨跌幅 / 100，截断到 ±RET_CLIP)，缺失/坏数据为 NaN"""
+    r = panel['pct_chg'] / 100
+    with np.errstate(invalid='ignore'):
+        r = np.where(r > -1, np.clip(r, -RET_CLIP, RET_CLIP), np.nan)
+    return r
+
+
+def _market_mean(raw):
+    """每个交易日的全市场等权平均收益 (无有效收益的日期为 0)"""
+    valid = ~np.isnan(raw)
+    n = valid.sum(axis=1)
+    return np.where(n > 0, np.nansum(raw, axis=1) / np.maximum(n, 1), 0.0)
+
+
+def _centered(raw, mean):
+    """减去当日均值，缺失位置填 0 (不贡献协方差)"""
+    return np.where(np.isnan(raw), 0.0, raw - mean[:, None])
+
+
+class CorrelationStore:
+    """
+    全市场滚动相关性。保存最近 WINDOW 个交易日的原始收益窗口、每日市场均值，
+    以及去均值收益的累计量 S = Σx (每只股票) 与 P = XᵀX (股票 × 股票)。
+    每推进 k 个交易日只做 P += X_newᵀX_new - X_oldᵀX_old (k 行的矩阵乘法)，不重算整个窗口；
+    新上市股票只补算它与已有股票的那几列，窗口内历史被改写或累计推进 REBUILD_EVERY 天后整体重算。
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.codes = []
+        self.dates = []
+        self.raw = np.zeros((0, 0))
+        self.mean = np.zeros(0)
+        self.S = np.zeros(0)
+        self.P = np.zeros((0, 0))
+        self.steps = 0
+        self.labels = None
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    saved = pickle.load(f)
+                if saved.get('params') == (WINDOW, RET_CLIP):
+                    self.__dict__.update(saved['state'])
+                else:
+                    print("相关性参数已变化，将全量重建")
+            except Exception as e:
+                print(f"读取相关性状态失败，将全量重建: {e}")
+
+    def update_panel(self, panel):
+        """用按交易日对齐的面板 (各股 tail >= WINDOW + CATCHUP + 1) 推进，返回 ('增量'/'重算', 新增交易日数, 新增股票数)"""
+        dates = list(panel.dates)
+        raw = _raw_returns(panel)
+        col = {c: j for j, c in enumerate(panel.codes)}
+        pos = {d: i for i, d in enumerate(dates)}
+
+        # 能否增量：窗口日期仍都在面板里、落后不超过 CATCHUP 天、未到定期重算
+        k = len(dates) - 1 - pos[self.dates[-1]] if self.dates and self.dates[-1] in pos else -1
+        ok = (len(self.dates) == WINDOW and all(d in pos for d in self.dates)
+              and 0 <= k <= CATCHUP and self.steps + k <= REBUILD_EVERY)
+        if ok:
+            # 退市/移出股票池的删掉；已有股票窗口内的收益必须与面板一致，否则视为历史被改写
+            keep = np.array([c in col for c in self.codes], dtype=bool)
+            if not keep.all():
+                self._drop(np.flatnonzero(~keep))
+            rows = [pos[d] for d in self.dates]
+            cols = [col[c] for c in self.codes]
+            ok = np.array_equal(raw[np.ix_(rows, cols)], self.raw, equal_nan=True)
+        if not ok:
+            self._rebuild(dates, raw, panel.codes)
+            return '重算', len(self.dates), len(self.codes)
+
+        known = set(self.codes)
+        new_codes = [c for c in panel.codes if c not in known]
+        if new_codes:
+            self._add(raw[np.ix_(rows, [col[c] for c in new_codes])], new_codes)
+        if k:
+            self._step(dates[-k:], raw[-k:][:, [col[c] for c in self.codes]])
+        return '增量', k, len(new_codes)
+
+    def _rebuild(self, dates, raw, codes):
+        self.codes = list(codes)
+        self.dates = dates[-WINDOW:]
+        self.raw = raw[-WINDOW:]
+        self.mean = _market_mean(self.raw)
+        x = _centered(self.raw, self.mean)
+        self.S = x.sum(axis=0)
+        self.P = x.T @ x
+        self.steps = 0
+        self.labels = None
+
+    def _drop(self, idx):
+        gone = set(idx)
+        self.codes = [c for i, c in enumerate(self.codes) if i not in gone]
+        self.raw = np.delete(self.raw, idx, axis=1)
+        self.S = np.delete(self.S, idx)
+        self.P = np.delete(np.delete(self.P, idx, axis=0), idx, axis=1)
+        self.labels = None
+
+    def _add(self, raw_new, codes):
+        """新股票在当前窗口内的收益 (按已存的每日均值去均值)，只计算新增的行列"""
+        x_old = _centered(self.raw, self.mean)
+        x_new = _centered(raw_new, self.mean)
+        cross = x_old.T @ x_new
+        self.P = np.block([[self.P, cross], [cross.T, x_new.T @ x_new]])
+        self.S = np.concatenate([self.S, x_new.sum(axis=0)])
+        self.raw = np.hstack([self.raw, raw_new])
+        self.codes += list(codes)
+        self.labels = None
+
+    def _step(self, dates, raw_new):
+        """窗口向前推进 len(dates) 天：加入新日期、移出最早的同样天数"""
+        k = len(dates)
+        mean_new = _market_mean(raw_new)
+        x_new = _centered(raw_new, mean_new)
+        x_old = _centered(self.raw[:k], self.mean[:k])
+        self.P += np.vstack([x_new, x_old]).T @ np.vstack([x_new, -x_old])
+        self.S += x_new.sum(axis=0) - x_old.sum(axis=0)
+        self.raw = np.vstack([self.raw[k:], raw_new])
+        self.mean = np.concatenate([self.mean[k:], mean_new])
+        self.dates = self.dates[k:] + list(dates)
+        self.steps += k
+        self.labels = None
+
+    # ---------- 查询 ----------
+    def eligible(self):
+        """窗口内有效收益足够多、可参与比较的股票"""
+        return (~np.isnan(self.raw)).sum(axis=0) >= MIN_VALID * len(self.dates)
+
+    def corr(self):
+        """去市场均值后的 (股票 × 股票) 相关系数矩阵；不满足 eligible 的股票整行为 NaN"""
+        n = len(self.dates)
+        cov = n * self.P - np.outer(self.S, self.S)
+        var = np.diag(cov).copy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scale = np.where(self.eligible() & (var > 0), 1 / np.sqrt(var), np.nan)
+        return np.clip(cov * scale[:, None] * scale[None, :], -1, 1)
+
+    def clusters(self, min_corr=CLUSTER_CORR):
+        """层次聚类标签 Series(代码 -> 簇号)，簇号按簇大小从大到小编号，不参与聚类的股票为 -1"""
+        if self.labels is not None and self.labels[0] == min_corr:
+            return self.labels[1]
+        c = self.corr()
+        idx = np.flatnonzero(~np.isnan(np.diag(c)))
+        labels = np.full(len(self.codes), -1)
+        if len(idx):
+            raw = _average_linkage(1 - c[np.ix_(idx, idx)], 1 - min_corr)
+            _, first, inv, size = np.unique(raw, return_index=True, return_inverse=True, return_counts=True)
+            rank = np.empty(len(size), dtype=int)
+            rank[np.lexsort((first, -size))] = np.arange(len(size))      # 同样大小按最小成员排，与合并顺序无关
+            labels[idx] = rank[inv]
+        out = pd.Series(labels, index=pd.Index(self.codes, name='code'), name='cluster')
+        self.labels = (min_corr, out)
+        return out
+
+    def neighbors(self, code, k=N_NEIGHBORS, corr=None):
+        """与 code 相关性最高的 k 只股票，DataFrame[code, corr]"""
+        c = self.corr() if corr is None else corr
+        row = c[self.codes.index(code)].copy()
+        row[self.codes.index(code)] = np.nan
+        row = np.where(np.isnan(row), -np.inf, row)
+        k = min(k, int(np.isfinite(row).sum()))
+        if k <= 0:
+            return pd.DataFrame(columns=['code', 'corr'])
+        top = np.argpartition(-row, k - 1)[:k]
+        top = top[np.argsort(-row[top], kind='stable')]
+        return pd.DataFrame({'code': [self.codes[j] for j in top], 'corr': row[top]})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        state = {k: getattr(self, k) for k in ('codes', 'dates', 'raw', 'mean', 'S', 'P', 'steps', 'labels')}
+        with open(tmp, 'wb') as f:
+            pickle.dump({'params': (WINDOW, RET_CLIP), 'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def _average_linkage(dist, max_dist):
+    """
+    平均距离 (UPGMA) 凝聚聚类，合并到最小簇间距离超过 max_dist 为止，返回每个点所属簇的代表下标。
+    每行缓存最近邻：合并后只有最近邻是被合并两簇的行需要重新扫描，其余行与新簇比较一次即可，
+    整体约 O(N²)，不需要每步在整张距离矩阵上找最小值。
+    """
+    n = len(dist)
+    d = np.array(dist, dtype=float)
+    np.fill_diagonal(d, np.inf)
+    size = np.ones(n)
+    active = np.ones(n, dtype=bool)
+    label = np.arange(n)
+    nn = d.argmin(axis=1)
+    nn_d = d[np.arange(n), nn]
+    while True:
+        i = int(np.argmin(nn_d))
+        if not nn_d[i] <= max_dist:
+            break
+        j = int(nn[i])
+        merged = (size[i] * d[i] + size[j] * d[j]) / (size[i] + size[j])
+        merged[[i, j]] = np.inf
+        d[i], d[:, i] = merged, merged
+        d[j], d[:, j] = np.inf, np.inf
+        size[i] += size[j]
+        active[j] = False
+        nn_d[j] = np.inf
+        label[label == j] = i
+        stale = active & ((nn == i) | (nn == j))
+        stale[i] = True
+        rows = np.flatnonzero(stale)
+        nn[rows] = d[rows].argmin(axis=1)
+        nn_d[rows] = d[rows, nn[rows]]
+        better = active & ~stale & (merged < nn_d)
+        nn[better] = i
+        nn_d[better] = merged[better]
+    return label
+
+
+def load_clusters(path=STATE_FILE):
+    """读取已保存的聚类标签 dict(代码 -> 簇号)；状态不存在时返回空 dict (调用方不做去重)"""
+    if not os.path.exists(path):
+        return {}
+    store = CorrelationStore(path)
+    if not store.codes:
+        return {}
+    return store.clusters().to_dict()
+
+
+def dedupe(codes, clusters, per_cluster=1):
+    """
+    候选列表按相关簇去重：保持原有顺序 (调用方先按强度排好)，每个簇最多保留 per_cluster 只；
+    不在聚类里的股票 (次新股、状态缺失) 原样保留。
+    """
+    seen = {}
+    out = []
+    for c in codes:
+        label = clusters.get(c, -1)
+        if label >= 0:
+            if seen.get(label, 0) >= per_cluster:
+                continue
+            seen[label] = seen.get(label, 0) + 1
+        out.append(c)
+    return out
+
+
+def main():
+    store = CorrelationStore()
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['close', 'pct_chg'], tail=WINDOW + CATCHUP + 1, align='date')
+    mode, n_dates, n_codes = store.update_panel(panel)
+    t1 = time.perf_counter()
+    labels = store.clusters()
+    corr = store.corr()
+    store.save()
+    sizes = labels[labels >= 0].value_counts()
+    print(f"相关性{mode}完成：{len(store.codes)} 只，窗口 {store.dates[0]} ~ {store.dates[-1]}，"
+          f"新增 {n_dates} 个交易日 / {n_codes} 只股票，耗时 {t1 - t0:.1f}s；"
+          f"聚类 {len(sizes)} 个簇 (最大 {sizes.max() if len(sizes) else 0} 只)，耗时 {time.perf_counter() - t1:.1f}s")
+
+    names_df = sr.load_names(NAMES_FILE)
+    names = dict(zip(names_df['code'], names_df['name']))
+    rows = []
+    for code, label in labels.items():
+        nb = store.neighbors(code, corr=corr) if label >= 0 else pd.DataFrame(columns=['code', 'corr'])
+        rows.append({'code': code, 'name': names.get(code), 'cluster': label,
+                     'cluster_size': int(sizes.get(label, 0)),
+                     'neighbors': ' '.join(f"{c}:{v:.2f}" for c, v in zip(nb['code'], nb['corr']))})
+    out = pd.DataFrame(rows).sort_values(['cluster_size', 'cluster'], ascending=[False, True])
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"clusters_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    out.to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"聚类结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import os
+import time
+import warnings
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import indicators as ta
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/cross_section'
+PANEL_TAIL = 30              # 当日横截面只需要最近几根K线 (5日均量)
+TOP_PCT = 0.05               # 当日相对成交量前 5% 标记为异动
+
+# =====================================================================
+# 横截面内核：输入 (T, N) 面板，每一行 (同一交易日) 在全部股票之间比较。
+# 缺失值 (停牌/未上市) 不参与排名与统计，结果为 NaN；mask 可额外剔除股票 (如非当日K线)。
+# =====================================================================
+
+
+def _rows(x, mask=None):
+    x = np.asarray(x, dtype=float)
+    if x.ndim != 2:
+        raise ValueError("横截面计算需要 (T, N) 面板 (行是日期，列是股票)")
+    if mask is not None:
+        x = np.where(mask, x, np.nan)
+    return x
+
+
+def rank(x, mask=None):
+    """
+    每行的名次 (1 = 最小，并列取平均名次，同 pandas rank(axis=1))。
+    整张面板一次排序：排好序的行内用前向/后向累积找出每个并列段的首尾位置，再散回原位置。
+    """
+    x = _rows(x, mask)
+    order = np.argsort(x, axis=1, kind='stable')             # NaN 排在最后
+    s = np.take_along_axis(x, order, axis=1)
+    idx = np.broadcast_to(np.arange(x.shape[1]), x.shape)
+    new_group = np.ones(x.shape, dtype=bool)
+    new_group[:, 1:] = s[:, 1:] != s[:, :-1]
+    first = np.maximum.accumulate(np.where(new_group, idx, 0), axis=1)
+    group_end = np.ones(x.shape, dtype=bool)
+    group_end[:, :-1] = new_group[:, 1:]
+    last = np.minimum.accumulate(np.where(group_end, idx, x.shape[1])[:, ::-1], axis=1)[:, ::-1]
+    avg = (first + last) / 2 + 1
+    out = np.empty_like(x)
+    np.put_along_axis(out, order, np.where(np.isnan(s), np.nan, avg), axis=1)
+    return out
+
+
+def percentile(x, mask=None):
+    """每行的百分位 (0~1]，名次 / 当日有效股票数，同 pandas rank(axis=1, pct=True)"""
+    x = _rows(x, mask)
+    count = (~np.isnan(x)).sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return rank(x) / count
+
+
+def zscore(x, mask=None):
+    """每行标准化 (x - 当日均值) / 当日标准差 (ddof=1)"""
+    x = _rows(x, mask)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)          # 整行缺失的日期
+        mean = np.nanmean(x, axis=1, keepdims=True)
+        std = np.nanstd(x, axis=1, ddof=1, keepdims=True)
+        return (x - mean) / std
+
+
+def top_k(x, k, largest=True, mask=None):
+    """
+    每行取值最大 (或最小) 的 k 只股票，返回同形布尔矩阵。
+    用 argpartition 只做选择不做整行排序 (每行 O(N))；边界并列时任取其一，有效股票不足 k 只则全部入选。
+    """
+    x = _rows(x, mask)
+    valid = ~np.isnan(x)
+    k = min(int(k), x.shape[1])
+    out = np.zeros(x.shape, dtype=bool)
+    if k <= 0:
+        return out
+    key = np.where(valid, -x if largest else x, np.inf)
+    picked = np.argpartition(key, k - 1, axis=1)[:, :k]
+    np.put_along_axis(out, picked, True, axis=1)
+    return out & valid
+
+
+def top_codes(values, codes, k, largest=True):
+    """一行 (一个交易日) 的前 k 只股票代码，按取值排好序；只对选出的 k 只排序"""
+    values = np.asarray(values, dtype=float)
+    picked = np.flatnonzero(top_k(values[None, :], k, largest)[0])
+    picked = picked[np.argsort(-values[picked] if largest else values[picked], kind='stable')]
+    return [codes[j] for j in picked]
+
+
+def latest_mask(panel):
+    """
+    右对齐面板最后一行里，最新K线落在全市场最新交易日的股票 (剔除停牌股的旧K线)；
+    最新交易日取多数股票的最后日期，个别提前更新或数据异常的股票不会把其余股票都剔除。
+    """
+    last = pd.Series(panel.dates[-1])
+    return (last == last.mode().iloc[0]).values[None, :]
+
+
+def main():
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['close', 'volume', 'turnover', 'pct_chg', 'amount'],
+                          tail=PANEL_TAIL, align='bar')
+    mask = latest_mask(panel)
+    last = slice(-1, None)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vol_ratio = (panel['volume'] / ta.shift(ta.rolling_mean(panel['volume'], 5)))[last]
+    table = pd.DataFrame({
+        'code': panel.codes,
+        'date': panel.dates[-1],
+        'close': panel['close'][-1],
+        'pct_chg': panel['pct_chg'][-1],
+        'vol_ratio': vol_ratio[0],
+        'vol_ratio_pct': percentile(vol_ratio, mask)[0],
+        'turnover': panel['turnover'][-1],
+        'turnover_pct': percentile(panel['turnover'][last], mask)[0],
+        'amount_z': zscore(panel['amount'][last], mask)[0],
+        'pct_chg_z': zscore(panel['pct_chg'][last], mask)[0],
+    })
+    n_valid = int(mask.sum())
+    table['vol_top'] = top_k(vol_ratio, max(1, int(round(n_valid * TOP_PCT))), mask=mask)[0]
+    table = table[mask[0]].sort_values('vol_ratio_pct', ascending=False)
+
+    names_df = sr.load_names(NAMES_FILE)
+    table.insert(1, 'name', table['code'].map(dict(zip(names_df['code'], names_df['name']))))
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"cross_section_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    table.round(4).to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"横截面统计完成：{n_valid} 只当日有效股票，相对成交量前 {TOP_PCT:.0%} 共 {int(table['vol_top'].sum())} 只，"
+          f"耗时 {time.perf_counter() - t0:.1f}s -> {path}")
+
+
+if __name__ == "__main__":
+    main()
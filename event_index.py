@@ -0,0 +1,299 @@
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+import indicators as ta
+import feature_graph as fg
+import panel_engine as pe
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+INDEX_FILE = 'cache/event_index.pkl'
+CHUNK_SIZE = 300                 # 需要全历史重建时每批装载的股票数，控制内存
+CATCHUP = 60                     # 增量最多追补的新K线数，超出 (很久没更新) 时用全历史重建
+
+# 涨停幅度按代码前缀区分板块：创业板/科创板 20%，北交所 30%，其余 10%；
+# 涨幅 > 幅度 - LIMIT_TOLERANCE 视为涨停 (主板即各脚本沿用的 9.5)。ST 股 5% 涨停未单独处理。
+LIMIT_RULES = [(('30', '688', '689'), 20.0), (('8', '4', '92'), 30.0)]
+DEFAULT_LIMIT = 10.0
+LIMIT_TOLERANCE = 0.5
+VOL_SPIKE_RATIO = 2.0            # 放量：成交量 > 前一日5日均量的倍数 (high_volume_retest 口径)
+MA_FAST, MA_SLOW = 5, 10         # 均线金叉/死叉
+
+FEATURES = ['pct_chg', 'volume', 'vol_ma5', f'ma{MA_FAST}', f'ma{MA_SLOW}', 'diff', 'dea', 'kdj_k', 'kdj_d', 'close']
+
+
+def limit_pct(code):
+    """按代码前缀返回该股票的涨停幅度 (%)"""
+    for prefixes, pct in LIMIT_RULES:
+        if str(code).startswith(prefixes):
+            return pct
+    return DEFAULT_LIMIT
+
+
+def _cross(a, b):
+    """(上穿, 下穿)：金叉为今日 a > b 且昨日 a <= b，与 stock_scanner_go 的判断一致"""
+    prev_a, prev_b = ta.shift(a), ta.shift(b)
+    return (a > b) & (prev_a <= prev_b), (a < b) & (prev_a >= prev_b)
+
+
+def detect(values, limit):
+    """
+    values: FEATURES 的一维或 (T, N) 数组；limit: 涨停幅度 (标量或每列一个)。
+    返回 {事件类型: (是否发生, 事件取值)}，取值用于查询时筛选 (如零轴下的 MACD 金叉)。
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vol_ratio = values['volume'] / ta.shift(values['vol_ma5'])
+        # 均线取 6 位小数再比较：面板与单票的滑动求和顺序不同，末位误差会让恰好相等的两条均线判出假交叉
+        # (价格为两位小数，均线真实值最多 3~4 位小数，不会落在舍入边界上)
+        ma_fast, ma_slow = np.round(values[f'ma{MA_FAST}'], 6), np.round(values[f'ma{MA_SLOW}'], 6)
+        ma_up, ma_down = _cross(ma_fast, ma_slow)
+        macd_up, macd_down = _cross(values['diff'], values['dea'])
+        kdj_up, kdj_down = _cross(values['kdj_k'], values['kdj_d'])
+        return {
+            'limit_up': (values['pct_chg'] > np.asarray(limit) - LIMIT_TOLERANCE, values['pct_chg']),
+            'volume_spike': (vol_ratio > VOL_SPIKE_RATIO, vol_ratio),
+            'ma_golden': (ma_up, ma_fast),
+            'ma_dead': (ma_down, ma_fast),
+            'macd_golden': (macd_up, values['diff']),
+            'macd_dead': (macd_down, values['diff']),
+            'kdj_golden': (kdj_up, values['kdj_k']),
+            'kdj_dead': (kdj_down, values['kdj_k']),
+        }
+
+
+EVENT_TYPES = list(detect({k: np.zeros(2) for k in FEATURES}, DEFAULT_LIMIT))
+_PLAN = fg.FeaturePlan({'events': (FEATURES, None)})
+
+# 递推类特征 (EMA / KDJ 平滑) 保存每只股票最后的 EMA 状态，增量时只对新K线接着递推：名称 -> (alpha, adjust)
+EWM_SPECS = {
+    'ema_fast': (2.0 / (fg.MACD_FAST + 1), False),
+    'ema_slow': (2.0 / (fg.MACD_SLOW + 1), False),
+    'dea': (2.0 / (fg.MACD_SIGNAL + 1), False),
+    'kdj_k': (1.0 / fg.KDJ_M, True),
+    'kdj_d': (1.0 / fg.KDJ_M, True),
+}
+# 其余为短窗口特征，直接在尾部面板上算；第一根新K线之前要多装载的行数 (MA10 交叉看前一根，RSV 看 9 根)
+_WINDOW_PLAN = fg.FeaturePlan({'events': (['pct_chg', 'volume', 'vol_ma5', f'ma{MA_FAST}', f'ma{MA_SLOW}', 'close'], None)})
+WARMUP = max(MA_SLOW, fg.KDJ_N) + 1
+
+
+class SymbolEvents:
+    """
+    单只股票的事件表：每类事件按时间顺序存 (K线序号, 日期, 取值) 三个定长数组 (日期为 datetime64[D])。
+    同时记录已处理K线数、末根K线的日期和收盘价 (识别历史被改写) 与 EWM_SPECS 各项最后的 (weighted, old_wt)。
+    """
+
+    def __init__(self):
+        self.n_bars = 0
+        self.last_date = None
+        self.last_close = np.nan
+        self.ewm = {k: (np.nan, 1.0) for k in EWM_SPECS}
+        self.events = {k: (np.empty(0, dtype=np.int32), np.empty(0, dtype='datetime64[D]'), np.empty(0))
+                       for k in EVENT_TYPES}
+
+    def append(self, kind, bars, dates, vals):
+        old = self.events[kind]
+        self.events[kind] = (np.concatenate([old[0], np.asarray(bars, dtype=np.int32)]),
+                             np.concatenate([old[1], np.asarray(dates, dtype='datetime64[D]')]),
+                             np.concatenate([old[2], vals]))
+
+    def query(self, kind, ago=None, since=None, lo=None, hi=None):
+        """
+        按条件取事件，返回 DataFrame[date, bar, ago, value]，按时间先后排列：
+        ago=(a, b) 距最新K线 a~b 根 (0 为当根)；since 为起始日期 (含)；lo/hi 为取值上下界 (含)。
+        """
+        bars, dates, vals = self.events[kind]
+        ages = self.n_bars - 1 - bars
+        keep = np.ones(len(bars), dtype=bool)
+        if ago is not None:
+            keep &= (ages >= ago[0]) & (ages <= ago[1])
+        if since is not None:
+            keep &= dates >= np.datetime64(str(since)[:10], 'D')
+        if lo is not None:
+            keep &= vals >= lo
+        if hi is not None:
+            keep &= vals <= hi
+        return pd.DataFrame({'date': dates[keep].astype(str), 'bar': bars[keep], 'ago': ages[keep], 'value': vals[keep]})
+
+    def last(self, kind, ago=None, **kw):
+        """最近一次满足条件的事件 (Series)，没有则为 None"""
+        hits = self.query(kind, ago=ago, **kw)
+        return None if hits.empty else hits.iloc[-1]
+
+
+def _extract(panel, values, starts):
+    """
+    面板上检测全部事件，只保留每只股票 K线序号 >= starts[j] 的部分。
+    返回 {事件类型: [(序号, 日期, 取值) 每只股票一组]}。
+    """
+    T, N = panel.shape
+    offset = T - panel.length                        # 右对齐：第 j 列第 r 行是该股第 r - offset[j] 根K线
+    rows = np.arange(T)[:, None]
+    limit = np.array([limit_pct(c) for c in panel.codes])
+    out = {}
+    for kind, (hit, val) in detect(values, limit).items():
+        hit = hit & (rows >= (offset + starts)[None, :])
+        cols, rs = np.nonzero(hit.T)                 # 按股票、再按时间排序
+        cuts = np.searchsorted(cols, np.arange(N + 1))
+        bars, dates, vals = rs - offset[cols], panel.dates[rs, cols], val[rs, cols]
+        out[kind] = [(bars[cuts[j]:cuts[j + 1]], dates[cuts[j]:cuts[j + 1]], vals[cuts[j]:cuts[j + 1]])
+                     for j in range(N)]
+    return out
+
+
+def _values(panel, starts, states):
+    """
+    面板上 FEATURES 的取值：短窗口特征直接在面板上算；递推类从每只股票第 starts[j] 根K线起，
+    接着 states[j].ewm 保存的状态递推 (更早的行只填上一根的状态值供交叉判断，其余为 NaN)。
+    返回 (values, {名称: (weighted 数组, old_wt 数组)} 递推到最后一根的状态)。
+    """
+    T, N = panel.shape
+    values = _WINDOW_PLAN.compute(panel)
+    high, low, close = panel['high'], panel['low'], panel['close']
+    low_n = ta.rolling_min(low, fg.KDJ_N)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (close - low_n) / (ta.rolling_max(high, fg.KDJ_N) - low_n) * 100
+
+    init = {k: tuple(np.array([s.ewm[k][i] for s in states]) for i in (0, 1)) for k in EWM_SPECS}
+    out = {k: np.full((T, N), np.nan) for k in EWM_SPECS}
+    # 按第一根待处理K线所在的行分组递推；从头重建的股票之前的行都是 NaN 补齐，不改变初始状态，合成一组从第 0 行开始
+    first = np.where(starts == 0, 0, T - panel.length + starts)
+    for r in np.unique(first[starts < panel.length]):
+        cols = np.flatnonzero((first == r) & (starts < panel.length))
+
+        def run(name, x):
+            w, o = init[name][0][cols], init[name][1][cols]
+            if r > 0:
+                out[name][r - 1, cols] = w
+            out[name][r:, cols], init[name][0][cols], init[name][1][cols] = ta.ewm_resume(x, w, o, *EWM_SPECS[name])
+            return out[name][r:, cols]
+
+        diff = run('ema_fast', close[r:, cols]) - run('ema_slow', close[r:, cols])
+        run('dea', diff)
+        run('kdj_d', run('kdj_k', rsv[r:, cols]))
+    values['diff'] = out['ema_fast'] - out['ema_slow']
+    values.update({k: out[k] for k in ('dea', 'kdj_k', 'kdj_d')})
+    return values, init
+
+
+class EventIndex:
+    """全市场事件索引，整体持久化为一个 pickle 文件；查询只读索引，不再扫描K线"""
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.symbols = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    self.symbols = pickle.load(f)
+            except Exception as e:
+                print(f"读取事件索引失败，将全量重建: {e}")
+
+    def update_panel(self, panel):
+        """
+        用右对齐面板 (align='bar'，可以只装载尾部) 推进一批股票，只检测每只股票新增的K线。
+        原最后一根K线不在原位或被改写的股票从头重建；面板装不下其全部历史 (或新增K线多到超出预热范围) 的
+        不处理，返回这些代码，由调用方改用全历史面板再调用一次。返回 (重建数, 待全历史处理的代码列表)。
+        """
+        T = panel.shape[0]
+        closes = panel['close']
+        states, starts, pending, rebuilt = [], panel.length.astype(np.int64), [], 0
+        for j, code in enumerate(panel.codes):
+            n = int(panel.length[j])
+            state = self.symbols.get(code)
+            k = n - state.n_bars if state is not None else -1
+            same = (0 <= k < T and getattr(state, 'ewm', None) is not None
+                    and panel.dates[T - 1 - k, j] == state.last_date and closes[T - 1 - k, j] == state.last_close)
+            if not same:
+                state = SymbolEvents()
+            if n > T and (not same or T - k < WARMUP):
+                pending.append(code)                 # 面板里既没有全部历史，也不够预热
+                states.append(SymbolEvents())
+                continue
+            rebuilt += not same
+            starts[j] = state.n_bars
+            states.append(state)
+
+        values, ewm = _values(panel, starts, states)
+        events = _extract(panel, values, starts)
+        skip = set(pending)
+        for j, (code, state) in enumerate(zip(panel.codes, states)):
+            if code in skip:
+                continue
+            for kind in EVENT_TYPES:
+                state.append(kind, *events[kind][j])
+            state.n_bars = int(panel.length[j])
+            state.last_date, state.last_close = panel.dates[-1, j], closes[-1, j]
+            state.ewm = {k: (float(ewm[k][0][j]), float(ewm[k][1][j])) for k in EWM_SPECS}
+            self.symbols[code] = state
+        return rebuilt, pending
+
+    def get(self, code):
+        return self.symbols.get(code)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.symbols, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def scan(df, code):
+    """不依赖索引，直接对一只股票的K线 (中/英文字段名均可) 建事件表"""
+    df = pe.normalize_columns(df)
+    state = SymbolEvents()
+    values = _PLAN.compute({k: pd.to_numeric(df[k], errors='coerce').values for k in _PLAN.raw_fields})
+    dates = df['date'].astype(str).values
+    for kind, (hit, val) in detect(values, limit_pct(code)).items():
+        idx = np.flatnonzero(hit)
+        state.append(kind, idx, dates[idx], val[idx])
+    if len(df):
+        state.n_bars = len(df)
+        state.last_date, state.last_close = dates[-1], values['close'][-1]
+    return state
+
+
+_INDEX = None
+
+def symbol_events(df, code):
+    """
+    战法脚本使用的入口：索引已更新到传入K线的最后日期时直接返回索引里的事件表，
+    否则 (索引未建立或落后) 用传入的K线现场检测。
+    """
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = EventIndex()
+    state = _INDEX.get(code)
+    date_col = '日期' if '日期' in df.columns else 'date'
+    if state is not None and state.last_date == str(df[date_col].iloc[-1]):
+        return state
+    return scan(df, code)
+
+
+def main():
+    index = EventIndex()
+    t0 = time.perf_counter()
+    if index.symbols:
+        panel = pe.load_panel(DATA_DIR, fields=_PLAN.raw_fields, tail=CATCHUP + WARMUP, align='bar')
+        rebuilt, pending = index.update_panel(panel)
+    else:
+        rebuilt, pending = 0, sorted(f.split('.')[0] for f in os.listdir(DATA_DIR)
+                                     if f.endswith('.csv') and f.split('.')[0].isdigit())
+    for i in range(0, len(pending), CHUNK_SIZE):
+        full = pe.load_panel(DATA_DIR, codes=pending[i:i + CHUNK_SIZE], fields=_PLAN.raw_fields, align='bar')
+        rebuilt += index.update_panel(full)[0]
+    index.save()
+    counts = {k: sum(len(s.events[k][0]) for s in index.symbols.values()) for k in EVENT_TYPES}
+    print(f"事件索引更新完成：{len(index.symbols)} 只，其中全量重建 {rebuilt} 只 (装载全历史 {len(pending)} 只)，"
+          f"耗时 {time.perf_counter() - t0:.1f}s")
+    for k, n in counts.items():
+        print(f"  {k:<14}{n:>9} 次")
+
+
+if __name__ == "__main__":
+    # 以模块身份运行，保证 pickle 里的类路径是 event_index.* 而非 __main__.*
+    import event_index
+    event_index.main()
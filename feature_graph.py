@@ -0,0 +1,192 @@
+import re
+import numpy as np
+import indicators as ta
+import cross_section as cs
+
+# --- 配置区 ---
+RAW_FIELDS = ['open', 'close', 'high', 'low', 'volume', 'amount', 'amplitude', 'pct_chg', 'turnover']
+# 由原始列派生、可以像原始列一样加滚动算子的序列：body 为实体占开盘价的百分比
+DERIVED = {'body': (['open', 'close'], lambda o, c: np.abs(c - o) / o * 100)}
+SERIES_FIELDS = RAW_FIELDS + list(DERIVED)
+PREFIX_ALIAS = {'': 'close', 'vol': 'volume'}   # ma20 -> close 的 20 日均值，vol_ma5 -> volume 的 5 日均值
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+KDJ_N, KDJ_M = 9, 3
+
+# 参数化特征名：[列名_]算子窗口，如 ma20 / vol_ma5 / vol_std10 / high_max19 / pct_chg_max4 / ema12
+# rank 为当前值在自身窗口内的百分位 (0~1)，如 vol_rank120 <= 0.1 即成交量处于自身近120日的底部 10%
+# slope/rsq 为窗口内直线回归的斜率 (每根占窗口均值的百分比) 与 R²，如 slope20 > 0.3 & rsq20 >= 0.8 即近20日干净上行
+FEATURE_PATTERN = re.compile(r'^(?:(.+)_)?(ma|std|max|min|ema|rank|slope|rsq)(\d+)$')
+# 滑动分位数：[列名_]q百分位_窗口，如 turnover_q90_120 为近120日换手率的 90% 分位
+QUANTILE_PATTERN = re.compile(r'^(?:(.+)_)?q(\d+)_(\d+)$')
+RSI_PATTERN = re.compile(r'^rsi(\d+)$')
+# 趋势强度：adx{n} 及方向指标 pdi{n} (+DI) / mdi{n} (-DI)，由最高/最低/收盘价的 n 根滑动和计算
+ADX_PATTERN = re.compile(r'^(adx|pdi|mdi)(\d+)$')
+ADX_OUTPUT = {'adx': 0, 'pdi': 1, 'mdi': 2}
+# 横截面特征：cs_算子_特征名，同一行 (交易日) 在全部股票之间比较，只适用于 (T, N) 面板
+# 如 cs_pct_turnover 为当日换手率在全市场的百分位，cs_z_pct_chg 为涨幅的横截面 z 分数
+CS_PATTERN = re.compile(r'^cs_(rank|pct|z)_(.+)$')
+CS_OPS = {'rank': cs.rank, 'pct': cs.percentile, 'z': cs.zscore}
+ROLLING_OPS = {'ma': ta.rolling_mean, 'std': ta.rolling_std, 'max': ta.rolling_max, 'min': ta.rolling_min,
+               'rank': ta.rolling_rank, 'slope': lambda x, n: ta.rolling_linreg(x, n)[0],
+               'rsq': lambda x, n: ta.rolling_linreg(x, n)[1]}
+
+
+class Feature:
+    """
+    特征 DAG 的一个节点。
+    warmup: 为了得到最后 k 行输出，依赖需要多提供的行数 (滚动窗口为 window-1)；
+            None 表示递推类指标 (EMA)，需要依赖的全部历史。
+    """
+
+    def __init__(self, name, deps, func, warmup=0):
+        self.name = name
+        self.deps = deps
+        self.func = func
+        self.warmup = warmup
+
+    def __repr__(self):
+        return f"Feature({self.name} <- {', '.join(self.deps) or '原始列'})"
+
+
+def resolve(name):
+    """特征名 -> Feature 定义"""
+    if name in RAW_FIELDS:
+        return Feature(name, [], None)
+    if name in DERIVED:
+        return Feature(name, *DERIVED[name])
+    if name == 'diff':
+        return Feature(name, [f'ema{MACD_FAST}', f'ema{MACD_SLOW}'], lambda fast, slow: fast - slow)
+    if name == 'dea':
+        return Feature(name, ['diff'], lambda dif: ta.ewm_mean(dif, span=MACD_SIGNAL, adjust=False), None)
+    if name == 'macd':
+        return Feature(name, ['diff', 'dea'], lambda dif, dea: (dif - dea) * 2)
+    if name == 'kdj_k':
+        return Feature(name, ['high', 'low', 'close'], lambda h, l, c: ta.kdj(h, l, c, KDJ_N, KDJ_M)[0], None)
+    if name == 'kdj_d':
+        return Feature(name, ['kdj_k'], lambda k: ta.ewm_mean(k, com=KDJ_M - 1), None)
+    if name == 'kdj_j':
+        return Feature(name, ['kdj_k', 'kdj_d'], lambda k, d: 3 * k - 2 * d)
+
+    m = CS_PATTERN.match(name)
+    if m:
+        resolve(m.group(2))
+        return Feature(name, [m.group(2)], CS_OPS[m.group(1)])
+
+    m = RSI_PATTERN.match(name)
+    if m:
+        n = int(m.group(1))
+        return Feature(name, ['close'], lambda x: ta.rsi(x, n), n)
+
+    m = ADX_PATTERN.match(name)
+    if m:
+        n, out = int(m.group(2)), ADX_OUTPUT[m.group(1)]
+        # 第一根要用前一根的价格；ADX 再对 DX 取 n 根均值
+        warmup = 2 * n - 1 if out == 0 else n
+        return Feature(name, ['high', 'low', 'close'], lambda h, l, c: ta.adx(h, l, c, n)[out], warmup)
+
+    m = QUANTILE_PATTERN.match(name)
+    if m:
+        col, q, n = _series(name, m.group(1)), int(m.group(2)) / 100, int(m.group(3))
+        return Feature(name, [col], lambda x: ta.rolling_quantile(x, n, q), n - 1)
+
+    m = FEATURE_PATTERN.match(name)
+    if not m:
+        raise KeyError(f"未知特征: {name}")
+    prefix, op, n = m.group(1) or '', m.group(2), int(m.group(3))
+    col = _series(name, prefix)
+    if op == 'ema':
+        return Feature(name, [col], lambda x: ta.ewm_mean(x, span=n, adjust=False), None)
+    func = ROLLING_OPS[op]
+    return Feature(name, [col], lambda x: func(x, n), n - 1)
+
+
+def _series(name, prefix):
+    col = PREFIX_ALIAS.get(prefix or '', prefix)
+    if col not in SERIES_FIELDS:
+        raise KeyError(f"未知特征: {name} (列 {col} 不存在)")
+    return col
+
+
+def _need(a, b):
+    """合并两个行数需求，None 表示全部历史"""
+    if a is None or b is None:
+        return None
+    return max(a, b)
+
+
+def _tail(arr, rows):
+    return arr if rows is None else arr[-rows:]
+
+
+class FeaturePlan:
+    """
+    由各战法声明的 {战法: (特征列表, 回看行数)} 生成的计算计划：
+    特征按名字去重成一张 DAG，自顶向下把“最后需要多少行”传递给依赖，
+    每个特征只计算一次，且只在自己需要的尾部行上计算。
+    """
+
+    def __init__(self, requirements):
+        self.requirements = dict(requirements)
+        self.features = {}
+        order = []
+
+        def visit(name):
+            if name in self.features:
+                return
+            feat = resolve(name)
+            self.features[name] = feat
+            for d in feat.deps:
+                visit(d)
+            order.append(name)
+
+        self.rows = {}
+        for feats, lookback in self.requirements.values():
+            for name in feats:
+                visit(name)
+                self.rows[name] = _need(self.rows.get(name, 0), lookback)
+
+        # order 是依赖在前的后序，倒序遍历保证一个特征的所有使用者都已把需求传下来
+        self.order = order
+        for name in reversed(order):
+            feat, need = self.features[name], self.rows.get(name, 0)
+            for d in feat.deps:
+                extra = None if need is None or feat.warmup is None else need + feat.warmup
+                self.rows[d] = _need(self.rows.get(d, 0), extra)
+
+    @property
+    def raw_fields(self):
+        return [name for name in self.order if not self.features[name].deps]
+
+    @property
+    def max_rows(self):
+        """装载数据需要的最少行数 (None 为全部历史)"""
+        need = 0
+        for name in self.raw_fields:
+            need = _need(need, self.rows[name])
+        return need
+
+    def compute(self, source):
+        """
+        source: 提供原始列的映射 (Panel 或 {列名: 数组})，数组按时间在第 0 维。
+        返回 {特征名: 尾部数组}，各特征长度为自身需要的行数。
+        """
+        values = {}
+        for name in self.order:
+            feat, rows = self.features[name], self.rows[name]
+            if feat.func is None:
+                values[name] = _tail(np.asarray(source[name], dtype=float), rows)
+                continue
+            span = None if rows is None or feat.warmup is None else rows + feat.warmup
+            out = feat.func(*(_tail(values[d], span) for d in feat.deps))
+            values[name] = _tail(out, rows)
+        return values
+
+    def view(self, values, key):
+        """取出某个战法声明的特征，统一截成它的回看行数"""
+        feats, lookback = self.requirements[key]
+        return {name: _tail(values[name], lookback) for name in feats}
+
+    def describe(self):
+        n_raw = len(self.raw_fields)
+        rows = ', '.join(f"{k}:{'全部' if v is None else v}" for k, v in self.rows.items())
+        return f"{len(self.requirements)} 个战法 -> {len(self.order) - n_raw} 个特征 + {n_raw} 个原始列 ({rows})"
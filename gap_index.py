@@ -0,0 +1,321 @@
+import os
+import pickle
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import indicators as ta
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+STATE_FILE = 'cache/gap_index.pkl'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/gap_index'
+CHUNK_SIZE = 100             # 重建时每批装载全部历史的股票数 (稀疏表约占 K线数 × 股票数 × 14 × 2 个浮点)
+CATCHUP = 60                 # 一次增量最多追补的K线数，落后更多则重建该股
+NEAR_PCT = 5.0               # main 输出：距最新收盘价 NEAR_PCT% 以内的未回补缺口
+
+# 缺口：向上缺口 (kind=1) 为 当日最低 > 前一日最高，区间 [前日最高, 当日最低]；
+#       向下缺口 (kind=-1) 为 当日最高 < 前一日最低，区间 [当日最高, 前日最低]。
+# 回补：之后的价格第一次完整穿过缺口 (向上缺口最低价 <= 下沿，向下缺口最高价 >= 上沿) 记为回补日。
+# edge 为缺口靠近现价一侧尚未回补的边界：向上缺口被部分回补时上沿降到此后的最低价，向下缺口同理。
+# 按K线顺序比较 (停牌前后相邻的两根K线之间也算)，价格非正的早年前复权数据不计。
+GAP_COLUMNS = ['code', 'kind', 'date', 'lo', 'hi', 'edge', 'fill_date']
+_KEY_SCALE, _KEY_OFFSET = 64.0, 32.0     # 查询键 = 股票序号 × 64 + 32 + log(边界价)，各股票的键区间互不重叠
+
+
+def _sparse(x, op):
+    """稀疏表：第 k 层第 i 行为 x[i : i + 2^k] 的区间最值 (op 为 np.fmin / np.fmax)"""
+    table = [np.asarray(x, dtype=float)]
+    while 2 ** len(table) <= len(table[0]):
+        prev, half = table[-1], 2 ** (len(table) - 1)
+        table.append(op(prev[:-half], prev[half:]))
+    return table
+
+
+def _first_cross(table, cols, start, bound, below):
+    """
+    每个查询在 [start, T) 内第一个越过 bound 的行号 (below=True 为 <= bound，否则 >= bound)，没有则为 T。
+    倍增：从最大的块开始，整块都没越过就跳过，O(log T)，全部查询一起向量化。
+    """
+    T = len(table[0])
+    pos = start.copy()
+    for k in reversed(range(len(table))):
+        size = 2 ** k
+        ok = pos + size <= T
+        v = table[k][np.where(ok, pos, 0), cols]
+        with np.errstate(invalid='ignore'):
+            crossed = (v <= bound) if below else (v >= bound)
+        pos = np.where(ok & ~crossed, pos + size, pos)
+    return pos
+
+
+def _range(table, cols, start, op, empty):
+    """[start, T) 的区间最值 (两个重叠的 2^k 块)，空区间返回 empty"""
+    T = len(table[0])
+    n = T - start
+    out = np.full(len(start), empty, dtype=float)
+    k = np.floor(np.log2(np.maximum(n, 1))).astype(np.int64)
+    for level in np.unique(k[n > 0]):
+        sel = np.flatnonzero((k == level) & (n > 0))
+        t = table[level]
+        out[sel] = op(t[start[sel], cols[sel]], t[T - 2 ** level, cols[sel]])
+    return out
+
+
+def detect(high, low, since=1):
+    """(T, N) 面板上第 since 行及之后出现的缺口，返回 (行号, 列号, kind, 下沿, 上沿)"""
+    high, low = np.asarray(high, dtype=float), np.asarray(low, dtype=float)
+    prev_high, prev_low = ta.shift(high), ta.shift(low)
+    with np.errstate(invalid='ignore'):
+        up = (low > prev_high) & (prev_high > 0)
+        down = (high < prev_low) & (high > 0)
+    up[:since], down[:since] = False, False
+    ru, cu = np.nonzero(up)
+    rd, cd = np.nonzero(down)
+    rows, cols = np.concatenate([ru, rd]), np.concatenate([cu, cd])
+    kind = np.concatenate([np.ones(len(ru), dtype=np.int8), -np.ones(len(rd), dtype=np.int8)])
+    lo = np.concatenate([prev_high[ru, cu], high[rd, cd]])
+    hi = np.concatenate([low[ru, cu], prev_low[rd, cd]])
+    return rows, cols, kind, lo, hi
+
+
+def resolve(tables, cols, kind, lo, hi, edge, start):
+    """
+    用 [start, T) 的K线推进缺口：返回 (回补行号，未回补为 -1, 新的 edge)。
+    tables = (最低价的最小值稀疏表, 最高价的最大值稀疏表)；edge 为推进前的未回补边界。
+    """
+    low_t, high_t = tables
+    T = len(low_t[0])
+    fill = np.full(len(cols), -1, dtype=np.int64)
+    edge = edge.copy()
+    for sign, table, bound, op, empty in ((1, low_t, lo, np.fmin, np.inf), (-1, high_t, hi, np.fmax, -np.inf)):
+        sel = np.flatnonzero(kind == sign)
+        if not len(sel):
+            continue
+        first = _first_cross(table, cols[sel], start[sel], bound[sel], below=sign == 1)
+        fill[sel] = np.where(first < T, first, -1)
+        reach = _range(table, cols[sel], start[sel], op, empty)
+        edge[sel] = np.where(first < T, bound[sel], op(edge[sel], reach))
+    return fill, edge
+
+
+def scan(high, low, dates, since=1):
+    """面板 (或单只股票的 (T, 1) 数组) 上自第 since 行起的全部缺口及其截至最后一根K线的回补状态，DataFrame"""
+    rows, cols, kind, lo, hi = detect(high, low, since)
+    fill, edge = resolve((_sparse(low, np.fmin), _sparse(high, np.fmax)), cols, kind, lo, hi,
+                         np.where(kind == 1, hi, lo), rows + 1)
+    dates = np.asarray(dates, dtype=object)
+    out = pd.DataFrame({'code': cols, 'kind': kind, 'date': dates[rows, cols], 'lo': lo, 'hi': hi, 'edge': edge,
+                        'fill_date': np.where(fill >= 0, dates[np.maximum(fill, 0), cols], None)})
+    return out.sort_values(['code', 'date']).reset_index(drop=True)
+
+
+class GapIndex:
+    """
+    全市场缺口表：每个缺口一行 (GAP_COLUMNS，code 为股票序号)，含已回补的历史缺口。
+    增量只装载最近 CATCHUP + 1 根K线：在新K线上找新缺口，并把全部未回补缺口用新K线推进 (回补/部分回补)；
+    K线被改写 (如除权后前复权价格整体变化) 或落后太多的股票删掉其全部缺口，用全部历史重建。
+    查询用按 (股票, 未回补边界) 排序的键数组，每只股票两次二分定位价格区间。
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.codes = []
+        self.n_bars = np.zeros(0, dtype=np.int64)
+        self.last_date = np.empty(0, dtype=object)
+        self.last_close = np.zeros(0)
+        self.gaps = pd.DataFrame(columns=GAP_COLUMNS)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    saved = pickle.load(f)
+                self.__dict__.update(saved['state'])
+            except Exception as e:
+                print(f"读取缺口索引失败，将全量重建: {e}")
+        self.row = {c: i for i, c in enumerate(self.codes)}
+        self._index = None
+
+    def _ensure(self, codes):
+        new = [c for c in codes if c not in self.row]
+        if not new:
+            return
+        n = len(new)
+        for c in new:
+            self.row[c] = len(self.codes)
+            self.codes.append(c)
+        self.n_bars = np.concatenate([self.n_bars, np.zeros(n, dtype=np.int64)])
+        self.last_date = np.concatenate([self.last_date, np.full(n, None, dtype=object)])
+        self.last_close = np.concatenate([self.last_close, np.full(n, np.nan)])
+
+    def _mark(self, panel, rows, done):
+        self.n_bars[rows[done]] = panel.length[done]
+        self.last_date[rows[done]] = panel.dates[-1, done]
+        self.last_close[rows[done]] = panel['close'][-1, done]
+
+    def update_panel(self, panel):
+        """
+        用右对齐尾部面板 (tail >= CATCHUP + 1，含 high/low/close) 推进；
+        返回需要用全部历史重建的股票代码 (交给 rebuild)。
+        """
+        self._ensure(panel.codes)
+        self._index = None
+        T = panel.shape[0]
+        rows = np.array([self.row[c] for c in panel.codes])
+        close = panel['close']
+        k = panel.length - self.n_bars[rows]
+
+        # 原来的最后一根K线必须还在原位且未被改写，否则重建
+        prev = np.clip(T - 1 - k, 0, T - 1)
+        cols = np.arange(len(rows))
+        same = ((panel.dates[prev, cols] == self.last_date[rows])
+                & (close[prev, cols] == self.last_close[rows]))
+        rebuild = (self.n_bars[rows] == 0) | (k < 0) | (k > min(CATCHUP, T - 1)) | ~same
+        step = ~rebuild & (k > 0)
+        if step.any():
+            tables = (_sparse(panel['low'], np.fmin), _sparse(panel['high'], np.fmax))
+            col_of = np.full(len(self.codes), -1, dtype=np.int64)
+            col_of[rows[step]] = cols[step]
+
+            # 已有的未回补缺口用新K线推进
+            g = self.gaps
+            open_ = np.flatnonzero(g['fill_date'].isna().values & (col_of[g['code'].values.astype(np.int64)] >= 0))
+            if len(open_):
+                c = col_of[g['code'].values[open_].astype(np.int64)]
+                fill, edge = resolve(tables, c, g['kind'].values[open_], g['lo'].values[open_].astype(float),
+                                     g['hi'].values[open_].astype(float), g['edge'].values[open_].astype(float),
+                                     T - k[c])
+                g.iloc[open_, g.columns.get_loc('edge')] = edge
+                hit = fill >= 0
+                g.iloc[open_[hit], g.columns.get_loc('fill_date')] = panel.dates[fill[hit], c[hit]]
+
+            # 新K线上的新缺口 (每只股票只取自己的最后 k 行)
+            r, c, kind, lo, hi = detect(panel['high'], panel['low'], since=T - int(k[step].max()))
+            keep = step[c] & (r >= T - k[c])
+            r, c, kind, lo, hi = r[keep], c[keep], kind[keep], lo[keep], hi[keep]
+            fill, edge = resolve(tables, c, kind, lo, hi, np.where(kind == 1, hi, lo), r + 1)
+            new = pd.DataFrame({'code': rows[c], 'kind': kind, 'date': panel.dates[r, c], 'lo': lo, 'hi': hi,
+                                'edge': edge, 'fill_date': np.where(fill >= 0, panel.dates[np.maximum(fill, 0), c], None)})
+            self.gaps = pd.concat([g, new], ignore_index=True)
+        self._mark(panel, rows, step)
+        return [panel.codes[j] for j in np.flatnonzero(rebuild)]
+
+    def rebuild(self, panel):
+        """用全部历史的右对齐面板重建这些股票的缺口"""
+        self._ensure(panel.codes)
+        self._index = None
+        rows = np.array([self.row[c] for c in panel.codes])
+        found = scan(panel['high'], panel['low'], panel.dates)
+        found['code'] = rows[found['code'].values]
+        keep = ~self.gaps['code'].isin(rows)
+        self.gaps = pd.concat([self.gaps[keep], found], ignore_index=True)
+        self._mark(panel, rows, np.ones(len(rows), dtype=bool))
+
+    def _build_index(self):
+        """未回补缺口按 (kind, 查询键) 排序；向上缺口都在现价下方，向下缺口都在现价上方"""
+        g = self.gaps[self.gaps['fill_date'].isna()]
+        self._index = {}
+        for kind in (1, -1):
+            sub = g[g['kind'] == kind]
+            key = sub['code'].values.astype(float) * _KEY_SCALE + _KEY_OFFSET + np.log(sub['edge'].values.astype(float))
+            order = np.argsort(key, kind='stable')
+            self._index[kind] = (key[order], sub.index.values[order])
+
+    def near(self, within=NEAR_PCT, side='below', prices=None):
+        """
+        现价附近 within% 以内的未回补缺口：side='below' 为现价下方的向上缺口 (未回补边界在 [现价×(1-w), 现价])，
+        'above' 为现价上方的向下缺口 (边界在 [现价, 现价×(1+w)])。prices 为 {代码: 价格}，缺省取各股最新收盘价。
+        全市场一次 searchsorted：O(股票数 × log 缺口数)。返回 DataFrame (含 code 代码与 distance 距现价百分比)。
+        """
+        if self._index is None:
+            self._build_index()
+        kind = 1 if side == 'below' else -1
+        key, idx = self._index[kind]
+        price = self.last_close.astype(float).copy()
+        if prices is not None:
+            price = np.full(len(self.codes), np.nan)
+            for code, p in dict(prices).items():
+                if code in self.row:
+                    price[self.row[code]] = p
+        code = np.flatnonzero(price > 0)
+        p = price[code]
+        lo_p, hi_p = (p * (1 - within / 100), p) if kind == 1 else (p, p * (1 + within / 100))
+        base = code * _KEY_SCALE + _KEY_OFFSET
+        start = np.searchsorted(key, base + np.log(lo_p), side='left')
+        stop = np.searchsorted(key, base + np.log(hi_p), side='right')
+        count = stop - start
+        pos = np.repeat(start - np.cumsum(count) + count, count) + np.arange(count.sum())
+        out = self.gaps.loc[idx[pos]].copy()
+        out['price'] = np.repeat(p, count)
+        out['distance'] = (out['edge'] - out['price']) / out['price'] * 100
+        out['code'] = [self.codes[i] for i in out['code'].values]
+        return out.reset_index(drop=True)
+
+    def symbol(self, code):
+        """单只股票的全部缺口 (按日期)"""
+        if code not in self.row:
+            return pd.DataFrame(columns=GAP_COLUMNS)
+        out = self.gaps[self.gaps['code'] == self.row[code]].sort_values('date').copy()
+        out['code'] = code
+        return out.reset_index(drop=True)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        state = {k: getattr(self, k) for k in ('codes', 'n_bars', 'last_date', 'last_close', 'gaps')}
+        with open(tmp, 'wb') as f:
+            pickle.dump({'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+_INDEX = None
+
+def symbol_gaps(df, code):
+    """
+    战法脚本使用的入口：该股全部缺口 (DataFrame[kind, date, lo, hi, edge, fill_date])。
+    索引已更新到传入K线的最后日期时直接取出，否则用传入的K线现场扫描。
+    """
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = GapIndex()
+    df = pe.normalize_columns(df)
+    last = str(df['date'].iloc[-1])
+    if code in _INDEX.row and _INDEX.last_date[_INDEX.row[code]] == last:
+        return _INDEX.symbol(code)
+    high, low = (pd.to_numeric(df[c], errors='coerce').values[:, None] for c in ('high', 'low'))
+    out = scan(high, low, df['date'].astype(str).values[:, None])
+    out['code'] = code
+    return out
+
+
+def main():
+    index = GapIndex()
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['high', 'low', 'close'], tail=CATCHUP + 1, align='bar')
+    todo = index.update_panel(panel)
+    for i in range(0, len(todo), CHUNK_SIZE):
+        index.rebuild(pe.load_panel(DATA_DIR, codes=todo[i:i + CHUNK_SIZE], fields=['high', 'low', 'close'],
+                                    align='bar'))
+    index.save()
+    n_open = int(index.gaps['fill_date'].isna().sum())
+    print(f"缺口索引更新完成：{len(panel.codes)} 只，重建 {len(todo)} 只，缺口 {len(index.gaps)} 个 (未回补 {n_open})，"
+          f"耗时 {time.perf_counter() - t0:.1f}s")
+
+    names_df = sr.load_names(NAMES_FILE)
+    name_map = dict(zip(names_df['code'], names_df['name']))
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    for side, label in (('below', '下方支撑 (向上缺口)'), ('above', '上方压力 (向下缺口)')):
+        t1 = time.perf_counter()
+        near = index.near(side=side)
+        near.insert(1, 'name', near['code'].map(name_map))
+        path = os.path.join(OUTPUT_DIR, f"gaps_{side}_{stamp}.csv")
+        near.round(3).to_csv(path, index=False, encoding='utf-8-sig')
+        print(f"  现价{label} {NEAR_PCT}% 以内未回补缺口 {len(near)} 个 ({near['code'].nunique()} 只)，"
+              f"查询 {(time.perf_counter() - t1) * 1000:.1f}ms -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import os
-import pandas as pd
 import numpy as np
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import pattern_kernels as pk
+import strategy_registry as sr
 
 # 配置参数
 DATA_DIR = 'stock_data'
@@ -26,86 +26,26 @@ def check_geshan_daniu(df):
     5. 买点：今日股价突破缩量阴的最高价。
     """
     if len(df) < 30: return None
-    
-    close = df['close'].values
-    low = df['low'].values
-    high = df['high'].values
-    vol = df['volume'].values
-    pct = df['pct_chg'].values
-    open_p = df['open'].values
 
-    # 寻找过去20天内的“涨停+放量阴”组合
-    # 为保证时效性，放量阴出现在过去10天到3天之间
-    for i in range(3, 15):
-        idx = len(df) - i
-        # 条件1：涨停（前一天）+ 放量阴（idx位置）
-        if idx > 0 and pct[idx-1] > 9.5 and close[idx] < open_p[idx]:
-            # 量能是20天新高
-            if vol[idx] == max(vol[idx-20 : idx+1]):
-                big_yin_idx = idx
-                big_yin_low = low[idx]
-                big_yin_vol = vol[idx]
-                
-                # 条件2：后续调整不破大阴低点
-                subsequent_data = df.iloc[big_yin_idx + 1:]
-                if any(subsequent_data['low'] < big_yin_low):
-                    continue
-                
-                # 条件3：放量阴之后存在缩量阴
-                # 条件4：放量阴与缩量阴之间要有阳线
-                has_yang_between = False
-                small_yin_idx = -1
-                
-                for j in range(big_yin_idx + 1, len(df) - 1):
-                    # 判断是否有阳线
-                    if close[j] > open_p[j]:
-                        has_yang_between = True
-                    
-                    # 判断是否为缩量阴 (量能显著小于放量阴，且收阴)
-                    if has_yang_between and close[j] < open_p[j] and vol[j] < big_yin_vol * 0.6:
-                        small_yin_idx = j
-                
-                # 条件5：买点突破 (今日最高价突破了缩量阴的最高价)
-                if small_yin_idx != -1 and has_yang_between:
-                    small_yin_high = high[small_yin_idx]
-                    if close[-1] > small_yin_high:
-                        return "隔山打牛"
-                        
-    return None
+    # 整段历史一次性求出每根K线的信号，取最后一根为当日结果
+    signal = pk.geshan_daniu(df['open'].values, df['high'].values, df['low'].values,
+                             df['close'].values, df['volume'].values, df['pct_chg'].values)
+    return "隔山打牛" if signal[-1] else None
 
-def process_stock(file_name):
-    code = file_name.split('.')[0]
-    if code.startswith('30'): return None 
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做判定 (单独运行与统一调度器共用)"""
+    df = df.rename(columns=COL_MAP)
+    if df.empty: return None
     
-    try:
-        df = pd.read_csv(os.path.join(DATA_DIR, file_name))
-        df = df.rename(columns=COL_MAP)
-        if df.empty: return None
+    # 预处理百分比
+    if df['pct_chg'].dtype == object:
+        df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
         
-        # 预处理百分比
-        if df['pct_chg'].dtype == object:
-            df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
-            
-        if check_geshan_daniu(df):
-            return code
-    except:
-        return None
+    if check_geshan_daniu(df):
+        return code
     return None
 
-def main():
-    if not os.path.exists(NAMES_FILE): return
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    valid_codes = set(names_df[~names_df['name'].str.contains('ST|st')]['code'])
-
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
-    
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_stock, files))
-    
-    found_codes = [c for c in results if c is not None]
-    
-    # 输出结果
+def save_results(found_codes, names_df):
     now = datetime.now()
     month_dir = os.path.join(OUTPUT_BASE, now.strftime('%Y%m'))
     os.makedirs(month_dir, exist_ok=True)
@@ -116,5 +56,12 @@ def main():
     final_df.to_csv(file_path, index=False, encoding='utf-8-sig')
     print(f"隔山打牛筛选完成：捕捉到 {len(final_df)} 只符合条件的个股。")
 
+STRATEGY = sr.register('geshan_daniu', evaluate, save_results, lookback=40,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE): return
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
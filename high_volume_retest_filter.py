@@ -1,8 +1,10 @@
 import os
 import pandas as pd
 import numpy as np
+import indicators as ta
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import pattern_kernels as pk
+import strategy_registry as sr
 
 # 配置参数
 DATA_DIR = 'stock_data'
@@ -15,7 +17,7 @@ COL_MAP = {
     '最低': 'low', '收盘': 'close', '成交量': 'volume', '涨跌幅': 'pct_chg'
 }
 
-def check_high_volume_logic(df):
+def check_high_volume_logic(df, symbol=None):
     """
     战法名称：高量回踩不破战法
     核心逻辑：
@@ -26,80 +28,27 @@ def check_high_volume_logic(df):
     """
     if len(df) < 30: return None
     
-    close = df['close'].values
-    low = df['low'].values
-    vol = df['volume'].values
-    open_p = df['open'].values
-    
-    # 基础价格过滤 (5-30元)
-    if not (5.0 <= close[-1] <= 30.0): return None
-
     # 计算5日均量
-    ma_vol5 = df['volume'].rolling(5).mean().values
+    ma_vol5 = ta.Indicators(df, symbol).vol_ma(5)
 
-    # --- 步骤一：寻找过去 15 天内的“高量标杆” ---
-    target_idx = -1
-    for i in range(2, 16): # 避开今日，寻找之前的标杆
-        idx = len(df) - i
-        # 条件：放量倍数 > 2 且是阳线
-        if vol[idx] > ma_vol5[idx-1] * 2.0 and close[idx] > open_p[idx]:
-            target_idx = idx
-            break
-            
-    if target_idx == -1: return None
+    # 整段历史一次性求出每根K线的信号，取最后一根为当日结果
+    signal = pk.high_volume_retest(df['open'].values, df['low'].values, df['close'].values,
+                                   df['volume'].values, ma_vol5)
+    return "高量不破" if signal[-1] else None
 
-    # --- 步骤二：锁定防御位 ---
-    # 取高量柱的最低价作为硬性支撑位
-    support_price = low[target_idx]
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做判定 (单独运行与统一调度器共用)"""
+    df = df.rename(columns=COL_MAP)
+    if df.empty: return None
     
-    # --- 步骤三：检查回踩质量 ---
-    # 1. 回踩不破：最新价格必须在支撑位上方，且距离支撑位不超过 3%（即在支撑区）
-    if not (close[-1] >= support_price and close[-1] <= support_price * 1.03):
-        return None
-    
-    # 2. 期间未曾有效跌破：从高量柱至今，收盘价均不低于支撑位
-    period_closes = close[target_idx+1:]
-    if any(pc < support_price for pc in period_closes):
-        return None
-        
-    # 3. 缩量回踩：今日成交量需小于高量柱成交量的 50%
-    if vol[-1] > vol[target_idx] * 0.5:
-        return None
-
-    return "高量不破"
-
-def process_stock(file_name):
-    code = file_name.split('.')[0]
-    if code.startswith('30'): return None 
+    # 处理异常数据
+    df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
     
-    try:
-        df = pd.read_csv(os.path.join(DATA_DIR, file_name))
-        df = df.rename(columns=COL_MAP)
-        if df.empty: return None
-        
-        # 处理异常数据
-        df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
-        
-        if check_high_volume_logic(df):
-            return code
-    except:
-        return None
+    if check_high_volume_logic(df, code):
+        return code
     return None
 
-def main():
-    if not os.path.exists(NAMES_FILE): return
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    valid_codes = set(names_df[~names_df['name'].str.contains('ST|st')]['code'])
-
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
-    
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_stock, files))
-    
-    found_codes = [c for c in results if c is not None]
-    
-    # 输出结果
+def save_results(found_codes, names_df):
     now = datetime.now()
     month_dir = os.path.join(OUTPUT_BASE, now.strftime('%Y%m'))
     os.makedirs(month_dir, exist_ok=True)
@@ -110,5 +59,12 @@ def main():
     final_df.to_csv(file_path, index=False, encoding='utf-8-sig')
     print(f"高量回踩筛选完成：共匹配到 {len(final_df)} 只潜力股。")
 
+STRATEGY = sr.register('high_volume_retest', evaluate, save_results, lookback=30,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE): return
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
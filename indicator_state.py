@@ -0,0 +1,287 @@
+import os
+import glob
+import math
+import pickle
+import time
+import numpy as np
+import pandas as pd
+import indicators as ta
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+STATE_FILE = 'cache/indicator_state.pkl'
+
+# 需要增量维护的指标 (与 stock_scanner_go / stock_scanner_w 使用的口径一致)
+MA_SPECS = [('close', 5), ('close', 60), ('volume', 5), ('turnover', 30)]
+RSI_PERIODS = [6, 14]
+KDJ_N, KDJ_M = 9, 3
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+
+MA_PREFIX = {'close': 'ma', 'volume': 'vol_ma', 'turnover': 'turnover_ma'}
+VERIFY_MODE = False          # True: 每只股票增量结果都与全量重算比对
+VERIFY_RTOL = 1e-9
+
+
+class RollingWindow:
+    """定长环形缓冲 + 滚动和：push 为 O(1)，每绕满一圈用缓冲区重新求和一次，避免浮点漂移累积"""
+
+    def __init__(self, window):
+        self.window = window
+        self.buf = [math.nan] * window
+        self.pos = 0
+        self.count = 0
+        self.total = 0.0
+        self.nan_count = 0
+
+    def push(self, x):
+        old = self.buf[self.pos]
+        if self.count >= self.window:
+            if old == old:
+                self.total -= old
+            else:
+                self.nan_count -= 1
+        else:
+            self.count += 1
+        if x == x:
+            self.total += x
+        else:
+            self.nan_count += 1
+        self.buf[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+        if self.pos == 0:
+            self.total = math.fsum(v for v in self.buf if v == v)
+
+    @property
+    def full(self):
+        return self.count >= self.window and self.nan_count == 0
+
+    def mean(self):
+        return self.total / self.window if self.full else math.nan
+
+    def max(self):
+        return max(self.buf) if self.full else math.nan
+
+    def min(self):
+        return min(self.buf) if self.full else math.nan
+
+
+class EwmState:
+    """EMA 递推状态，单步更新规则与 indicators.ewm_mean 完全相同"""
+
+    def __init__(self, alpha, adjust):
+        self.alpha = alpha
+        self.adjust = adjust
+        self.weighted = math.nan
+        self.old_wt = 1.0
+
+    def push(self, x):
+        self.weighted, self.old_wt = ta.ewm_update(self.weighted, self.old_wt, x, self.alpha, self.adjust)
+        return self.weighted
+
+
+def _div(a, b):
+    """按 NumPy 语义做除法：x/0 为 ±inf，0/0 为 NaN"""
+    if b == 0:
+        if a != a or a == 0:
+            return math.nan
+        return math.copysign(math.inf, a)
+    return a / b
+
+
+class SymbolState:
+    """
+    单只股票的指标状态：EMA 值、滚动窗口和/环形缓冲、最后处理到的日期。
+    values 为最新一根K线的指标，prev 为上一根 (用于金叉/柱线变化判断)。
+    """
+
+    def __init__(self):
+        self.n_bars = 0
+        self.first_date = None
+        self.first_close = math.nan
+        self.last_date = None
+        self.last_close = math.nan
+        self.ma = {spec: RollingWindow(spec[1]) for spec in MA_SPECS}
+        self.gain = {p: RollingWindow(p) for p in RSI_PERIODS}
+        self.loss = {p: RollingWindow(p) for p in RSI_PERIODS}
+        self.high_n = RollingWindow(KDJ_N)
+        self.low_n = RollingWindow(KDJ_N)
+        self.kdj_k = EwmState(1.0 / KDJ_M, True)
+        self.kdj_d = EwmState(1.0 / KDJ_M, True)
+        self.ema_fast = EwmState(2.0 / (MACD_FAST + 1), False)
+        self.ema_slow = EwmState(2.0 / (MACD_SLOW + 1), False)
+        self.dea = EwmState(2.0 / (MACD_SIGNAL + 1), False)
+        self.values = {}
+        self.prev = {}
+
+    def matches(self, dates, closes):
+        """已处理部分的首尾K线未被改写，才允许增量；否则视为历史修订，需要全量重算"""
+        if self.n_bars == 0 or len(dates) < self.n_bars:
+            return False
+        i = self.n_bars - 1
+        return (dates[0] == self.first_date and closes[0] == self.first_close
+                and dates[i] == self.last_date and closes[i] == self.last_close)
+
+    def push(self, date, high, low, close, volume, turnover):
+        """追加一根K线，O(1) 更新全部指标"""
+        bar = {'close': close, 'volume': volume, 'turnover': turnover}
+        out = {}
+        for (col, w), win in self.ma.items():
+            win.push(bar[col])
+            out[f'{MA_PREFIX[col]}{w}'] = win.mean()
+
+        # RSI：涨跌幅的简单滚动均值 (首根K线 delta 为 NaN，按 0 计入，与 pandas where 语义一致)
+        delta = close - self.last_close
+        for p in RSI_PERIODS:
+            self.gain[p].push(delta if delta > 0 else 0.0)
+            self.loss[p].push(-delta if delta < 0 else 0.0)
+            g, l = self.gain[p].mean(), self.loss[p].mean()
+            out[f'rsi{p}'] = 100 - 100 / (1 + g / l) if l == l and l != 0 and g == g else math.nan
+
+        self.high_n.push(high)
+        self.low_n.push(low)
+        low_n, high_n = self.low_n.min(), self.high_n.max()
+        rsv = _div(close - low_n, high_n - low_n) * 100 if low_n == low_n else math.nan
+        out['kdj_k'] = self.kdj_k.push(rsv)
+        out['kdj_d'] = self.kdj_d.push(out['kdj_k'])
+
+        out['ema12'] = self.ema_fast.push(close)
+        out['ema26'] = self.ema_slow.push(close)
+        out['diff'] = out['ema12'] - out['ema26']
+        out['dea'] = self.dea.push(out['diff'])
+        out['macd_hist'] = (out['diff'] - out['dea']) * 2
+
+        if self.n_bars == 0:
+            self.first_date, self.first_close = date, close
+        self.n_bars += 1
+        self.last_date = date
+        self.last_close = close
+        self.prev, self.values = self.values, out
+
+
+def _column(df, name, default=math.nan):
+    if name in df.columns:
+        return df[name]
+    if ta.COL_ALIAS.get(name) in df.columns:
+        return df[ta.COL_ALIAS[name]]
+    return pd.Series(default, index=df.index)
+
+
+def _columns(df):
+    dates = _column(df, 'date').astype(str).tolist()
+    return dates, [_column(df, k).astype(float).tolist() for k in ('high', 'low', 'close', 'volume', 'turnover')]
+
+
+def advance(state, df):
+    """
+    把 state 推进到 df 的最后一根K线并返回 (state, 是否全量重算)。
+    只有新追加的K线被处理；若已处理的历史被改写则从头重建。
+    """
+    rebuilt = state is None or not state.matches(_column(df, 'date').values, _column(df, 'close').values)
+    if rebuilt:
+        state = SymbolState()
+    dates, cols = _columns(df.iloc[state.n_bars:])
+    for row in zip(dates, *cols):
+        state.push(*row)
+    return state, rebuilt
+
+
+def full_values(df):
+    """用共享指标库对完整历史重算最新一根K线的指标，供校验模式比对"""
+    ind = ta.Indicators(df)
+    out = {}
+    for col, w in MA_SPECS:
+        out[f'{MA_PREFIX[col]}{w}'] = ind.ma(w, col)[-1]
+    for p in RSI_PERIODS:
+        out[f'rsi{p}'] = ind.rsi(p)[-1]
+    k, d, _ = ind.kdj(KDJ_N, KDJ_M)
+    out['kdj_k'], out['kdj_d'] = k[-1], d[-1]
+    out['ema12'], out['ema26'] = ind.ema(MACD_FAST)[-1], ind.ema(MACD_SLOW)[-1]
+    dif, dea, hist = ind.macd(MACD_FAST, MACD_SLOW, MACD_SIGNAL)
+    out['diff'], out['dea'], out['macd_hist'] = dif[-1], dea[-1], hist[-1]
+    return out
+
+
+def verify(state, df):
+    """返回增量结果与全量重算不一致的指标 {名称: (增量值, 全量值)}"""
+    expect = full_values(df)
+    return {k: (state.values.get(k), v) for k, v in expect.items()
+            if not np.isclose(state.values.get(k, math.nan), v, rtol=VERIFY_RTOL, atol=1e-9, equal_nan=True)}
+
+
+class IndicatorStateStore:
+    """全市场指标状态库，整体持久化为一个 pickle 文件"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.states = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    self.states = pickle.load(f)
+            except Exception as e:
+                print(f"读取指标状态失败，将全量重建: {e}")
+
+    def get(self, symbol):
+        return self.states.get(symbol)
+
+    def update(self, symbol, df):
+        state, rebuilt = advance(self.states.get(symbol), df)
+        self.states[symbol] = state
+        return state, rebuilt
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.states, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+_SHARED = {}
+
+def current(symbol, df, path=STATE_FILE):
+    """
+    扫描脚本取最新指标用：把已保存的状态推进到 df 的最后一根K线，返回 state (values 为最新一根，prev 为上一根)。
+    状态库每个进程只读一次，推进只在内存里做、不写回文件 (由本脚本的 main 负责保存)。
+    没有该股票的状态，或已处理的历史被改写需要全量重建时返回 None，由调用方改用全量计算。
+    """
+    if path not in _SHARED:
+        _SHARED[path] = IndicatorStateStore(path) if os.path.exists(path) else None
+    store = _SHARED[path]
+    state = store.get(symbol) if store is not None and symbol else None
+    if state is None or not state.matches(_column(df, 'date').values, _column(df, 'close').values):
+        return None
+    state, _ = advance(state, df)
+    return state if state.prev else None
+
+
+def main():
+    store = IndicatorStateStore()
+    files = glob.glob(os.path.join(DATA_DIR, '*.csv'))
+    t0 = time.perf_counter()
+    rebuilt_count, bad = 0, {}
+    for f in files:
+        code = os.path.basename(f).split('.')[0]
+        if not code.isdigit(): continue
+        try:
+            df = pd.read_csv(f)
+            if df.empty: continue
+            state, rebuilt = store.update(code, df)
+            rebuilt_count += rebuilt
+            if VERIFY_MODE:
+                diff = verify(state, df)
+                if diff: bad[code] = diff
+        except Exception as e:
+            print(f"更新 {code} 指标状态失败: {e}")
+    store.save()
+    print(f"指标状态更新完成：{len(store.states)} 只，其中全量重建 {rebuilt_count} 只，耗时 {time.perf_counter() - t0:.1f}s")
+    if VERIFY_MODE:
+        print(f"校验模式：{len(bad)} 只股票与全量重算不一致")
+        for code, diff in list(bad.items())[:20]:
+            print(f"  {code}: {diff}")
+
+
+if __name__ == "__main__":
+    # 以模块身份运行，保证 pickle 里的类路径是 indicator_state.* 而非 __main__.*
+    import indicator_state
+    indicator_state.main()
@@ -0,0 +1,428 @@
+import re
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- 配置区 ---
+EXACT_SUM_WINDOW = 64        # 窗口不超过此值时逐窗口精确求和
+CACHE_MAX_ITEMS = 20000      # 进程内指标缓存条目上限 (LRU淘汰)
+
+# 中文表头 -> 英文字段名，Indicators 两种表头都认
+COL_ALIAS = {
+    'date': '日期', 'open': '开盘', 'close': '收盘', 'high': '最高', 'low': '最低',
+    'volume': '成交量', 'amount': '成交额', 'pct_chg': '涨跌幅', 'turnover': '换手率'
+}
+
+# =====================================================================
+# NumPy 指标内核：沿 axis 0 (时间) 计算，一维序列与 (T, N) 面板通用。
+# 语义对齐 pandas 的 rolling(w).mean() / ewm(...).mean()，窗口内有 NaN 即为 NaN。
+# =====================================================================
+
+def shift(x, n=1):
+    """等价 pandas shift(n)，n>0 向后移"""
+    x = np.asarray(x, dtype=float)
+    out = np.full_like(x, np.nan)
+    if n == 0:
+        out[:] = x
+    elif n > 0:
+        out[n:] = x[:-n]
+    else:
+        out[:n] = x[-n:]
+    return out
+
+
+def rolling_sum(x, window):
+    """
+    短窗口直接对滑动视图求和 (与 pandas 逐位一致，阈值比较不会因累积误差翻转)；
+    长窗口用前缀和相减，复杂度与窗口无关。
+    """
+    x = np.asarray(x, dtype=float)
+    if window <= EXACT_SUM_WINDOW:
+        return _rolling_apply(x, window, np.sum)
+    return _prefix_window_sum(x, window)
+
+
+def _prefix_window_sum(x, window):
+    """前缀和相减的滑动和 (窗口内有 NaN 为 NaN)，每个元素 O(1)"""
+    valid = ~np.isnan(x)
+    pad = np.zeros((1,) + x.shape[1:])
+    cs = np.concatenate([pad, np.cumsum(np.where(valid, x, 0.0), axis=0)])
+    cnt = np.concatenate([pad, np.cumsum(valid, axis=0)])
+    out = np.full_like(x, np.nan)
+    if window > len(x):
+        return out
+    s = cs[window:] - cs[:-window]
+    c = cnt[window:] - cnt[:-window]
+    out[window - 1:] = np.where(c == window, s, np.nan)
+    return out
+
+
+def rolling_mean(x, window):
+    return rolling_sum(x, window) / window
+
+
+def _rolling_apply(x, window, func):
+    x = np.asarray(x, dtype=float)
+    out = np.full_like(x, np.nan)
+    if window > len(x):
+        return out
+    out[window - 1:] = func(sliding_window_view(x, window, axis=0), axis=-1)
+    return out
+
+
+def rolling_max(x, window):
+    return _rolling_apply(x, window, np.max)
+
+
+def rolling_min(x, window):
+    return _rolling_apply(x, window, np.min)
+
+
+def rolling_std(x, window, ddof=1):
+    return _rolling_apply(x, window, lambda v, axis: np.std(v, axis=axis, ddof=ddof))
+
+
+def rolling_rank(x, window):
+    """
+    当前值在最近 window 根 (含当根) 中的百分位，同 pandas rolling(w).rank(pct=True) (并列取平均名次)：
+    (严格小于的个数 + (相等个数 + 1) / 2) / window。
+    逐个滞后与当前值比较并累加计数，不对窗口排序，每个元素 O(window) 且没有临时窗口拷贝。
+    """
+    x = np.asarray(x, dtype=float)
+    out = np.full_like(x, np.nan)
+    if window > len(x):
+        return out
+    cur = x[window - 1:]
+    less = np.zeros(cur.shape)
+    equal = np.zeros(cur.shape)
+    missing = np.zeros(cur.shape, dtype=bool)
+    for k in range(window):
+        prev = x[window - 1 - k:len(x) - k]
+        less += prev < cur
+        equal += prev == cur
+        missing |= np.isnan(prev)
+    out[window - 1:] = np.where(missing, np.nan, (less + (equal + 1) / 2) / window)
+    return out
+
+
+def rolling_quantile(x, window, q):
+    """
+    滑动窗口分位数 (线性插值)。pandas 的 rolling quantile 用跳表维护窗口内的有序序列，
+    每步插入/删除 O(log window)，不重新排序窗口；二维面板按列一次算完。
+    """
+    x = np.asarray(x, dtype=float)
+    frame = pd.DataFrame(x.reshape(len(x), -1))
+    return frame.rolling(window).quantile(q).values.reshape(x.shape)
+
+
+def ewm_mean(x, span=None, com=None, alpha=None, adjust=True):
+    """
+    逐行递推的 EMA，与 pandas ewm(...).mean() (ignore_na=False, min_periods=0) 完全一致：
+    首个有效值之前为 NaN，中间缺失处沿用上一个值并继续衰减权重。
+    一维序列走纯 Python 标量循环，二维面板逐行对全部股票同时递推。
+    """
+    if alpha is None:
+        alpha = 2.0 / (span + 1) if span is not None else 1.0 / (1 + com)
+    x = np.asarray(x, dtype=float)
+    if len(x) == 0:
+        return x.copy()
+    if x.ndim == 1:
+        return _ewm_1d(x.tolist(), alpha, adjust)
+    return ewm_resume(x, np.full(x.shape[1:], np.nan), np.ones(x.shape[1:]), alpha, adjust)[0]
+
+
+def ewm_resume(x, weighted, old_wt, alpha, adjust=True):
+    """
+    二维面板的 EMA 从给定状态接着递推：weighted/old_wt 为上一行之后每列的状态 (尚无有效值时 weighted 为 NaN、
+    old_wt 为 1，即 ewm_mean 的起点)。返回 (逐行结果, 最后的 weighted, 最后的 old_wt)，
+    增量更新时保存状态、下次只对新增的行调用，结果与对全部历史调用 ewm_mean 逐位相同。
+    """
+    x = np.asarray(x, dtype=float)
+    out = np.empty_like(x)
+    old_factor = 1.0 - alpha
+    new_wt = 1.0 if adjust else alpha
+    weighted = np.array(weighted, dtype=float)
+    old_wt = np.array(old_wt, dtype=float)
+    for i in range(len(x)):
+        cur = x[i]
+        obs = ~np.isnan(cur)
+        started = ~np.isnan(weighted)
+        upd = started & obs
+        old_wt = np.where(started, old_wt * old_factor, old_wt)
+        mixed = (old_wt * weighted + new_wt * np.where(obs, cur, 0.0)) / (old_wt + new_wt)
+        weighted = np.where(upd & (weighted != cur), mixed, weighted)
+        if adjust:
+            old_wt = np.where(upd, old_wt + new_wt, old_wt)
+        else:
+            old_wt = np.where(upd, 1.0, old_wt)
+        weighted = np.where(~started & obs, cur, weighted)
+        out[i] = weighted
+    return out, weighted, old_wt
+
+
+def ewm_update(weighted, old_wt, cur, alpha, adjust):
+    """EMA 单步递推 (标量)，返回新的 (weighted, old_wt)；增量状态与一维全量计算共用"""
+    if weighted == weighted:
+        old_wt *= 1.0 - alpha
+        if cur == cur:
+            new_wt = 1.0 if adjust else alpha
+            if weighted != cur:
+                weighted = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+            old_wt = old_wt + new_wt if adjust else 1.0
+    elif cur == cur:
+        weighted = cur
+    return weighted, old_wt
+
+
+def _ewm_1d(vals, alpha, adjust):
+    out = np.empty(len(vals))
+    weighted, old_wt = vals[0], 1.0
+    out[0] = weighted
+    for i in range(1, len(vals)):
+        weighted, old_wt = ewm_update(weighted, old_wt, vals[i], alpha, adjust)
+        out[i] = weighted
+    return out
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """返回 (dif, dea, hist)，hist = 2 * (dif - dea)"""
+    dif = ewm_mean(close, span=fast, adjust=False) - ewm_mean(close, span=slow, adjust=False)
+    dea = ewm_mean(dif, span=signal, adjust=False)
+    return dif, dea, (dif - dea) * 2
+
+
+def rsi(close, period):
+    """简单均值版 RSI (与 stock_scanner_go 一致)，跌幅均值为 0 时结果为 NaN"""
+    close = np.asarray(close, dtype=float)
+    delta = np.diff(close, axis=0, prepend=np.nan)
+    missing = np.isnan(close)
+    gain = rolling_mean(np.where(missing, np.nan, np.where(delta > 0, delta, 0.0)), period)
+    loss = rolling_mean(np.where(missing, np.nan, np.where(delta < 0, -delta, 0.0)), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain / np.where(loss == 0, np.nan, loss)
+    return 100 - 100 / (1 + rs)
+
+
+def kdj(high, low, close, n=9, m=3):
+    """KDJ(9,3,3)：RSV 经 ewm(com=m-1) 平滑得到 K、D，J = 3K - 2D"""
+    low_n = rolling_min(low, n)
+    high_n = rolling_max(high, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (np.asarray(close, dtype=float) - low_n) / (high_n - low_n) * 100
+    k = ewm_mean(rsv, com=m - 1)
+    d = ewm_mean(k, com=m - 1)
+    return k, d, 3 * k - 2 * d
+
+
+def rolling_linreg(x, window):
+    """
+    最近 window 根 (含当根) 的最小二乘直线拟合，返回 (斜率, R²)：
+    斜率换算成每根K线变化占窗口均值的百分比 (不同价位的股票可比)，R² 为拟合优度 (0~1，越大走势越“干净”)。
+    由 Σy、Σy²、Σ(t·y) 的前缀和相减得到 (t 为行号，窗口内横坐标 = t - 窗口起点)，每根K线 O(1)，与窗口长度无关；
+    窗口内有 NaN 为 NaN，窗口均值非正时斜率为 NaN，窗口内数值全相等时 R² 为 NaN。
+    """
+    y = np.asarray(x, dtype=float)
+    n = float(window)
+    t = np.arange(len(y), dtype=float).reshape((-1,) + (1,) * (y.ndim - 1))
+    sy = _prefix_window_sum(y, window)
+    syy = _prefix_window_sum(y * y, window)
+    sxy = _prefix_window_sum(t * y, window) - (t - (n - 1)) * sy
+    sx, sxx = n * (n - 1) / 2, (n - 1) * n * (2 * n - 1) / 6
+    cov = n * sxy - sx * sy
+    var_x = n * sxx - sx * sx
+    var_y = n * syy - sy * sy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(sy > 0, cov / var_x / (sy / n) * 100, np.nan)
+        # Σy² 与 (Σy)² 相减的舍入误差量级约为 Σy² × 1e-12，低于它视为窗口内没有波动
+        r2 = np.where(var_y > n * syy * 1e-12, cov * cov / (var_x * var_y), np.nan)
+    return slope, np.minimum(r2, 1.0)
+
+
+def adx(high, low, close, n=14):
+    """
+    ADX 趋势强度 (0~100，不分方向)，返回 (adx, +DI, -DI)：
+    +DM/-DM/TR 用最近 n 根的滑动和代替 Wilder 的递推平滑 (有限窗口，尾部面板也能算)，
+    +DI = 100 × Σ+DM / ΣTR，DX = 100 × |+DI - -DI| / (+DI + -DI)，ADX 为 DX 的 n 根均值。
+    """
+    high, low, close = (np.asarray(v, dtype=float) for v in (high, low, close))
+    up, down = high - shift(high), shift(low) - low
+    prev_close = shift(close)
+    missing = np.isnan(up) | np.isnan(down) | np.isnan(prev_close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        plus_dm = np.where(missing, np.nan, np.where((up > down) & (up > 0), up, 0.0))
+        minus_dm = np.where(missing, np.nan, np.where((down > up) & (down > 0), down, 0.0))
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        tr = np.where(missing, np.nan, tr)
+        sum_tr = _prefix_window_sum(tr, n)
+        plus_di = 100 * _prefix_window_sum(plus_dm, n) / sum_tr
+        minus_di = 100 * _prefix_window_sum(minus_dm, n) / sum_tr
+        dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+    return _prefix_window_sum(dx, n) / n, plus_di, minus_di
+
+
+def last_true_index(cond):
+    """逐行给出截至当前(含)最近一次 cond 为真的行号，没有则为 -1"""
+    cond = np.asarray(cond, dtype=bool)
+    idx = np.arange(len(cond)).reshape((-1,) + (1,) * (cond.ndim - 1))
+    return np.maximum.accumulate(np.where(cond, idx, -1), axis=0)
+
+
+def last_valid_index(mask):
+    """每列最后一个有效行号，全无效为 -1"""
+    return last_true_index(mask)[-1]
+
+
+def window_any(cond, window):
+    """cond 在包含当前行的最近 window 行内是否出现过"""
+    return rolling_sum(np.asarray(cond, dtype=float), window) > 0
+
+
+def take_rows(x, rows):
+    """按每列各自的行号取值，rows<0 处为 NaN"""
+    cols = np.arange(x.shape[1])
+    out = x[np.maximum(rows, 0), cols]
+    return np.where(rows >= 0, out, np.nan)
+
+
+# =====================================================================
+# 带缓存的指标访问器：同一进程内按 (股票, 指标, 参数, 数据版本) 记忆化，
+# 多个战法对同一只股票重复请求 MA/MACD/KDJ 时直接命中，无需 df.copy() 再加列。
+# =====================================================================
+
+_CACHE = OrderedDict()
+_STATS = {'hit': 0, 'miss': 0}
+
+
+def data_version(df):
+    """数据版本：K线数 + 最后日期 + 最后收盘价，新增或修订K线都会改变版本"""
+    if df.empty:
+        return (0, None, None)
+    last = df.iloc[-1]
+    date = last.get('date', last.get('日期'))
+    close = last.get('close', last.get('收盘'))
+    return (len(df), str(date), float(close))
+
+
+def _freeze(value):
+    """缓存里的数组设为只读，防止调用方原地修改污染缓存"""
+    for arr in (value if isinstance(value, tuple) else (value,)):
+        if isinstance(arr, np.ndarray):
+            arr.flags.writeable = False
+    return value
+
+
+def cache_stats():
+    return dict(_STATS, size=len(_CACHE))
+
+
+def clear_cache():
+    _CACHE.clear()
+    _STATS.update(hit=0, miss=0)
+
+
+class Indicators:
+    """
+    单只股票的指标视图：原始列直接取自 df，指标列按需计算并缓存。
+    ind['ma20'] / ind['vol_ma5'] / ind['diff'] / ind['kdj_k'] 返回与 df 同索引的 Series，
+    ind.ma(20) / ind.macd() 等方法返回 NumPy 数组。symbol 为空时只在本对象内缓存。
+    """
+    NAME_PATTERN = re.compile(r'^(ma|vol_ma|ema|rsi|slope|rsq|adx)(\d+)$')
+
+    def __init__(self, df, symbol=None):
+        self.df = df
+        self.symbol = symbol
+        self.version = data_version(df)
+        self._local = {}
+
+    def col(self, name):
+        if name in self.df.columns:
+            return self.df[name]
+        return self.df[COL_ALIAS[name]]
+
+    def values(self, name):
+        return self.col(name).to_numpy(dtype=float)
+
+    def _cached(self, name, params, compute):
+        if self.symbol is None:
+            key = (name, params)
+            if key not in self._local:
+                self._local[key] = compute()
+            return self._local[key]
+        key = (self.symbol, name, params, self.version)
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            _STATS['hit'] += 1
+            return _CACHE[key]
+        _STATS['miss'] += 1
+        value = _freeze(compute())
+        _CACHE[key] = value
+        if len(_CACHE) > CACHE_MAX_ITEMS:
+            _CACHE.popitem(last=False)
+        return value
+
+    def ma(self, window, col='close'):
+        return self._cached('ma', (col, window), lambda: rolling_mean(self.values(col), window))
+
+    def vol_ma(self, window):
+        return self.ma(window, 'volume')
+
+    def ema(self, span, col='close'):
+        return self._cached('ema', (col, span), lambda: ewm_mean(self.values(col), span=span, adjust=False))
+
+    def rolling_max(self, window, col='high'):
+        return self._cached('rolling_max', (col, window), lambda: rolling_max(self.values(col), window))
+
+    def rolling_min(self, window, col='low'):
+        return self._cached('rolling_min', (col, window), lambda: rolling_min(self.values(col), window))
+
+    def macd(self, fast=12, slow=26, signal=9):
+        """(dif, dea, hist)，EMA 复用 ema() 缓存"""
+        def compute():
+            dif = self.ema(fast) - self.ema(slow)
+            dea = ewm_mean(dif, span=signal, adjust=False)
+            return dif, dea, (dif - dea) * 2
+        return self._cached('macd', (fast, slow, signal), compute)
+
+    def rsi(self, period):
+        return self._cached('rsi', (period,), lambda: rsi(self.values('close'), period))
+
+    def kdj(self, n=9, m=3):
+        return self._cached('kdj', (n, m), lambda: kdj(self.values('high'), self.values('low'), self.values('close'), n, m))
+
+    def linreg(self, window, col='close'):
+        """(斜率 %/根, R²)，见 rolling_linreg"""
+        return self._cached('linreg', (col, window), lambda: rolling_linreg(self.values(col), window))
+
+    def slope(self, window, col='close'):
+        return self.linreg(window, col)[0]
+
+    def rsq(self, window, col='close'):
+        return self.linreg(window, col)[1]
+
+    def adx(self, n=14):
+        """(adx, +DI, -DI)"""
+        return self._cached('adx', (n,), lambda: adx(self.values('high'), self.values('low'), self.values('close'), n))
+
+    def get(self, name):
+        """按列名取数组：原始列、ma{n}、vol_ma{n}、ema{n}、rsi{n}、slope{n}、rsq{n}、adx{n}、diff/dif、dea、macd、kdj_k/d/j"""
+        if name in self.df.columns or name in COL_ALIAS:
+            return self.values(name)
+        m = self.NAME_PATTERN.match(name)
+        if m:
+            kind, n = m.group(1), int(m.group(2))
+            return self.adx(n)[0] if kind == 'adx' else getattr(self, kind)(n)
+        if name in ('diff', 'dif', 'dea', 'macd', 'macd_hist'):
+            dif, dea, hist = self.macd()
+            return {'diff': dif, 'dif': dif, 'dea': dea}.get(name, hist)
+        if name in ('kdj_k', 'kdj_d', 'kdj_j'):
+            return self.kdj()['kdj_k kdj_d kdj_j'.split().index(name)]
+        raise KeyError(name)
+
+    def __getitem__(self, name):
+        if name in self.df.columns:
+            return self.df[name]
+        return pd.Series(self.get(name), index=self.df.index, name=name)
+
+    def __len__(self):
+        return len(self.df)
@@ -1,8 +1,9 @@
 import os
-import pandas as pd
 import numpy as np
+import indicators as ta
+import event_index as ei
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import strategy_registry as sr
 
 # 配置参数
 DATA_DIR = 'stock_data'
@@ -15,7 +16,7 @@ COL_MAP = {
     '最低': 'low', '收盘': 'close', '成交量': 'volume', '涨跌幅': 'pct_chg'
 }
 
-def check_rebound_logic(df):
+def check_rebound_logic(df, symbol=None):
     """
     战法名称：涨停回马枪（20日均线支撑型）
     核心逻辑：
@@ -23,33 +24,27 @@ def check_rebound_logic(df):
     2. 缩量回调：涨停后股价经历回落，成交量相比涨停日显著萎缩。
     3. 20MA支撑：当前股价回踩至 20 日均线附近（正负 2% 范围内），且 20MA 趋势向上。
     4. 止跌信号：今日收盘价 >= 20MA，且未出现放量破位的断头铡刀。
+    返回未通过的条件键列表 (空列表即入选)；K线不足返回 None。
     """
-    if len(df) < 30: return False
+    if len(df) < 30: return None
     
     close = df['close'].values
     low = df['low'].values
     vol = df['volume'].values
-    pct = df['pct_chg'].values
-    ma20 = df['close'].rolling(20).mean().values
+    ma20 = ta.Indicators(df, symbol).ma(20)
 
     # 基础价格过滤 (5-20元)
-    if not (5.0 <= close[-1] <= 20.0): return False
+    if not (5.0 <= close[-1] <= 20.0): return ['fail_price']
 
-    # 1. 寻找过去 15 天内的涨停板 (避开最近 2 天，给回调留空间)
-    lookback = 15
-    has_limit_up = False
-    limit_up_idx = -1
-    for i in range(3, lookback + 1):
-        if pct[-i] > 9.5:
-            has_limit_up = True
-            limit_up_idx = len(df) - i
-            break
-    
-    if not has_limit_up: return False
+    # 1. 寻找过去 15 天内最近的涨停板 (避开最近 2 天，给回调留空间)，直接查事件索引
+    limit_up = ei.symbol_events(df, symbol).last('limit_up', ago=(2, 14))
+    if limit_up is None: return ['fail_limit_up']
+    limit_up_idx = len(df) - 1 - limit_up['ago']
 
     # 2. 检查 20 日均线状态
     # MA20 必须是向上或走平的 (今日 MA20 >= 3天前 MA20)
-    if ma20[-1] < ma20[-4]: return False
+    fails = []
+    if ma20[-1] < ma20[-4]: fails.append('fail_ma20_trend')
 
     # 3. 检查当前位置是否回踩支撑位
     # 股价触碰 MA20 或在 MA20 上方 2% 以内
@@ -60,42 +55,28 @@ def check_rebound_logic(df):
     # 当前量能应小于涨停日量能的 70%
     vol_wash = vol[-1] < vol[limit_up_idx] * 0.7
 
-    return on_support and vol_wash
+    if not on_support: fails.append('fail_support')
+    if not vol_wash: fails.append('fail_vol_wash')
+    return fails
 
-def process_stock(file_name):
-    code = file_name.split('.')[0]
-    if code.startswith('30'): return None # 侧重主板
+def evaluate(df, code, name=None):
+    """
+    对已读入的单只股票K线做判定 (单独运行与统一调度器共用)。
+    返回 (入选代码或None, 未通过的条件键列表)，由调度器汇总成漏斗；空表/K线不足返回 None (不计入统计)。
+    """
+    df = df.rename(columns=COL_MAP)
+    if df.empty: return None
     
-    try:
-        df = pd.read_csv(os.path.join(DATA_DIR, file_name))
-        df = df.rename(columns=COL_MAP)
-        if df.empty: return None
+    # 统一处理涨跌幅
+    if df['pct_chg'].dtype == object:
+        df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
         
-        # 统一处理涨跌幅
-        if df['pct_chg'].dtype == object:
-            df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
-            
-        if check_rebound_logic(df):
-            return code
-    except:
+    fails = check_rebound_logic(df, code)
+    if fails is None:
         return None
-    return None
+    return (None if fails else code), fails
 
-def main():
-    if not os.path.exists(NAMES_FILE): return
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    names_df = names_df[~names_df['name'].str.contains('ST|st')]
-    valid_codes = set(names_df['code'])
-
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
-    
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_stock, files))
-    
-    found_codes = [c for c in results if c is not None]
-    
-    # 输出结果
+def save_results(found_codes, names_df):
     now = datetime.now()
     month_dir = os.path.join(OUTPUT_BASE, now.strftime('%Y%m'))
     os.makedirs(month_dir, exist_ok=True)
@@ -106,5 +87,13 @@ def main():
     final_df.to_csv(file_path, index=False, encoding='utf-8-sig')
     print(f"筛选完成：捕捉到 {len(final_df)} 只符合回马枪形态的个股。")
 
+# 侧重主板，排除 ST 股
+STRATEGY = sr.register('limit_up_rebound_20ma', evaluate, save_results, lookback=30,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True, funnel=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE): return
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
@@ -1,8 +1,10 @@
 import os
-import pandas as pd
 import numpy as np
+import indicators as ta
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import pattern_kernels as pk
+import bar_sequence as bs
+import strategy_registry as sr
 
 # 配置参数
 DATA_DIR = 'stock_data'
@@ -22,30 +24,9 @@ def is_three_yin_one_yang(df):
     2. 洗盘特征：连续 3 根阴线，且这 3 天成交量持续缩减（缩量洗盘）。
     3. 趋势要求：处于上升趋势或横盘回踩支撑位（收盘价不破大阳线开盘价）。
     """
-    if len(df) < 10: return False
-    
-    # 检查最近 4 天：1阳 + 3阴
-    last_4 = df.tail(4).copy()
-    c = last_4['close'].values
-    o = last_4['open'].values
-    v = last_4['volume'].values
-    p = last_4['pct_chg'].values
-    
-    # 条件1：前第4天是大阳线 (涨幅 > 7%)
-    if p[0] < 7.0: return False
-    
-    # 条件2：后面3天是阴线 (收盘 < 开盘)
-    if not all(c[i] < o[i] for i in range(1, 4)): return False
-    
-    # 条件3：缩量 (第2、3、4天量能低于第1天大阳线量能，且整体呈萎缩趋势)
-    if not (v[1] < v[0] and v[3] < v[1]): return False
-    
-    # 条件4：空间支撑 (第4天收盘价不跌破第1天大阳线的开盘价)
-    if c[3] < o[0]: return False
-    
-    return True
+    return bs.match_last(df, 'three_yin_one_yang')
 
-def is_double_cannon(df):
+def is_double_cannon(df, symbol=None):
     """
     战法二：【涨停双响炮】
     1. K线组合：两根大阳线（涨幅>7%）中间夹着小K线。
@@ -55,74 +36,39 @@ def is_double_cannon(df):
     """
     if len(df) < 15: return False
     
-    # 检查最后一根是否是大阳线
-    today = df.iloc[-1]
-    if today['pct_chg'] < 7.0: return False
-    
-    # 向前寻找前一根大阳线（间隔2到7天）
-    found_first_cannon = False
-    for i in range(2, 9):
-        prev_idx = -i
-        prev_k = df.iloc[prev_idx]
-        
-        if prev_k['pct_chg'] > 7.0:
-            # 找到前炮，检查中间的洗盘区
-            wash_zone = df.iloc[prev_idx + 1 : -1]
-            # 实体不能超过阳线两端（简化为收盘价在第一根阳线范围内）
-            if wash_zone['close'].max() <= prev_k['high'] and wash_zone['close'].min() >= prev_k['low']:
-                # 检查均线趋势 (5日线 > 20日线 或 正在向上)
-                ma5 = df['close'].rolling(5).mean()
-                ma20 = df['close'].rolling(20).mean()
-                if ma5.iloc[-1] >= ma20.iloc[-1]:
-                    found_first_cannon = True
-                    break
-    
-    return found_first_cannon
+    # 均线只算一次 (共享指标库，按股票缓存)
+    ind = ta.Indicators(df, symbol)
+    signal = pk.double_cannon(df['high'].values, df['low'].values, df['close'].values,
+                              df['pct_chg'].values, ind.ma(5), ind.ma(20))
+    return bool(signal[-1])
 
-def process_stock(file_name):
-    code = file_name.split('.')[0]
-    if code.startswith('30'): return None
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做判定 (单独运行与统一调度器共用)"""
+    df = df.rename(columns=COL_MAP)
+    if df.empty or len(df) < 20: return None
     
-    try:
-        df = pd.read_csv(os.path.join(DATA_DIR, file_name))
-        df = df.rename(columns=COL_MAP)
-        if df.empty or len(df) < 20: return None
+    # 统一处理涨跌幅格式
+    if df['pct_chg'].dtype == object:
+        df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
         
-        # 统一处理涨跌幅格式
-        if df['pct_chg'].dtype == object:
-            df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
-            
-        # 基础过滤：价格 5-20 元
-        last_close = df['close'].iloc[-1]
-        if not (5.0 <= last_close <= 20.0): return None
+    # 基础过滤：价格 5-20 元
+    last_close = df['close'].iloc[-1]
+    if not (5.0 <= last_close <= 20.0): return None
 
-        res_three_yin = is_three_yin_one_yang(df)
-        res_double_cannon = is_double_cannon(df)
-        
-        if res_three_yin or res_double_cannon:
-            return {
-                'code': code, 
-                'type': '三阴生阳' if res_three_yin else '涨停双响炮'
-            }
-    except:
-        return None
+    res_three_yin = is_three_yin_one_yang(df)
+    res_double_cannon = is_double_cannon(df, code)
+    
+    if res_three_yin or res_double_cannon:
+        return {
+            'code': code, 
+            'type': '三阴生阳' if res_three_yin else '涨停双响炮'
+        }
     return None
 
-def main():
-    if not os.path.exists(NAMES_FILE): return
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    names_df = names_df[~names_df['name'].str.contains('ST|st')]
-    valid_codes = set(names_df['code'])
-
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
-    
-    with ProcessPoolExecutor() as executor:
-        task_results = list(executor.map(process_stock, files))
-    
+def save_results(task_results, names_df):
     # 结果分类
-    three_yin_list = [r['code'] for r in task_results if r and r['type'] == '三阴生阳']
-    cannon_list = [r['code'] for r in task_results if r and r['type'] == '涨停双响炮']
+    three_yin_list = [r['code'] for r in task_results if r['type'] == '三阴生阳']
+    cannon_list = [r['code'] for r in task_results if r['type'] == '涨停双响炮']
 
     # 输出保存
     now = datetime.now()
@@ -136,5 +82,12 @@ def main():
         out_df.to_csv(file_path, index=False, encoding='utf-8-sig')
         print(f"{title} 战法匹配到: {len(out_df)} 只")
 
+STRATEGY = sr.register('limit_up_squad', evaluate, save_results, lookback=20,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE): return
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
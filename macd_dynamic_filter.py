@@ -1,8 +1,8 @@
 import os
-import pandas as pd
 import numpy as np
+import indicators as ta
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import strategy_registry as sr
 
 # 配置参数
 DATA_DIR = 'stock_data'
@@ -15,16 +15,7 @@ COL_MAP = {
     '最低': 'low', '收盘': 'close', '成交量': 'volume'
 }
 
-def calculate_macd_ext(df, fast=12, slow=26, signal=9):
-    """计算MACD及柱状线"""
-    exp1 = df['close'].ewm(span=fast, adjust=False).mean()
-    exp2 = df['close'].ewm(span=slow, adjust=False).mean()
-    dif = exp1 - exp2
-    dea = dif.ewm(span=signal, adjust=False).mean()
-    hist = 2 * (dif - dea)
-    return dif, dea, hist
-
-def check_macd_logic(df):
+def check_macd_logic(df, symbol=None):
     """
     战法名称：MACD 核心战法——买在小绿柱，卖在小红柱
     核心逻辑：
@@ -33,10 +24,10 @@ def check_macd_logic(df):
     """
     if len(df) < 40: return False, False
     
-    _, _, hist = calculate_macd_ext(df)
+    _, _, hist = ta.Indicators(df, symbol).macd()
     
     # 获取最近 5 日柱状线
-    recent_hist = hist.tail(5).values
+    recent_hist = hist[-5:]
     last_price = df['close'].iloc[-1]
     
     # 基础价格过滤
@@ -50,7 +41,7 @@ def check_macd_logic(df):
         # 绿柱缩短：今天的负值比昨天大（即更接近0），昨天的比前天大
         if recent_hist[-1] > recent_hist[-2] > recent_hist[-3]:
             # 贴近零轴判断：绝对值小于某个阈值（例如过去 20 日最大高度的 10%）
-            limit = np.abs(hist.tail(20)).max() * 0.2
+            limit = np.abs(hist[-20:]).max() * 0.2
             if abs(recent_hist[-1]) < limit:
                 is_buy = True
 
@@ -63,38 +54,21 @@ def check_macd_logic(df):
             
     return is_buy, is_sell
 
-def process_stock(file_name):
-    code = file_name.split('.')[0]
-    if code.startswith('30'): return None
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做判定 (单独运行与统一调度器共用)"""
+    df = df.rename(columns=COL_MAP)
+    if df.empty or len(df) < 30: return None
+    
+    is_buy, is_sell = check_macd_logic(df, code)
     
-    try:
-        df = pd.read_csv(os.path.join(DATA_DIR, file_name))
-        df = df.rename(columns=COL_MAP)
-        if df.empty or len(df) < 30: return None
-        
-        is_buy, is_sell = check_macd_logic(df)
-        
-        if is_buy or is_sell:
-            return {'code': code, 'type': 'BUY' if is_buy else 'SELL'}
-    except:
-        return None
+    if is_buy or is_sell:
+        return {'code': code, 'type': 'BUY' if is_buy else 'SELL'}
     return None
 
-def main():
-    if not os.path.exists(NAMES_FILE): return
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    names_df = names_df[~names_df['name'].str.contains('ST|st')]
-    valid_codes = set(names_df['code'])
-
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
-    
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_stock, files))
-    
+def save_results(results, names_df):
     # 分类结果
-    buy_list = [r['code'] for r in results if r and r['type'] == 'BUY']
-    sell_list = [r['code'] for r in results if r and r['type'] == 'SELL']
+    buy_list = [r['code'] for r in results if r['type'] == 'BUY']
+    sell_list = [r['code'] for r in results if r['type'] == 'SELL']
 
     # 保存
     now = datetime.now()
@@ -107,5 +81,13 @@ def main():
         out_df.to_csv(os.path.join(month_dir, f'{label}_{ts}.csv'), index=False, encoding='utf-8-sig')
         print(f"{label} 匹配到 {len(out_df)} 只")
 
+# MACD 为递推指标，需要全部历史
+STRATEGY = sr.register('macd_dynamic', evaluate, save_results,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE): return
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
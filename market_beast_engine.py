@@ -2,7 +2,15 @@ import pandas as pd
 import numpy as np
 import os
 import glob
+import time
+from collections import Counter, defaultdict
 from datetime import datetime
+from multiprocessing import Pool, cpu_count
+import panel_engine as pe
+import indicators as ta
+import feature_graph as fg
+import bar_sequence as bs
+import strategy_registry as sr
 
 # --- 配置区 ---
 DATA_DIR = 'stock_data'
@@ -17,21 +25,18 @@ STRATEGY_MAP = {
     'wave_bottom': 'results/wave_bottom', 'no_loss': 'results/no_loss',
     'chase_rise': 'results/chase_rise', 'inst_swing': 'results/inst_swing'
 }
+MIN_BARS = 250               # 上市K线数门槛
+PRICE_RANGE = (5.0, 35.0)    # 基础价格区间
+PANEL_TAIL = 600             # 面板模式只装载最近600根K线 (足够MA250与EMA预热)
+ENGINE_MODE = 'panel'        # 'panel': 全市场向量化 | 'parallel': 多进程逐只尾部视图 | 'serial': 逐只DataFrame
+POOL_CHUNKSIZE = 32          # parallel 模式每次派发给子进程的文件数
+DISABLED_STRATEGIES = []     # 暂停的战法，其特征不再计算
 
 class AlphaLogics:
     @staticmethod
-    def get_indicators(df):
-        df = df.copy()
-        # 计算核心均线
-        for m in [5, 10, 20, 34, 60, 120, 250]:
-            df[f'ma{m}'] = df['close'].rolling(m).mean()
-        # 计算MACD
-        df['ema12'] = df['close'].ewm(span=12, adjust=False).mean()
-        df['ema26'] = df['close'].ewm(span=26, adjust=False).mean()
-        df['diff'] = df['ema12'] - df['ema26']
-        df['dea'] = df['diff'].ewm(span=9, adjust=False).mean()
-        df['macd'] = (df['diff'] - df['dea']) * 2
-        return df
+    def get_indicators(df, symbol=None):
+        # 均线/MACD 由共享指标库按需计算并缓存，不再复制整张表加列
+        return ta.Indicators(df, symbol)
 
     # --- 终极逻辑：精细形态识别 ---
 
@@ -48,7 +53,7 @@ class AlphaLogics:
     def logic_duck_head(df):
         # 老鸭头：MA5/10金叉，且股价在MA20附近缩量（鸭鼻孔）
         ma_up = df['ma5'].iloc[-1] > df['ma10'].iloc[-1] > df['ma60'].iloc[-1]
-        vol_shrink = df['volume'].iloc[-1] < df['volume'].rolling(5).mean().iloc[-1]
+        vol_shrink = df['volume'].iloc[-1] < df['vol_ma5'].iloc[-1]
         price_near = df['ma20'].iloc[-1] * 0.98 <= df['close'].iloc[-1] <= df['ma20'].iloc[-1] * 1.02
         return ma_up and vol_shrink and price_near
 
@@ -61,16 +66,16 @@ class AlphaLogics:
     def logic_pregnancy_line(df):
         # 底部孕线：K线实体变小，成交量极度萎缩
         is_inside = df['high'].iloc[-1] < df['high'].iloc[-2] and df['low'].iloc[-1] > df['low'].iloc[-2]
-        vol_extreme = df['volume'].iloc[-1] < df['volume'].rolling(10).mean().iloc[-1] * 0.6
+        vol_extreme = df['volume'].iloc[-1] < df['vol_ma10'].iloc[-1] * 0.6
         return is_inside and vol_extreme
 
     @staticmethod
     def logic_single_yang(df):
         # 单阳不破：250日线以上，强阳后的平台整理
         if df['close'].iloc[-1] < df['ma250'].iloc[-1]: return False
-        recent_yang = df.iloc[-10:-1][df['pct_chg'].iloc[-10:-1] > 6]
-        if recent_yang.empty: return False
-        yang_low = recent_yang.iloc[-1]['low']
+        recent_low = df['low'].iloc[-10:-1][df['pct_chg'].iloc[-10:-1] > 6]
+        if recent_low.empty: return False
+        yang_low = recent_low.iloc[-1]
         return df['low'].iloc[-10:].min() >= yang_low * 0.99
 
     @staticmethod
@@ -78,7 +83,7 @@ class AlphaLogics:
         # 涨停回调：回调不破MA20
         has_limit = (df['pct_chg'].iloc[-10:-1] > 9.5).any()
         is_support = df['close'].iloc[-1] >= df['ma20'].iloc[-1]
-        vol_down = df['volume'].iloc[-1] < df['volume'].rolling(5).mean().iloc[-1]
+        vol_down = df['volume'].iloc[-1] < df['vol_ma5'].iloc[-1]
         return has_limit and is_support and vol_down
 
     @staticmethod
@@ -113,7 +118,7 @@ class AlphaLogics:
     @staticmethod
     def logic_hot_money(df):
         # 游资：倍量+突发突破
-        return df['volume'].iloc[-1] > df['volume'].rolling(20).mean().iloc[-1] * 2.5 and df['pct_chg'].iloc[-1] > 4
+        return df['volume'].iloc[-1] > df['vol_ma20'].iloc[-1] * 2.5 and df['pct_chg'].iloc[-1] > 4
 
     @staticmethod
     def logic_wave_bottom(df):
@@ -138,41 +143,304 @@ class AlphaLogics:
         # 机构：MACD红柱连续3日增长，且均线多头
         return all(df['macd'].iloc[-3:] > 0) and df['macd'].iloc[-1] > df['macd'].iloc[-2] > df['macd'].iloc[-3]
 
+class PanelAlphaLogics:
+    """
+    AlphaLogics 的全市场向量化版本：输入 (T, N) 面板，每个战法返回 (T, N) 布尔矩阵，
+    即每只股票在每一根K线上是否触发，取最后一行即为当日信号，也可直接用于历史回测。
+    """
+    # 各战法声明所需特征与回看行数 (判定最后一根K线需要读到的尾部行数)，
+    # 由 feature_graph 去重成 DAG 后只在尾部计算一次
+    REQUIRES = {
+        'macd_bottom': (['diff', 'dea', 'macd'], 2),
+        'duck_head': (['close', 'volume', 'ma5', 'ma10', 'ma20', 'ma60', 'vol_ma5'], 1),
+        'three_in_one': (['pct_chg', 'volume', 'macd'], 2),
+        'pregnancy_line': (['high', 'low', 'volume', 'vol_ma10'], 2),
+        'single_yang': (['close', 'low', 'pct_chg', 'ma250', 'low_min10'], 10),
+        'limit_pullback': (['close', 'volume', 'pct_chg', 'ma20', 'vol_ma5'], 10),
+        'golden_pit': (['close', 'volume', 'pct_chg'], 10),
+        'grass_fly': (['close', 'ma60', 'vol_ma10', 'vol_std10'], 1),
+        'limit_break': (['close', 'pct_chg', 'ma5'], 5),
+        'double_plate': (['open', 'close', 'pct_chg'], 3),
+        'horse_back': (['low', 'ma10', 'pct_chg_max4'], 2),
+        'hot_money': (['volume', 'pct_chg', 'vol_ma20'], 1),
+        'wave_bottom': (['close', 'pct_chg', 'ma60'], 1),
+        'no_loss': (['open', 'close', 'low', 'ma250'], 1),
+        'chase_rise': (['close', 'ma20', 'high_max19'], 2),
+        'inst_swing': (['macd'], 3),
+    }
+
+    @staticmethod
+    def build_plan(keys):
+        return fg.FeaturePlan({k: PanelAlphaLogics.REQUIRES[k] for k in keys})
+
+    @staticmethod
+    def logic_macd_bottom(d):
+        diff, dea, macd = d['diff'], d['dea'], d['macd']
+        return (diff < 0) & (ta.shift(diff) < ta.shift(dea)) & (diff > dea) & (macd > ta.shift(macd))
+
+    @staticmethod
+    def logic_duck_head(d):
+        ma_up = (d['ma5'] > d['ma10']) & (d['ma10'] > d['ma60'])
+        vol_shrink = d['volume'] < d['vol_ma5']
+        price_near = (d['ma20'] * 0.98 <= d['close']) & (d['close'] <= d['ma20'] * 1.02)
+        return ma_up & vol_shrink & price_near
+
+    @staticmethod
+    def logic_three_in_one(d):
+        return (d['pct_chg'] > 5) & (d['volume'] > ta.shift(d['volume']) * 1.8) & (d['macd'] > ta.shift(d['macd']))
+
+    @staticmethod
+    def logic_pregnancy_line(d):
+        is_inside = (d['high'] < ta.shift(d['high'])) & (d['low'] > ta.shift(d['low']))
+        return is_inside & (d['volume'] < d['vol_ma10'] * 0.6)
+
+    @staticmethod
+    def logic_single_yang(d):
+        # 前9根K线(不含当日)中最近一根涨幅>6%的阳线，其最低价作为防守位
+        yang_idx = ta.shift(ta.last_true_index(d['pct_chg'] > 6))
+        rows = np.arange(len(yang_idx))[:, None]
+        recent = ~np.isnan(yang_idx) & (yang_idx >= rows - 9)
+        yang_low = ta.take_rows(d['low'], np.where(recent, yang_idx, -1).astype(int))
+        return ~(d['close'] < d['ma250']) & recent & (d['low_min10'] >= yang_low * 0.99)
+
+    @staticmethod
+    def logic_limit_pullback(d):
+        has_limit = ta.shift(ta.window_any(d['pct_chg'] > 9.5, 9)) == 1
+        return has_limit & (d['close'] >= d['ma20']) & (d['volume'] < d['vol_ma5'])
+
+    @staticmethod
+    def logic_golden_pit(d):
+        is_down = ta.shift(d['close'], 9) > ta.shift(d['close'], 2) * 1.08
+        return is_down & (d['pct_chg'] > 3) & (d['volume'] > ta.shift(d['volume']))
+
+    @staticmethod
+    def logic_grass_fly(d):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vol_std = d['vol_std10'] / d['vol_ma10'] < 0.2
+        price_flat = np.abs(d['close'] - d['ma60']) / d['ma60'] < 0.01
+        return vol_std & price_flat
+
+    @staticmethod
+    def logic_limit_break(d):
+        has_limit = ta.shift(ta.window_any(d['pct_chg'] > 9.5, 4)) == 1
+        return has_limit & (ta.shift(d['close']) < ta.shift(d['ma5'])) & (d['close'] > d['ma5'])
+
+    @staticmethod
+    def logic_double_plate(d):
+        return bs.get_matcher('double_plate').match(d)['double_plate']
+
+    @staticmethod
+    def logic_horse_back(d):
+        return (ta.shift(d['pct_chg_max4']) > 7) & (np.abs(d['low'] - d['ma10']) / d['ma10'] < 0.01)
+
+    @staticmethod
+    def logic_hot_money(d):
+        return (d['volume'] > d['vol_ma20'] * 2.5) & (d['pct_chg'] > 4)
+
+    @staticmethod
+    def logic_wave_bottom(d):
+        return ((d['close'] - d['ma60']) / d['ma60'] < -0.15) & (d['pct_chg'] > 0)
+
+    @staticmethod
+    def logic_no_loss(d):
+        return (np.abs(d['low'] - d['ma250']) / d['ma250'] < 0.01) & (d['close'] > d['open'])
+
+    @staticmethod
+    def logic_chase_rise(d):
+        is_break = d['close'] > ta.shift(d['high_max19'])
+        return is_break & (d['ma20'] > ta.shift(d['ma20']))
+
+    @staticmethod
+    def logic_inst_swing(d):
+        macd, macd1, macd2 = d['macd'], ta.shift(d['macd']), ta.shift(d['macd'], 2)
+        return (macd > 0) & (macd1 > 0) & (macd2 > 0) & (macd > macd1) & (macd1 > macd2)
+
 # --- 执行区 ---
-def run_all_strategies():
+def load_name_map():
     name_map = {}
     if os.path.exists(NAMES_FILE):
         name_df = pd.read_csv(NAMES_FILE, dtype={'code': str})
         name_map = dict(zip(name_df['code'], name_df['name']))
+    return name_map
+
+def enabled_strategies():
+    return [k for k in STRATEGY_MAP.keys() if k not in DISABLED_STRATEGIES]
+
+def save_results(all_results, date_str):
+    for s_key, rows in all_results.items():
+        path = STRATEGY_MAP[s_key]
+        if not os.path.exists(path): os.makedirs(path, exist_ok=True)
+        res_df = pd.DataFrame(rows)
+        if not res_df.empty:
+            res_df.to_csv(f"{path}/{s_key}_{date_str}.csv", index=False, encoding='utf-8-sig')
+            print(f"战法 {s_key} 完成，发现 {len(res_df)} 个目标")
+
+def run_panel_strategies():
+    """全市场面板模式：按启用战法的特征计划装载尾部数据，每个特征只算一次，战法都是整矩阵布尔运算"""
+    name_map = load_name_map()
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    keys = enabled_strategies()
+    all_results = {k: [] for k in keys}
+
+    plan = PanelAlphaLogics.build_plan(keys)
+    print(f"特征计划: {plan.describe()}")
+    tail = PANEL_TAIL if plan.max_rows is None else min(PANEL_TAIL, plan.max_rows)
+
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=sorted(set(plan.raw_fields) | {'close'}), tail=tail, min_len=MIN_BARS)
+    t1 = time.perf_counter()
+    values = plan.compute(panel)
+    last_close = panel['close'][-1]
+    eligible = (panel.length >= MIN_BARS) & (last_close >= PRICE_RANGE[0]) & (last_close <= PRICE_RANGE[1])
+    for s_key in keys:
+        hits = getattr(PanelAlphaLogics, f"logic_{s_key}")(plan.view(values, s_key))[-1] & eligible
+        for j in np.flatnonzero(hits):
+            code = panel.codes[j]
+            all_results[s_key].append({'date': date_str, 'code': code, 'name': name_map.get(code, '未知'), 'price': last_close[j]})
+    t2 = time.perf_counter()
+    print(f"面板装载 {panel.shape[1]} 只股票({panel.shape[0]}行)耗时 {t1 - t0:.2f}s，特征与{len(keys)}个战法计算耗时 {(t2 - t1) * 1000:.0f}ms")
+
+    save_results(all_results, date_str)
+
+_PLAN = None
+
+def _init_worker(keys):
+    global _PLAN
+    _PLAN = PanelAlphaLogics.build_plan(keys)
+
+def _tail_hits(df, timings, errors=None):
+    """
+    在已截好尾部的K线上计算计划内特征，每个战法拿到截成自身回看行数的 (K, 1) 尾部视图，
+    只取最后一行结果。errors 为 None 时异常直接抛出。
+    """
+    t0 = time.perf_counter()
+    values = _PLAN.compute({k: pd.to_numeric(df[k], errors='coerce').values for k in _PLAN.raw_fields})
+    timings['features'] = time.perf_counter() - t0
+
+    hits = []
+    for s_key in _PLAN.requirements:
+        t0 = time.perf_counter()
+        try:
+            view = {k: v[:, None] for k, v in _PLAN.view(values, s_key).items()}
+            if getattr(PanelAlphaLogics, f"logic_{s_key}")(view)[-1, 0]:
+                hits.append(s_key)
+        except Exception as e:
+            if errors is None: raise
+            errors.append((s_key, type(e).__name__, str(e)))
+        timings[s_key] = time.perf_counter() - t0
+    return hits
+
+def evaluate_stock(file_path):
+    """
+    单只股票的尾部快速判定：只读取计划需要的最后几百行，特征算一次。
+    返回 (code, price, 命中战法, {战法: 耗时秒}, [(阶段, 异常类型, 信息)])
+    """
+    code = os.path.basename(file_path).split('.')[0]
+    timings, errors = {}, []
+    try:
+        tail = PANEL_TAIL if _PLAN.max_rows is None else min(PANEL_TAIL, _PLAN.max_rows)
+        df, length = pe.read_stock_csv(file_path, tail)
+        if length < MIN_BARS or df.empty: return code, None, [], timings, errors
+        curr_c = float(df['close'].iloc[-1])
+        if not (PRICE_RANGE[0] <= curr_c <= PRICE_RANGE[1]): return code, None, [], timings, errors
+    except Exception as e:
+        errors.append(('load', type(e).__name__, str(e)))
+        return code, None, [], timings, errors
+    return code, curr_c, _tail_hits(df, timings, errors), timings, errors
+
+def evaluate(df, code, name=None):
+    """统一调度器入口：df 为已截取最近 PANEL_TAIL 根的原始K线，返回当日命中的战法"""
+    if _PLAN is None: _init_worker(enabled_strategies())
+    df = pe.normalize_columns(df)
+    if len(df) < MIN_BARS: return None
+    curr_c = float(df['close'].iloc[-1])
+    if not (PRICE_RANGE[0] <= curr_c <= PRICE_RANGE[1]): return None
+    hits = _tail_hits(df, {})
+    return {'code': code, 'price': curr_c, 'hits': hits} if hits else None
+
+def save_hits(found, names_df):
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    name_map = dict(zip(names_df['code'], names_df['name']))
+    all_results = {k: [] for k in enabled_strategies()}
+    for r in found:
+        for s_key in r['hits']:
+            all_results[s_key].append({'date': date_str, 'code': r['code'], 'name': name_map.get(r['code'], '未知'), 'price': r['price']})
+    save_results(all_results, date_str)
+
+STRATEGY = sr.register('market_beast', evaluate, save_hits, lookback=PANEL_TAIL)
+
+def report_errors(errors):
+    if not errors: return
+    by_stage = Counter((stage, kind) for _, (stage, kind, _) in errors)
+    print(f"⚠️ {len({code for code, _ in errors})} 只股票处理出错，共 {len(errors)} 次:")
+    for (stage, kind), n in by_stage.most_common():
+        print(f"  [{stage}] {kind}: {n} 次")
+    for code, (stage, kind, msg) in errors[:5]:
+        print(f"  例: {code} [{stage}] {kind}: {msg}")
+
+def run_parallel_strategies():
+    """多进程尾部快速路径：逐文件读取但只在尾部视图上判定，附带各战法耗时与错误统计"""
+    name_map = load_name_map()
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    keys = enabled_strategies()
+    all_results = {k: [] for k in keys}
+
+    files = sorted(glob.glob(f"{DATA_DIR}/*.csv"))
+    t0 = time.perf_counter()
+    timings, errors, scanned = defaultdict(float), [], 0
+    with Pool(processes=cpu_count(), initializer=_init_worker, initargs=(keys,)) as pool:
+        for code, price, hits, cost, errs in pool.imap_unordered(evaluate_stock, files, chunksize=POOL_CHUNKSIZE):
+            for k, v in cost.items():
+                timings[k] += v
+            errors.extend((code, e) for e in errs)
+            if price is None: continue
+            scanned += 1
+            for s_key in hits:
+                all_results[s_key].append({'date': date_str, 'code': code, 'name': name_map.get(code, '未知'), 'price': price})
+    print(f"并行扫描 {len(files)} 个文件 (有效 {scanned} 只) 耗时 {time.perf_counter() - t0:.2f}s，进程数 {cpu_count()}")
+    print(f"  特征计算累计 {timings.pop('features', 0) * 1000:.0f}ms")
+    for s_key, cost in sorted(timings.items(), key=lambda kv: -kv[1]):
+        print(f"  {s_key:<16}累计 {cost * 1000:.0f}ms")
+    report_errors(errors)
+
+    for k in all_results:
+        all_results[k].sort(key=lambda r: r['code'])
+    save_results(all_results, date_str)
+
+def run_all_strategies():
+    name_map = load_name_map()
 
     files = glob.glob(f"{DATA_DIR}/*.csv")
     date_str = datetime.now().strftime('%Y-%m-%d')
-    all_results = {k: [] for k in STRATEGY_MAP.keys()}
+    all_results = {k: [] for k in enabled_strategies()}
 
+    errors = []
     for f in files:
+        code = os.path.basename(f).replace('.csv','')
         try:
             df = pd.read_csv(f)
-            if len(df) < 250: continue
-            df = df.rename(columns={'日期':'date','股票代码':'code','开盘':'open','收盘':'close','成交量':'volume','涨跌幅':'pct_chg','换手率':'turnover'})
-            code = os.path.basename(f).replace('.csv','')
-            
+            if len(df) < MIN_BARS: continue
+            df = df.rename(columns={'日期':'date','股票代码':'code','开盘':'open','收盘':'close','最高':'high','最低':'low','成交量':'volume','涨跌幅':'pct_chg','换手率':'turnover'})
+
             # 基础通用过滤
             curr_c = df['close'].iloc[-1]
-            if not (5.0 <= curr_c <= 35.0): continue
+            if not (PRICE_RANGE[0] <= curr_c <= PRICE_RANGE[1]): continue
             
-            df = AlphaLogics.get_indicators(df)
-            for s_key in STRATEGY_MAP.keys():
+            df = AlphaLogics.get_indicators(df, code)
+            for s_key in all_results.keys():
                 if getattr(AlphaLogics, f"logic_{s_key}")(df):
                     all_results[s_key].append({'date': date_str, 'code': code, 'name': name_map.get(code, '未知'), 'price': curr_c})
-        except: continue
+        except Exception as e:
+            errors.append((code, ('serial', type(e).__name__, str(e))))
+    report_errors(errors)
 
     # 保存
-    for s_key, path in STRATEGY_MAP.items():
-        if not os.path.exists(path): os.makedirs(path, exist_ok=True)
-        res_df = pd.DataFrame(all_results[s_key])
-        if not res_df.empty:
-            res_df.to_csv(f"{path}/{s_key}_{date_str}.csv", index=False, encoding='utf-8-sig')
-            print(f"战法 {s_key} 完成，发现 {len(res_df)} 个目标")
+    save_results(all_results, date_str)
 
 if __name__ == "__main__":
-    run_all_strategies()
+    if ENGINE_MODE == 'panel':
+        run_panel_strategies()
+    elif ENGINE_MODE == 'parallel':
+        run_parallel_strategies()
+    else:
+        run_all_strategies()
@@ -0,0 +1,167 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import indicators as ta
+import panel_engine as pe
+import event_index as ei
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+BREADTH_FILE = 'results/market_breadth/market_breadth.csv'   # 每个交易日一行，增量追加
+CHUNK_SIZE = 300             # 全量计算时每批装载的股票数，控制内存
+HIGH_LOW_WINDOWS = [20, 60, 250]
+MA_WINDOWS = [20, 60]
+LADDER_MAX = 5               # 连板梯队：1~4 板分别计数，5 板及以上合并
+RECENT_DAYS = 10             # 每次增量重算表里最近几个交易日 (个股数据晚到时自动补齐)
+
+# 涨跌停幅度与 event_index 相同 (按代码前缀区分板块，涨幅 > 幅度 - 容差视为涨停)
+COUNT_COLUMNS = (['n', 'up', 'down', 'flat', 'limit_up', 'limit_down']
+                 + [f'board{k}' for k in range(1, LADDER_MAX)] + [f'board{LADDER_MAX}p']
+                 + [f'{kind}{w}' for w in HIGH_LOW_WINDOWS for kind in ('high', 'low')]
+                 + [f'{kind}{w}' for w in MA_WINDOWS for kind in ('above_ma', 'n_ma')])
+EPOCH = np.datetime64('1990-01-01', 'D')
+
+
+def _days(dates):
+    """日期字符串 (缺失为 None) -> 距 EPOCH 的天数，缺失为 -1"""
+    flat = np.asarray(dates, dtype=object).ravel()
+    ok = np.array([d is not None for d in flat])
+    out = np.full(len(flat), -1, dtype=np.int64)
+    out[ok] = (np.asarray(flat[ok].astype(str), dtype='datetime64[D]') - EPOCH).astype(np.int64)
+    return out.reshape(np.shape(dates))
+
+
+def bar_metrics(panel):
+    """
+    右对齐面板上每只股票每根K线的计数项 {列名: (T, N) 数组}，以及连板数 (T, N)。
+    新高/新低指最高价突破 (最低价跌破) 之前 w 根K线的最高 (最低)，至少要有 w 根历史；
+    均线取 6 位小数再与收盘价比较 (全历史与尾部面板的滑动求和顺序不同，避免恰好相等时判断翻转)。
+    """
+    close, high, low, pct = panel['close'], panel['high'], panel['low'], panel['pct_chg']
+    valid = panel.mask
+    limit = np.array([ei.limit_pct(c) for c in panel.codes]) - ei.LIMIT_TOLERANCE
+    with np.errstate(invalid='ignore'):
+        limit_up = pct > limit
+        out = {'n': valid, 'up': pct > 0, 'down': pct < 0, 'flat': pct == 0,
+               'limit_up': limit_up, 'limit_down': pct < -limit}
+        rows = np.arange(len(close))[:, None]
+        last_break = np.maximum.accumulate(np.where(limit_up, -1, rows), axis=0)
+        streak = np.where(limit_up, rows - last_break, 0)
+        for k in range(1, LADDER_MAX):
+            out[f'board{k}'] = streak == k
+        out[f'board{LADDER_MAX}p'] = streak >= LADDER_MAX
+        for w in HIGH_LOW_WINDOWS:
+            out[f'high{w}'] = high > ta.shift(ta.rolling_max(high, w))
+            out[f'low{w}'] = low < ta.shift(ta.rolling_min(low, w))
+        for w in MA_WINDOWS:
+            ma = np.round(ta.rolling_mean(close, w), 6)
+            out[f'above_ma{w}'] = close > ma
+            out[f'n_ma{w}'] = ~np.isnan(ma)
+    return out, streak
+
+
+def aggregate(panel, since=-1):
+    """把面板上日期 (天数) > since 的K线按交易日汇总，返回 DataFrame (索引为天数)"""
+    days = _days(panel.dates)
+    keep = panel.mask & (days > since)
+    d = days[keep]
+    if not len(d):
+        return pd.DataFrame(columns=COUNT_COLUMNS + ['max_board'])
+    base = d.min()
+    size = d.max() - base + 1
+    metrics, streak = bar_metrics(panel)
+    out = {name: np.bincount(d - base, weights=m[keep], minlength=size) for name, m in metrics.items()}
+    top = np.zeros(size)
+    np.maximum.at(top, d - base, streak[keep])
+    out['max_board'] = top
+    df = pd.DataFrame(out, index=np.arange(base, base + size))
+    return df[df['n'] > 0]
+
+
+def _merge(parts):
+    """各批股票的汇总相加 (最高连板取最大)"""
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return pd.DataFrame(columns=COUNT_COLUMNS + ['max_board'])
+    counts = pd.concat([p[COUNT_COLUMNS] for p in parts]).groupby(level=0).sum()
+    counts['max_board'] = pd.concat([p['max_board'] for p in parts]).groupby(level=0).max()
+    return counts
+
+
+def finalize(counts):
+    """天数索引 -> 日期列，计数转整数，补充占比列"""
+    out = counts.astype(np.int64)
+    out.insert(0, 'date', (EPOCH + out.index.values.astype('timedelta64[D]')).astype(str))
+    for w in MA_WINDOWS:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[f'pct_above_ma{w}'] = np.round(out[f'above_ma{w}'] / out[f'n_ma{w}'] * 100, 2)
+    return out.reset_index(drop=True)
+
+
+def build_full(data_dir=DATA_DIR):
+    """全历史一次计算：分批装载全部股票，逐批汇总后相加"""
+    codes = sorted(f.split('.')[0] for f in os.listdir(data_dir) if f.endswith('.csv') and f.split('.')[0].isdigit())
+    parts = []
+    for i in range(0, len(codes), CHUNK_SIZE):
+        panel = pe.load_panel(data_dir, codes=codes[i:i + CHUNK_SIZE], fields=['high', 'low', 'close', 'pct_chg'],
+                              align='bar')
+        parts.append(aggregate(panel))
+    return finalize(_merge(parts))
+
+
+def update(table, data_dir=DATA_DIR):
+    """
+    增量：只装载每只股票最近的K线，重算表里最后 RECENT_DAYS 个交易日之后的行并追加新交易日。
+    若某只股票在这段时间的K线多到超出尾部窗口 (很久没更新)，返回 None 由调用方全量重算。
+    """
+    tail = max(HIGH_LOW_WINDOWS + MA_WINDOWS) + 1 + RECENT_DAYS * 3
+    since = int(_days([table['date'].iloc[-RECENT_DAYS - 1]])[0]) if len(table) > RECENT_DAYS else -1
+    if since < 0:
+        return None
+    panel = pe.load_panel(data_dir, fields=['high', 'low', 'close', 'pct_chg'], tail=tail, align='bar')
+    recent = ((_days(panel.dates) > since) & panel.mask).sum(axis=0)
+    if (recent > tail - max(HIGH_LOW_WINDOWS + MA_WINDOWS) - 1).any():
+        return None
+    fresh = finalize(aggregate(panel, since))
+    return pd.concat([table[table['date'] <= table['date'].iloc[-RECENT_DAYS - 1]], fresh], ignore_index=True)
+
+
+def load_table(path=BREADTH_FILE):
+    """读取市场宽度表 (按日期排序)；不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype={'date': str})
+
+
+def market_regime(date=None, path=BREADTH_FILE):
+    """某个交易日 (默认最新) 的市场宽度一行 Series，供扫描脚本/报告按市场环境过滤或标注"""
+    table = load_table(path)
+    if table is None or table.empty:
+        return None
+    if date is not None:
+        table = table[table['date'] <= str(date)[:10]]
+    return table.iloc[-1] if len(table) else None
+
+
+def main():
+    t0 = time.perf_counter()
+    table = load_table()
+    out = update(table) if table is not None and list(table.columns[1:len(COUNT_COLUMNS) + 1]) == COUNT_COLUMNS else None
+    mode = '增量'
+    if out is None:
+        out, mode = build_full(), '全量'
+    os.makedirs(os.path.dirname(BREADTH_FILE) or '.', exist_ok=True)
+    tmp = BREADTH_FILE + '.tmp'
+    out.to_csv(tmp, index=False)
+    os.replace(tmp, BREADTH_FILE)
+    last = out.iloc[-1]
+    print(f"市场宽度{mode}更新完成：{len(out)} 个交易日 ({out['date'].iloc[0]} ~ {last['date']})，"
+          f"耗时 {time.perf_counter() - t0:.1f}s")
+    print(f"  {last['date']}：{last['n']} 只，涨 {last['up']} / 跌 {last['down']}，"
+          f"涨停 {last['limit_up']} / 跌停 {last['limit_down']}，最高 {last['max_board']} 板，"
+          f"20日新高 {last['high20']} / 新低 {last['low20']}，站上MA20 {last['pct_above_ma20']}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+from indicators import last_valid_index
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+
+# 字段映射 (CSV中文表头 -> 面板字段名)
+COL_MAP = {
+    '日期': 'date', '开盘': 'open', '收盘': 'close', '最高': 'high', '最低': 'low',
+    '成交量': 'volume', '成交额': 'amount', '振幅': 'amplitude',
+    '涨跌幅': 'pct_chg', '涨跌额': 'change', '换手率': 'turnover'
+}
+PRICE_FIELDS = ['open', 'close', 'high', 'low', 'volume', 'amount', 'amplitude', 'pct_chg', 'change', 'turnover']
+
+
+class Panel:
+    """
+    全市场面板：所有字段都是 (T, N) 的二维数组，行是时间，列是股票。
+    - align='bar'  : 按各股自身最后一根K线右对齐，第 -1 行就是每只股票的最新一根K线，
+                     与单票脚本里 iloc[-1] 的语义完全一致，适合当日扫描。
+    - align='date' : 按交易日对齐，停牌/未上市位置为 NaN，适合横截面统计。
+    缺失位置统一为 NaN，mask 标记有效K线；length 记录每只股票文件里的真实K线总数
+    (加载时截取 tail 也不影响“上市天数”类过滤)。
+    """
+
+    def __init__(self, codes, dates, fields, length, align):
+        self.codes = list(codes)
+        self.dates = dates
+        self.fields = fields
+        self.length = length
+        self.align = align
+        self.mask = ~np.isnan(fields['close'])
+        self.col_index = {c: i for i, c in enumerate(self.codes)}
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    @property
+    def shape(self):
+        return self.fields['close'].shape
+
+    def last_dates(self):
+        """每只股票最新一根K线的日期"""
+        if self.align == 'bar':
+            return self.dates[-1]
+        idx = last_valid_index(self.mask)
+        return np.where(idx >= 0, self.dates[np.maximum(idx, 0)], None)
+
+    def column(self, code):
+        """取出单只股票的全部字段，返回 DataFrame (仅有效K线)"""
+        j = self.col_index[code]
+        valid = self.mask[:, j]
+        data = {k: v[valid, j] for k, v in self.fields.items()}
+        dates = self.dates[valid, j] if self.align == 'bar' else self.dates[valid]
+        return pd.DataFrame(data, index=pd.Index(dates, name='date'))
+
+
+def normalize_columns(df):
+    """中文表头统一为英文字段名，涨跌幅去掉百分号"""
+    df = df.rename(columns=COL_MAP)
+    if 'pct_chg' in df.columns and df['pct_chg'].dtype == object:
+        df['pct_chg'] = df['pct_chg'].str.replace('%', '').astype(float)
+    return df
+
+
+def read_stock_csv(file_path, tail=None):
+    """读取单只股票CSV并统一为英文字段名"""
+    df = normalize_columns(pd.read_csv(file_path))
+    length = len(df)
+    if tail is not None:
+        df = df.iloc[-tail:]
+    return df, length
+
+
+def load_panel(data_dir=DATA_DIR, codes=None, fields=None, tail=None, align='bar', min_len=1):
+    """
+    一次性把整个股票池装载成对齐的二维数组。
+    tail: 只保留每只股票最近 tail 根K线 (None 为全部历史)；
+          EMA 类指标在 500 根以上的预热后与全历史结果误差可忽略。
+    """
+    fields = fields or PRICE_FIELDS
+    if codes is None:
+        files = sorted(glob.glob(os.path.join(data_dir, '*.csv')))
+    else:
+        files = [os.path.join(data_dir, f"{c}.csv") for c in codes]
+
+    frames, lengths, names = [], [], []
+    for f in files:
+        code = os.path.basename(f).split('.')[0]
+        if not code.isdigit(): continue
+        try:
+            df, length = read_stock_csv(f, tail)
+        except Exception:
+            continue
+        if length < min_len or df.empty: continue
+        frames.append(df)
+        lengths.append(length)
+        names.append(code)
+
+    if not frames:
+        raise ValueError(f"{data_dir} 中没有可用的股票数据")
+
+    n = len(frames)
+    if align == 'bar':
+        t = max(len(df) for df in frames)
+        dates = np.full((t, n), None, dtype=object)
+        out = {k: np.full((t, n), np.nan) for k in fields}
+        for j, df in enumerate(frames):
+            m = len(df)
+            dates[t - m:, j] = df['date'].astype(str).values
+            for k in fields:
+                if k in df.columns:
+                    out[k][t - m:, j] = pd.to_numeric(df[k], errors='coerce').values
+    elif align == 'date':
+        dates = np.array(sorted(set().union(*(df['date'].astype(str) for df in frames))), dtype=object)
+        pos = {d: i for i, d in enumerate(dates)}
+        out = {k: np.full((len(dates), n), np.nan) for k in fields}
+        for j, df in enumerate(frames):
+            rows = np.fromiter((pos[d] for d in df['date'].astype(str)), dtype=np.int64, count=len(df))
+            for k in fields:
+                if k in df.columns:
+                    out[k][rows, j] = pd.to_numeric(df[k], errors='coerce').values
+    else:
+        raise ValueError(f"未知的对齐方式: {align}")
+
+    return Panel(names, dates, out, np.array(lengths), align)
@@ -0,0 +1,246 @@
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import indicators as ta
+import feature_graph as fg
+import panel_engine as pe
+import strategy_registry as sr
+import stock_scanner_go as go
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/param_sweep'
+TIER = '2-极致缩量潜伏'        # 只回放扫描器的这一档 (见 PARAMS 上方说明)，输出文件与报告都带此标注
+CHUNK_SIZE = 300             # 每批装载的股票数 (KDJ 为递推指标，需要全部历史)
+HISTORY = 250                # 把最近多少根K线逐日当作“扫描日”回放
+MIN_BARS = 60                # 与扫描器一致：不足 60 根K线的不参与
+FORWARD = [5, 10, 20]        # 前瞻收益的持有K线数
+SORT_BY = 'mean10'           # 结果排序指标 (mean/win + 持有K线数)
+MIN_HITS = 30                # 命中次数不足的组合不参与排序
+TOP_N = 200                  # 输出前多少个组合
+RANDOM_SAMPLES = 2000        # 随机搜索的组合数 (0 为不做)，阈值在网格上下界之间均匀抽取
+RANDOM_SEED = 0
+
+# stock_scanner_go 的阈值门槛 (与 stock_scanner_w 同一套参数)：(参数名, 特征, 方向, 取值网格)
+# 方向 'min' 表示 特征 >= 参数，'max' 表示 特征 <= 参数；扫描器当前取值会自动并入网格作为基准。
+# 扫描器是分档的：0/1 档不看量比、涨跌幅和空间，3 档写死量比 <= 1.1、空间 >= 10，都不是这组阈值的“与”；
+# 只有 2 档恰好是全部阈值同时满足，因此回放只统计 2 档：先入 0/1 档的格子剔除 (见 derive)，3 档不计。
+PARAMS = [
+    ('MIN_PRICE', 'close', 'min', [3, 5, 8]),
+    ('MAX_AVG_TURNOVER_30', 'turnover_ma30', 'max', [1.5, 2.5, 3.5, 5]),
+    ('MIN_VOLUME_RATIO', 'vol_ratio', 'min', [0, 0.2, 0.4]),
+    ('MAX_VOLUME_RATIO', 'vol_ratio', 'max', [0.7, 0.85, 1.05, 1.3]),
+    ('MAX_TODAY_CHANGE', 'abs_change', 'max', [1, 1.5, 2, 3]),
+    ('RSI6_MAX', 'rsi6', 'max', [15, 20, 25, 30, 35]),
+    ('RSI14_MAX', 'rsi14', 'max', [30, 35, 40, 50]),
+    ('KDJ_K_MAX', 'kdj_k', 'max', [20, 30, 40]),
+    ('MIN_PROFIT_POTENTIAL', 'potential', 'min', [5, 10, 15, 20]),
+]
+
+_PLAN = fg.FeaturePlan({'sweep': (['close', 'pct_chg', 'volume', 'turnover_ma30', 'vol_ma5', 'ma5', 'ma60', 'rsi6',
+                                   'rsi14', 'kdj_k', 'kdj_d', 'macd'], HISTORY + 1)})
+
+
+def _pad(arr, rows):
+    """不足 rows 行的 (t, N) 数组在顶部补 NaN"""
+    if len(arr) >= rows:
+        return arr[-rows:]
+    return np.vstack([np.full((rows - len(arr),) + arr.shape[1:], np.nan), arr])
+
+
+def derive(values, length, history=HISTORY):
+    """
+    由特征计划的输出 (最后 history + 1 行) 得到扫描器口径的判定量，各为 (history, N)：
+    量比 = 成交量 / 前一日的5日均量，空间 = 距60日线的百分比，abs_change = 当日涨跌幅绝对值。
+    另给出 eligible (截至当日已有 MIN_BARS 根K线，且不会先被扫描器的 0/1 档选走) 与各持有期的前瞻收益 (超出数据末尾为 NaN)。
+    30日均换手缺失时扫描器的提前淘汰不生效 (NaN 比较为假)，这里记为 -inf 以同样放行。
+    """
+    v = {k: _pad(x, history + 1) for k, x in values.items()}
+    close = v['close'][1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = {
+            'close': close,
+            'turnover_ma30': np.where(np.isnan(v['turnover_ma30'][1:]), -np.inf, v['turnover_ma30'][1:]),
+            'vol_ratio': v['volume'][1:] / v['vol_ma5'][:-1],
+            'abs_change': np.abs(v['pct_chg'][1:]),
+            'rsi6': v['rsi6'][1:], 'rsi14': v['rsi14'][1:], 'kdj_k': v['kdj_k'][1:],
+            'potential': (v['ma60'][1:] - close) / close * 100,
+        }
+        bars = np.asarray(length)[None, :] - np.arange(history)[::-1, None]
+        # 0/1 档只要求超跌 (已在阈值内)，其余条件与这组参数无关：满足的格子在扫描器里不会落到 2 档
+        improving = v['macd'][1:] > v['macd'][:-1]
+        ignite = (close > v['ma5'][1:]) & (v['volume'][1:] > v['volume'][:-1]) & (out['vol_ratio'] > 0.6) & improving
+        golden = (v['kdj_k'][1:] > v['kdj_d'][1:]) & (v['kdj_k'][:-1] <= v['kdj_d'][:-1]) & improving
+        out['eligible'] = (bars >= MIN_BARS) & ~ignite & ~golden
+        # 前瞻收益按之后各K线的涨跌幅复利 (不受复权口径变化造成的价格断层影响)，跌幅 >= 100% 的坏数据记为缺失
+        pct = v['pct_chg'][1:]
+        log_ret = np.log1p(np.where(pct > -100, pct, np.nan) / 100)
+        fwd = {}
+        for h in FORWARD:
+            later = np.full_like(log_ret, np.nan)
+            later[:-h] = ta.rolling_sum(log_ret, h)[h:]
+            fwd[h] = np.expm1(later)
+    return out, fwd
+
+
+def load_features(data_dir=DATA_DIR, names_file=NAMES_FILE, history=HISTORY):
+    """全市场分批装载，特征只算一次；返回 (判定量字典, 前瞻收益字典, 代码列表, 扫描日范围)"""
+    names = sr.load_names(names_file)
+    st = set(names.loc[names['name'].astype(str).str.upper().str.contains('ST'), 'code'])
+    codes = [c for c in sorted(f.split('.')[0] for f in os.listdir(data_dir)
+                               if f.endswith('.csv') and f.split('.')[0].isdigit()) if c not in st]
+    parts, fwd_parts, span = [], [], []
+    for i in range(0, len(codes), CHUNK_SIZE):
+        panel = pe.load_panel(data_dir, codes=codes[i:i + CHUNK_SIZE], fields=_PLAN.raw_fields, align='bar')
+        feats, fwd = derive(_PLAN.view(_PLAN.compute(panel), 'sweep'), panel.length, history)
+        parts.append(feats)
+        fwd_parts.append(fwd)
+        span.append(panel.dates[-history:][panel.mask[-history:]])
+    feats = {k: np.hstack([p[k] for p in parts]) for k in parts[0]}
+    fwd = {h: np.hstack([p[h] for p in fwd_parts]) for h in FORWARD}
+    dates = np.concatenate(span)
+    return feats, fwd, codes, (min(dates), max(dates))
+
+
+def _grids(params=PARAMS):
+    """每个参数的升序网格 (并入扫描器当前取值)"""
+    return [np.array(sorted(set(grid) | {getattr(go, name)}), dtype=float) for name, _, _, grid in params]
+
+
+def _candidates(feats, params=PARAMS, bounds=None):
+    """
+    在最宽松阈值下仍可能命中的格子 (股票 × 扫描日)，返回 (行号, 各参数对应特征的矩阵 (C, P))。
+    bounds 为每个参数的 (下界, 上界)；缺省取网格端点。
+    """
+    bounds = bounds or [(g[0], g[-1]) for g in _grids(params)]
+    ok = feats['eligible'].ravel().copy()
+    for (name, feat, side, _), (lo, hi) in zip(params, bounds):
+        x = feats[feat].ravel()
+        with np.errstate(invalid='ignore'):
+            ok &= (x >= lo) if side == 'min' else (x <= hi)
+    cells = np.flatnonzero(ok)
+    return cells, np.stack([feats[feat].ravel()[cells] for _, feat, _, _ in params], axis=1)
+
+
+def _stats(hits, sums, table):
+    """按持有期把 (样本数, 收益和, 上涨数) 转成平均收益 (%) 与胜率 (%) 列"""
+    table['hits'] = hits.astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for h in FORWARD:
+            n, total, wins = sums[h]
+            table[f'n{h}'] = n.astype(np.int64)
+            table[f'mean{h}'] = np.round(total / n * 100, 3)
+            table[f'win{h}'] = np.round(wins / n * 100, 1)
+    return table
+
+
+def sweep_grid(feats, fwd, params=PARAMS):
+    """
+    全网格一次算完：把每个格子换算成“每个参数最严要到第几档才放行”的下标 (宽松方向下标递增)，
+    按下标向量做多维直方图，再沿每个参数轴累加，任一组合的命中数/收益和即为该下标以内的累计值。
+    开销只与格子数和网格大小成正比，与组合数无关的逐个比较。
+    """
+    grids = _grids(params)
+    cells, X = _candidates(feats, params)
+    shape = tuple(len(g) for g in grids)
+    need = np.empty((len(params), len(cells)), dtype=np.int64)
+    for j, ((name, feat, side, _), g) in enumerate(zip(params, grids)):
+        if side == 'max':
+            need[j] = np.searchsorted(g, X[:, j], side='left')
+        else:
+            need[j] = len(g) - np.searchsorted(g, X[:, j], side='right')
+    flat = np.ravel_multi_index(need, shape)
+    size = int(np.prod(shape))
+
+    def cumulative(weights=None):
+        hist = np.bincount(flat, weights=weights, minlength=size).reshape(shape)
+        for axis in range(len(shape)):
+            hist = np.cumsum(hist, axis=axis)
+        return hist.ravel()
+
+    sums = {}
+    for h in FORWARD:
+        r = fwd[h].ravel()[cells]
+        valid = ~np.isnan(r)
+        sums[h] = (cumulative(valid.astype(float)), cumulative(np.where(valid, r, 0.0)),
+                   cumulative((r > 0).astype(float)))
+    mesh = np.meshgrid(*[g if side == 'max' else g[::-1] for (_, _, side, _), g in zip(params, grids)],
+                       indexing='ij')
+    table = pd.DataFrame({name: m.ravel() for (name, _, _, _), m in zip(params, mesh)})
+    return _stats(cumulative(), sums, table)
+
+
+def evaluate(feats, fwd, combos, params=PARAMS, batch=256):
+    """
+    直接广播比较：combos 为 (组合数, 参数数) 的阈值矩阵 (可取网格以外的任意值)，
+    每批组合与全部候选格子一次比较，返回与 sweep_grid 同列的表。
+    """
+    combos = np.asarray(combos, dtype=float)
+    cells, X = _candidates(feats, params, [(c.min(), c.max()) for c in combos.T])
+    side_max = np.array([side == 'max' for _, _, side, _ in params])
+    R = {h: fwd[h].ravel()[cells] for h in FORWARD}
+    W = {h: np.stack([~np.isnan(r), np.nan_to_num(r), r > 0], axis=1).astype(float) for h, r in R.items()}
+    hits = np.zeros(len(combos))
+    sums = {h: np.zeros((3, len(combos))) for h in FORWARD}
+    with np.errstate(invalid='ignore'):
+        for s in range(0, len(combos), batch):
+            P = combos[s:s + batch]
+            ok = np.where(side_max, X[None] <= P[:, None], X[None] >= P[:, None]).all(axis=2).astype(float)
+            hits[s:s + batch] = ok.sum(axis=1)
+            for h in FORWARD:
+                sums[h][:, s:s + batch] = (ok @ W[h]).T
+    table = pd.DataFrame(combos, columns=[name for name, _, _, _ in params])
+    return _stats(hits, {h: tuple(v) for h, v in sums.items()}, table)
+
+
+def random_search(feats, fwd, n=RANDOM_SAMPLES, params=PARAMS, seed=RANDOM_SEED):
+    """在网格上下界之间均匀随机抽取 n 组阈值并评估 (价格/比例保留两位小数，便于回填到扫描器)"""
+    rng = np.random.default_rng(seed)
+    combos = np.stack([np.round(rng.uniform(g[0], g[-1], n), 2) for g in _grids(params)], axis=1)
+    return evaluate(feats, fwd, combos, params)
+
+
+def rank(table, sort_by=SORT_BY, min_hits=MIN_HITS, top=TOP_N):
+    """命中数达标的组合按指标降序取前 top 个"""
+    n_col = 'n' + ''.join(ch for ch in sort_by if ch.isdigit())
+    return table[table[n_col] >= min_hits].sort_values([sort_by, 'hits'], ascending=False).head(top)
+
+
+def main():
+    t0 = time.perf_counter()
+    feats, fwd, codes, (first, last) = load_features()
+    t1 = time.perf_counter()
+    print(f"特征计算完成：{len(codes)} 只 × {HISTORY} 个扫描日 ({first} ~ {last})，耗时 {t1 - t0:.1f}s")
+
+    grid = sweep_grid(feats, fwd)
+    t2 = time.perf_counter()
+    print(f"网格评估：{len(grid)} 组参数，耗时 {t2 - t1:.2f}s")
+    base = np.ones(len(grid), dtype=bool)
+    for name, _, _, _ in PARAMS:
+        base &= grid[name] == getattr(go, name)
+    cols = ['hits'] + [f'{k}{h}' for h in FORWARD for k in ('mean', 'win')]
+    print(f"当前参数 (stock_scanner_go {TIER} 档)：" + '，'.join(f"{c}={grid.loc[base, c].iloc[0]}" for c in cols))
+
+    frames = {'grid': rank(grid)}
+    if RANDOM_SAMPLES:
+        rand = random_search(feats, fwd)
+        print(f"随机搜索：{len(rand)} 组参数，耗时 {time.perf_counter() - t2:.2f}s")
+        frames['random'] = rank(rand)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    for kind, table in frames.items():
+        if table.empty:
+            print(f"{kind}: 没有命中数 >= {MIN_HITS} 的组合")
+            continue
+        path = os.path.join(OUTPUT_DIR, f"param_sweep_tier2_{kind}_{stamp}.csv")
+        table.to_csv(path, index=False, encoding='utf-8-sig')
+        print(f"\n{kind} 前 10 ({TIER} 档，按 {SORT_BY}，命中 >= {MIN_HITS})，全部 {len(table)} 行已写入 {path}")
+        print(table.head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import numpy as np
+import indicators as ta
+
+# =====================================================================
+# 形态检测的数组内核：输入按时间排列的一维数组 (单只股票) 或 (T, N) 面板，
+# 一次性给出每一根K线上形态是否成立的布尔数组，最后一个元素即当日信号，
+# 整列可直接用于全历史回测。各内核与对应脚本中的逐K线循环逐位一致。
+# =====================================================================
+
+
+def _lags(x, n):
+    """(n+1, T, ...) 的滞后栈，第 k 层等于 ta.shift(x, k)，前端补 NaN"""
+    x = np.asarray(x, dtype=float)
+    padded = np.concatenate([np.full((n,) + x.shape[1:], np.nan), x])
+    return np.stack([padded[n - k:n - k + len(x)] for k in range(n + 1)])
+
+
+def _lt(a, b):
+    """a < b，NaN 一律为 False (与逐元素 Python 比较一致)"""
+    with np.errstate(invalid='ignore'):
+        return np.asarray(a) < np.asarray(b)
+
+
+def _rows(x):
+    idx = np.arange(len(x))
+    return idx.reshape((-1,) + (1,) * (np.ndim(x) - 1))
+
+
+def geshan_daniu(open_, high, low, close, vol, pct, min_bars=30):
+    """
+    隔山打牛 (geshan_daniu_filter.check_geshan_daniu)：
+    2~13 根K线前出现“涨停次日的放量阴”(量能为含自身在内21根K线的最高)，此后最低价从未跌破它的最低价；
+    其后先出现阳线、再出现缩量阴(量 < 放量阴的60%)，当日收盘突破最近一根缩量阴的最高价。
+    """
+    close = np.asarray(close, dtype=float)
+    vol = np.asarray(vol, dtype=float)
+    with np.errstate(invalid='ignore'):
+        big_yin = (ta.shift(pct) > 9.5) & (close < np.asarray(open_, dtype=float)) & (vol == ta.rolling_max(vol, 21))
+        L_big = _lags(big_yin, 13) == 1
+        L_low, L_vol, L_high = _lags(low, 13), _lags(vol, 13), _lags(high, 13)
+        L_close, L_open = _lags(close, 13), _lags(open_, 13)
+        L_yang, L_yin = L_close > L_open, L_close < L_open
+
+        hit = np.zeros(close.shape, dtype=bool)
+        for i in range(2, 14):
+            broken = _lt(L_low[:i], L_low[i]).any(axis=0)
+            between = np.arange(i - 1, 0, -1)              # 放量阴之后到昨日，按时间先后
+            seen_yang = np.logical_or.accumulate(L_yang[between], axis=0)
+            small = seen_yang & L_yin[between] & _lt(L_vol[between], L_vol[i] * 0.6)
+            last = len(between) - 1 - np.argmax(small[::-1], axis=0)   # 最近一根缩量阴
+            small_high = np.take_along_axis(L_high[between], last[None], axis=0)[0]
+            hit |= L_big[i] & ~broken & small.any(axis=0) & (close > small_high)
+    return hit & (_rows(close) >= min_bars - 1)
+
+
+def dragon_returns(close, vol, pct, ma20, min_bars=40):
+    """
+    龙回头 (dragon_returns_filter.check_dragon_logic)：
+    4~23 根K线前结束的某个11根窗口内涨幅 >= 50% 且涨停(>9.5%) >= 3 次，取最近的一段；
+    当前回撤为该段涨幅的 30%~55%，收盘不低于 MA20 的 98%，最近3日均量不超过上涨段均量的 55%。
+    """
+    close, vol, ma20 = (np.asarray(a, dtype=float) for a in (close, vol, ma20))
+    limit_cnt = ta.rolling_sum((np.nan_to_num(np.asarray(pct, dtype=float), nan=0.0) > 9.5).astype(float), 11)
+    L_close = _lags(close, 33)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ends = np.arange(4, 24)
+        c_end, c_start = L_close[ends], L_close[ends + 10]
+        is_dragon = ((c_end - c_start) / c_start >= 0.50) & (_lags(limit_cnt, 23)[ends] >= 3)
+        first = np.argmax(is_dragon, axis=0)[None]             # 离当日最近的一段
+        peak = np.take_along_axis(c_end, first, axis=0)[0]
+        start = np.take_along_axis(c_start, first, axis=0)[0]
+        up_vol = np.take_along_axis(_lags(ta.rolling_mean(vol, 11), 23)[ends], first, axis=0)[0]
+
+        up_range = peak - start
+        retrace = np.where(up_range > 0, (peak - close) / up_range, 0.0)
+        hit = is_dragon.any(axis=0) & (retrace >= 0.3) & (retrace <= 0.55)
+        hit &= ~(close < ma20 * 0.98)
+        hit &= ~(ta.rolling_mean(vol, 3) > up_vol * 0.55)
+    return hit & (_rows(close) >= min_bars - 1)
+
+
+def high_volume_retest(open_, low, close, vol, vol_ma5, min_bars=30, price_range=(5.0, 30.0)):
+    """
+    高量不破 (high_volume_retest_filter.check_high_volume_logic)：
+    取 1~14 根K线前最近一根“量 > 前一日5日均量2倍的阳线”为标杆，当日收盘在其最低价到 +3% 之间，
+    标杆之后收盘从未跌破该最低价，且当日量不超过标杆量的一半。
+    """
+    close, vol = np.asarray(close, dtype=float), np.asarray(vol, dtype=float)
+    L_close, L_low, L_vol = _lags(close, 14), _lags(low, 14), _lags(vol, 14)
+    with np.errstate(invalid='ignore'):
+        offsets = np.arange(1, 15)
+        is_target = (L_vol[offsets] > _lags(vol_ma5, 15)[offsets + 1] * 2.0) & (L_close[offsets] > _lags(open_, 14)[offsets])
+        e = offsets[np.argmax(is_target, axis=0)]              # 离当日最近的标杆
+        support = np.take_along_axis(L_low, e[None], axis=0)[0]
+        target_vol = np.take_along_axis(L_vol, e[None], axis=0)[0]
+
+        # 标杆之后 (含当日) 的收盘均不低于支撑位
+        after = _rows(L_close) < e
+        broken = (after & _lt(L_close, support)).any(axis=0)
+
+        hit = is_target.any(axis=0) & (close >= support) & (close <= support * 1.03) & ~broken
+        hit &= ~(vol > target_vol * 0.5)
+        hit &= (close >= price_range[0]) & (close <= price_range[1])
+    return hit & (_rows(close) >= min_bars - 1)
+
+
+def double_cannon(high, low, close, pct, ma5, ma20, min_bars=15):
+    """
+    涨停双响炮 (limit_up_squad_filter.is_double_cannon)：
+    当日涨幅 >= 7%，2~7 根K线前有一根涨幅 > 7% 的前炮，中间洗盘K线收盘价都在前炮最高/最低价之间，
+    且 MA5 >= MA20。
+    """
+    close, pct, ma5, ma20 = (np.asarray(a, dtype=float) for a in (close, pct, ma5, ma20))
+    L_close = _lags(close, 6)
+    with np.errstate(invalid='ignore'):
+        # 洗盘区为前炮与当日之间的K线，取其收盘最高/最低 (忽略缺失值，同 pandas)
+        wash_max = np.fmax.accumulate(L_close[1:], axis=0)
+        wash_min = np.fmin.accumulate(L_close[1:], axis=0)
+        offsets = np.arange(2, 8)
+        found = ((_lags(pct, 7)[offsets] > 7.0)
+                 & (wash_max[offsets - 2] <= _lags(high, 7)[offsets])
+                 & (wash_min[offsets - 2] >= _lags(low, 7)[offsets])).any(axis=0)
+        hit = found & ~(pct < 7.0) & (ma5 >= ma20)
+    return hit & (_rows(close) >= min_bars - 1)
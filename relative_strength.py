@@ -0,0 +1,242 @@
+import os
+import pickle
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import indicators as ta
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+INDEX_DIR = 'index_data'                 # stock_data_downloader.py 下载的基准指数，格式与个股相同
+BENCHMARK = 'sh000300'                   # 基准指数文件名 (sh000001 上证指数 / sz399001 深证成指 / sh000905 中证500)
+STATE_FILE = 'cache/relative_strength.pkl'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/relative_strength'
+WINDOWS = [20, 60, 120]                  # 统计窗口 (K线根数)
+MIN_VALID = 0.8                          # 窗口内有效K线 (个股与指数收益都存在) 不足该比例时特征为 NaN
+CATCHUP = 60                             # 一次增量最多追补的K线数，落后更多则按窗口重算
+
+# 每根K线对窗口累计量的贡献：x 基准收益，y 个股收益，lx/ly 为对数收益
+TERMS = ['n', 'x', 'y', 'xx', 'xy', 'lx', 'ly']
+
+
+def load_index(symbol=BENCHMARK, index_dir=INDEX_DIR):
+    """基准指数收盘价 Series (索引为日期字符串)；文件不存在时返回 None"""
+    path = os.path.join(index_dir, f"{symbol}.csv")
+    if not os.path.exists(path):
+        return None
+    df = pe.normalize_columns(pd.read_csv(path))
+    close = pd.Series(pd.to_numeric(df['close'], errors='coerce').values, index=df['date'].astype(str).values)
+    return close[~close.index.duplicated(keep='last')]
+
+
+def returns(dates, pct_chg, bench):
+    """
+    (个股收益, 基准收益)。个股取涨跌幅 (交易所按除权后的前收盘计算)；
+    基准取指数在该股上一根与本根K线日期之间的涨幅，停牌复牌后的第一根K线对应停牌期间指数的累计涨跌。
+    dates/pct_chg 为单只股票的一维序列或按K线右对齐的 (T, N) 面板。
+    """
+    dates = np.asarray(dates, dtype=object)
+    bc = bench.reindex(dates.ravel()).values.reshape(dates.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.asarray(pct_chg, dtype=float) / 100, bc / ta.shift(bc) - 1
+
+
+def _terms(y, x):
+    """
+    各累计量的逐K线贡献，形状 (len(TERMS),) + y.shape。任一收益缺失的K线贡献为 0；
+    跌幅 >= 100% 的为坏数据 (早年前复权出现的零/负价格、收盘价为 0 的记录)，同样剔除。
+    """
+    with np.errstate(invalid='ignore'):
+        valid = (x > -1) & (y > -1)
+    x, y = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+    return np.stack([valid.astype(float), x, y, x * x, x * y, np.log1p(x), np.log1p(y)])
+
+
+def _cumulative(terms):
+    """沿时间轴的前缀和，首行补 0：窗口 [a, b) 的累计量 = c[:, b] - c[:, a]"""
+    return np.concatenate([np.zeros_like(terms[:, :1]), np.cumsum(terms, axis=1)], axis=1)
+
+
+def features(sums, window):
+    """
+    由窗口累计量 (按 TERMS 顺序排在第 0 轴) 给出：
+    rs{w}    相对强弱，窗口内个股与基准复利收益之比 - 1 (> 0 即跑赢基准)；
+    beta{w}  个股收益对基准收益的回归斜率；
+    resid{w} 特质收益，窗口内个股累计收益扣除 beta × 基准累计收益。
+    """
+    n, sx, sy, sxx, sxy, lx, ly = sums
+    with np.errstate(invalid='ignore', divide='ignore'):
+        beta = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        ok = n >= window * MIN_VALID
+        return {
+            f'rs{window}': np.where(ok, np.expm1(ly - lx), np.nan),
+            f'beta{window}': np.where(ok, beta, np.nan),
+            f'resid{window}': np.where(ok, sy - beta * sx, np.nan),
+        }
+
+
+def compute(y, x, windows=WINDOWS):
+    """全历史向量化计算 (一维或 (T, N))，返回 {特征名: 与 y 同形的数组}"""
+    c = _cumulative(_terms(y, x))
+    out = {}
+    for w in windows:
+        sums = np.full(c[:, 1:].shape, np.nan)
+        if w <= sums.shape[1]:
+            sums[:, w - 1:] = c[:, w:] - c[:, :-w]
+        out.update(features(sums, w))
+    return out
+
+
+class StrengthStore:
+    """
+    全市场相对强弱：每个窗口一张 (股票数, len(TERMS)) 的累计量矩阵。
+    增量更新时把新K线的贡献加入、把滑出窗口的K线减去 (两者来自同一个右对齐面板)，
+    基准指数被改写 (已处理的最后一天收盘价变化) 或参数变化时全部重算。
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.codes = []
+        self.n_bars = np.zeros(0, dtype=np.int64)
+        self.last_date = np.empty(0, dtype=object)
+        self.last_close = np.zeros(0)
+        self.sums = {w: np.zeros((0, len(TERMS))) for w in WINDOWS}
+        self.bench_last = None
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    saved = pickle.load(f)
+                if saved.get('windows') == WINDOWS and saved.get('benchmark') == BENCHMARK:
+                    self.__dict__.update(saved['state'])
+                else:
+                    print("相对强弱参数或基准已变化，将全量重建")
+            except Exception as e:
+                print(f"读取相对强弱状态失败，将全量重建: {e}")
+        self.row = {c: i for i, c in enumerate(self.codes)}
+
+    def _ensure(self, codes):
+        new = [c for c in codes if c not in self.row]
+        if not new:
+            return
+        n = len(new)
+        for c in new:
+            self.row[c] = len(self.codes)
+            self.codes.append(c)
+        self.n_bars = np.concatenate([self.n_bars, np.zeros(n, dtype=np.int64)])
+        self.last_date = np.concatenate([self.last_date, np.full(n, None, dtype=object)])
+        self.last_close = np.concatenate([self.last_close, np.full(n, np.nan)])
+        for w in WINDOWS:
+            self.sums[w] = np.vstack([self.sums[w], np.zeros((n, len(TERMS)))])
+
+    def update_panel(self, panel, bench):
+        """
+        用右对齐面板 (tail >= max(WINDOWS) + CATCHUP + 1，含 close/pct_chg) 与基准收盘价推进。
+        最新K线晚于基准最后日期的股票本次不处理，等指数更新后再追补。
+        返回 (增量推进的股票数, 重算的股票数, 等待基准的股票数)。
+        """
+        self._ensure(panel.codes)
+        if self.bench_last is not None and bench.get(self.bench_last[0]) != self.bench_last[1]:
+            print("基准指数历史数据有变化，全部重算")
+            self.n_bars[:] = 0
+        T = panel.shape[0]
+        rows = np.array([self.row[c] for c in panel.codes])
+        close = panel['close']
+        c = _cumulative(_terms(*returns(panel.dates, panel['pct_chg'], bench)))
+        k = panel.length - self.n_bars[rows]             # 每只股票新增的K线数
+
+        # 原来的最后一根K线必须还在原位且未被改写，否则重算
+        prev = np.clip(T - 1 - k, 0, T - 1)
+        cols = np.arange(len(rows))
+        same = ((panel.dates[prev, cols] == self.last_date[rows])
+                & (close[prev, cols] == self.last_close[rows]))
+        ready = panel.dates[-1].astype(str) <= bench.index[-1]
+        rebuild = ready & ((self.n_bars[rows] == 0) | (k < 0) | (k > min(CATCHUP, T - 1 - max(WINDOWS))) | ~same)
+        step = ready & ~rebuild & (k > 0)
+
+        sel = np.flatnonzero(step)
+        for w in WINDOWS:
+            add = c[:, T, sel] - c[:, T - k[sel], sel]
+            drop = c[:, T - w, sel] - c[:, T - w - k[sel], sel]
+            self.sums[w][rows[sel]] += (add - drop).T
+        sel = np.flatnonzero(rebuild)
+        for w in WINDOWS:
+            self.sums[w][rows[sel]] = (c[:, T, sel] - c[:, T - w, sel]).T
+
+        done = step | rebuild
+        self.n_bars[rows[done]] = panel.length[done]
+        self.last_date[rows[done]] = panel.dates[-1, done]
+        self.last_close[rows[done]] = close[-1, done]
+        self.bench_last = (bench.index[-1], bench.iloc[-1])
+        return int(step.sum()), int(rebuild.sum()), int((~ready).sum())
+
+    def table(self):
+        """每只股票最新一根K线的全部特征，DataFrame (索引为代码，date 为该K线日期)"""
+        out = {'date': self.last_date}
+        for w in WINDOWS:
+            out.update(features(self.sums[w].T, w))
+        return pd.DataFrame(out, index=pd.Index(self.codes, name='code'))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        state = {k: getattr(self, k) for k in ('codes', 'n_bars', 'last_date', 'last_close', 'sums', 'bench_last')}
+        with open(tmp, 'wb') as f:
+            pickle.dump({'windows': WINDOWS, 'benchmark': BENCHMARK, 'state': state}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+_TABLE = None
+_BENCH = None
+
+def symbol_rs(df, code):
+    """
+    战法脚本使用的入口：该股最新一根K线的相对强弱特征 (Series，如 rs20 > 0 即近 20 根K线跑赢基准)。
+    状态库已更新到传入K线的最后日期时直接查表，否则用传入的K线与基准指数现场计算；没有基准数据时返回 None。
+    """
+    global _TABLE, _BENCH
+    if _TABLE is None:
+        _TABLE = StrengthStore().table()
+        _BENCH = load_index()
+    df = pe.normalize_columns(df)
+    last = str(df['date'].iloc[-1])
+    if code in _TABLE.index and _TABLE.at[code, 'date'] == last:
+        return _TABLE.loc[code]
+    if _BENCH is None:
+        return None
+    y, x = returns(df['date'].astype(str).values, pd.to_numeric(df['pct_chg'], errors='coerce').values, _BENCH)
+    tail = max(WINDOWS)
+    feats = compute(y[-tail:], x[-tail:])
+    return pd.Series({'date': last, **{k: v[-1] for k, v in feats.items()}}, name=code)
+
+
+def main():
+    bench = load_index()
+    if bench is None:
+        print(f"未找到基准指数 {os.path.join(INDEX_DIR, BENCHMARK)}.csv，请先运行 stock_data_downloader.py 下载指数")
+        sys.exit(1)
+    store = StrengthStore()
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['close', 'pct_chg'], tail=max(WINDOWS) + CATCHUP + 1, align='bar')
+    stepped, rebuilt, pending = store.update_panel(panel, bench)
+    store.save()
+    print(f"相对强弱更新完成 (基准 {BENCHMARK}，最新 {bench.index[-1]})：{len(panel.codes)} 只，"
+          f"增量 {stepped} 只，重算 {rebuilt} 只，等待指数更新 {pending} 只，耗时 {time.perf_counter() - t0:.1f}s")
+
+    table = store.table().reset_index()
+    names_df = sr.load_names(NAMES_FILE)
+    table.insert(1, 'name', table['code'].map(dict(zip(names_df['code'], names_df['name']))))
+    table = table.sort_values(f'rs{WINDOWS[0]}', ascending=False)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"relative_strength_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    table.round(4).to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"相对强弱表已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/shape_templates'
+TOP_K = 20                   # 每个模板输出最相似的股票数
+SCAN_ENDS = 5                # 窗口终点取最近几根K线 (形态在 0~4 根K线前走完也能匹配到)
+BAND = 0.1                   # DTW 弯曲带宽 (Sakoe-Chiba)，占模板长度的比例
+VOLUME_WEIGHT = 0.5          # 成交量通道在距离里的权重 (价格为 1)
+BATCH = 512                  # 按下界从小到大分批计算精确 DTW
+
+# 由真实走势生成的模板：(模板名, 股票代码, 形态最后一根K线的日期, 长度)
+EXAMPLE_TEMPLATES = [
+    # ('golden_pit_600000', '600000', '2024-09-30', 40),
+]
+
+
+class ShapeTemplate:
+    """
+    形态模板：等长的价格序列与成交量序列 (任意尺度，匹配前都做 z 标准化，只比较形状)。
+    volume 为 None 时只比较价格。可由关键点插值 (from_keypoints) 或真实K线 (from_example) 生成。
+    """
+
+    def __init__(self, name, price, volume=None, desc=''):
+        self.name = name
+        self.price = np.asarray(price, dtype=float)
+        self.volume = None if volume is None else np.asarray(volume, dtype=float)
+        self.desc = desc
+
+    @property
+    def length(self):
+        return len(self.price)
+
+    @classmethod
+    def from_keypoints(cls, name, price, volume=None, length=40, desc=''):
+        """关键点为 [(相对位置 0~1, 取值), ...]，线性插值到 length 根"""
+        t = np.linspace(0, 1, length)
+        interp = lambda pts: np.interp(t, [p for p, _ in pts], [v for _, v in pts])
+        return cls(name, interp(price), None if volume is None else interp(volume), desc)
+
+    @classmethod
+    def from_example(cls, name, code, date, length, data_dir=DATA_DIR):
+        """取某只股票截至 date (含) 的最近 length 根K线作为模板"""
+        df = pe.normalize_columns(pd.read_csv(os.path.join(data_dir, f"{code}.csv")))
+        df = df[df['date'].astype(str) <= str(date)].tail(length)
+        if len(df) < length:
+            raise ValueError(f"{code} 在 {date} 之前不足 {length} 根K线")
+        return cls(name, df['close'].values, df['volume'].values, f"{code} 截至 {date} 的 {length} 根K线")
+
+    def __repr__(self):
+        return f"ShapeTemplate({self.name}, {self.length} 根{'' if self.volume is None else ', 含量能'})"
+
+
+TEMPLATES = [
+    # 黄金坑：横盘后急跌挖坑，坑底缩量，随后放量收复坑前平台
+    ShapeTemplate.from_keypoints(
+        'golden_pit',
+        price=[(0, 1.0), (0.3, 0.98), (0.5, 0.8), (0.65, 0.8), (0.85, 0.92), (1, 1.0)],
+        volume=[(0, 1.0), (0.4, 1.2), (0.6, 0.6), (0.8, 1.0), (1, 1.5)],
+        length=40, desc='黄金坑'),
+    # 老鸭头：放量上涨形成鸭颈与鸭头，缩量回调成鸭嘴，再放量突破鸭头高点
+    ShapeTemplate.from_keypoints(
+        'duck_head',
+        price=[(0, 0.75), (0.35, 0.95), (0.5, 1.0), (0.7, 0.88), (0.85, 0.92), (1, 1.05)],
+        volume=[(0, 0.8), (0.35, 1.3), (0.5, 1.2), (0.7, 0.6), (1, 1.4)],
+        length=60, desc='老鸭头'),
+    # 龙回头：短期放量急涨 50% 以上，随后缩量回调 30%~50% 的涨幅
+    ShapeTemplate.from_keypoints(
+        'dragon_returns',
+        price=[(0, 0.65), (0.35, 1.0), (0.7, 0.82), (1, 0.8)],
+        volume=[(0, 1.0), (0.15, 2.5), (0.35, 3.0), (0.6, 1.2), (1, 0.8)],
+        length=30, desc='龙回头'),
+]
+
+
+def _znorm(x, axis=-1):
+    """沿 axis 做 z 标准化；常数序列为全 0"""
+    mean = x.mean(axis=axis, keepdims=True)
+    std = x.std(axis=axis, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(std > 0, (x - mean) / std, 0.0)
+
+
+def _channels(price, volume, use_volume):
+    """(..., L) 的价格/成交量 -> (..., L, 通道)，已按权重缩放 (距离 = 各通道平方差之和)"""
+    chans = [_znorm(price)]
+    if use_volume:
+        chans.append(_znorm(np.log1p(np.maximum(volume, 0))) * np.sqrt(VOLUME_WEIGHT))
+    return np.stack(chans, axis=-1)
+
+
+def _envelope(q, r):
+    """模板每个位置 ±r 范围内的上下包络 (LB_Keogh)"""
+    L = len(q)
+    pad = np.concatenate([np.full((r,) + q.shape[1:], np.nan), q, np.full((r,) + q.shape[1:], np.nan)])
+    win = sliding_window_view(pad, 2 * r + 1, axis=0)[:L]
+    return np.nanmax(win, axis=-1), np.nanmin(win, axis=-1)
+
+
+def lb_keogh(q, C, r):
+    """
+    LB_Keogh 下界的逐点贡献，(M, L)：候选第 k 点只能与模板 k±r 范围内的点对齐，
+    落在包络之外的部分是它在任何弯曲路径上的最小代价。逐点贡献的后缀和可用于 DTW 提前放弃。
+    """
+    upper, lower = _envelope(q, r)
+    over = np.maximum(C - upper, 0) + np.maximum(lower - C, 0)
+    return (over ** 2).sum(axis=-1)
+
+
+def dtw(q, C, r, threshold=np.inf, tail_lb=None):
+    """
+    带宽 r 的 DTW 平方距离，对一批候选 C (M, L, 通道) 同时计算。
+    行对应候选的点、列对应模板的点；每算完一行，若该行最小累计代价 + 剩余行的下界 >= threshold，
+    说明最终距离必然不小于 threshold，该候选提前放弃 (结果为 inf)。
+    """
+    M, L = C.shape[:2]
+    out = np.full(M, np.inf)
+    active = np.arange(M)
+    prev = np.full((M, L), np.inf)
+    for i in range(L):
+        lo, hi = max(0, i - r), min(L - 1, i + r)
+        cost = ((C[active, i, None, :] - q[None, lo:hi + 1, :]) ** 2).sum(axis=-1)
+        cur = np.full((len(active), L), np.inf)
+        for j in range(lo, hi + 1):
+            if i == 0 and j == 0:
+                best = 0.0
+            else:
+                best = prev[:, j]
+                if j > 0:
+                    best = np.minimum(best, np.minimum(prev[:, j - 1], cur[:, j - 1]))
+            cur[:, j] = cost[:, j - lo] + best
+        prev = cur
+        if threshold < np.inf:
+            bound = cur[:, lo:hi + 1].min(axis=1)
+            if tail_lb is not None and i + 1 < L:
+                bound = bound + tail_lb[active, i + 1]
+            keep = bound < threshold
+            if not keep.all():
+                active, prev = active[keep], prev[keep]
+                if not len(active):
+                    return out
+    out[active] = prev[:, L - 1]
+    return out
+
+
+def candidates(panel, length, ends=SCAN_ENDS):
+    """
+    右对齐面板上每只股票最近 ends 个终点的窗口：返回 (价格 (M, L), 成交量 (M, L), 列号, 距最新K线根数)，
+    含缺失值的窗口 (上市不足、停牌) 剔除。
+    """
+    close, vol = panel['close'], panel['volume']
+    T = close.shape[0]
+    ends = min(ends, T - length + 1)
+    if ends <= 0:
+        return np.empty((0, length)), np.empty((0, length)), np.empty(0, dtype=int), np.empty(0, dtype=int)
+    start = T - length - ends + 1
+    pw = sliding_window_view(close[start:], length, axis=0)       # (ends, N, L)
+    vw = sliding_window_view(vol[start:], length, axis=0)
+    ago = np.broadcast_to((ends - 1 - np.arange(ends))[:, None], pw.shape[:2])
+    col = np.broadcast_to(np.arange(pw.shape[1])[None, :], pw.shape[:2])
+    ok = ~(np.isnan(pw).any(axis=-1) | np.isnan(vw).any(axis=-1))
+    return pw[ok], vw[ok], col[ok], ago[ok]
+
+
+def search(template, panel, k=TOP_K, ends=SCAN_ENDS):
+    """
+    全市场搜索与模板最相似的 k 只股票 (每只股票取最近 ends 个窗口中最好的一个)。
+    先算全部候选的 LB_Keogh，按下界从小到大分批做精确 DTW；当前第 k 名的距离即剪枝阈值，
+    下界已不小于阈值的候选整批跳过，DTW 过程中也按阈值提前放弃。
+    返回 (DataFrame[code, distance, ago, date], 统计信息 dict)。
+    """
+    use_volume = template.volume is not None
+    L = template.length
+    r = max(1, int(round(BAND * L)))
+    q = _channels(template.price, template.volume if use_volume else None, use_volume)
+    pw, vw, col, ago = candidates(panel, L, ends)
+    C = _channels(pw, vw, use_volume)
+    contrib = lb_keogh(q, C, r)
+    lb = contrib.sum(axis=1)
+    tail_lb = np.cumsum(contrib[:, ::-1], axis=1)[:, ::-1]       # tail_lb[:, i] = 第 i 点起的下界
+    order = np.argsort(lb, kind='stable')
+
+    best = {}                                                     # 列号 -> (距离, 候选下标)
+    computed = 0
+    for s in range(0, len(order), BATCH):
+        kth = np.inf if len(best) < k else sorted(d for d, _ in best.values())[k - 1]
+        batch = order[s:s + BATCH]
+        batch = batch[lb[batch] < kth]
+        if not len(batch):
+            break
+        dist = dtw(q, C[batch], r, kth, tail_lb[batch])
+        computed += len(batch)
+        for idx, d in zip(batch, dist):
+            if d < best.get(col[idx], (np.inf,))[0]:
+                best[col[idx]] = (d, idx)
+
+    top = sorted(best.items(), key=lambda kv: kv[1][0])[:k]
+    T = panel.shape[0]
+    out = pd.DataFrame({
+        'code': [panel.codes[c] for c, _ in top],
+        'distance': [np.sqrt(d / L) for _, (d, _) in top],
+        'ago': [int(ago[i]) for _, (_, i) in top],
+        'date': [panel.dates[T - 1 - ago[i], c] for c, (_, i) in top],
+    })
+    return out, {'candidates': len(order), 'dtw': computed}
+
+
+def all_templates(data_dir=DATA_DIR):
+    """内置模板加上 EXAMPLE_TEMPLATES 里由真实K线生成的模板"""
+    return TEMPLATES + [ShapeTemplate.from_example(name, code, date, length, data_dir)
+                        for name, code, date, length in EXAMPLE_TEMPLATES]
+
+
+def main():
+    templates = all_templates()
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['close', 'volume'],
+                          tail=max(t.length for t in templates) + SCAN_ENDS, align='bar')
+    print(f"装载 {len(panel.codes)} 只股票，耗时 {time.perf_counter() - t0:.1f}s")
+
+    names_df = sr.load_names(NAMES_FILE)
+    names = dict(zip(names_df['code'], names_df['name']))
+    frames = []
+    for tpl in templates:
+        t1 = time.perf_counter()
+        top, stats = search(tpl, panel)
+        print(f"  {tpl.name:<16}{tpl.length:>3} 根：候选 {stats['candidates']} 个窗口，"
+              f"精确 DTW {stats['dtw']} 个，耗时 {time.perf_counter() - t1:.2f}s")
+        top.insert(0, 'template', tpl.name)
+        top.insert(1, 'rank', np.arange(1, len(top) + 1))
+        top.insert(3, 'name', top['code'].map(names))
+        frames.append(top)
+
+    out = pd.concat(frames, ignore_index=True)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"shape_matches_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    out.round(4).to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"形态匹配结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
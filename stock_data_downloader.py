@@ -9,6 +9,13 @@ import sys
 DATA_DIR = "stock_data"
 FILTERED_LIST_PATH = os.path.join(DATA_DIR, "filtered_stock_list.csv")
 CHECKPOINT_PATH = os.path.join(DATA_DIR, "checkpoint.txt") 
+INDEX_DIR = "index_data"
+
+# 基准指数：文件名带市场前缀 (避免与同号个股混淆，如 000001 平安银行 / 上证指数) -> 指数名称
+INDEX_LIST = {
+    "sh000001": "上证指数", "sz399001": "深证成指",
+    "sh000300": "沪深300", "sh000905": "中证500",
+}
 
 COLUMN_MAPPING = {
     "日期": "日期", "开盘": "开盘", "收盘": "收盘", "最高": "最高",
@@ -17,9 +24,16 @@ COLUMN_MAPPING = {
 }
 TARGET_COLUMNS = ['日期', '股票代码', '开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '涨跌额', '换手率']
 
-def download_item(symbol_short):
-    """处理单个股票的增量下载"""
-    file_path = os.path.join(DATA_DIR, f"{symbol_short}.csv")
+def fetch_stock(symbol_short, start_date):
+    return ak.stock_zh_a_hist(symbol=symbol_short, period="daily", start_date=start_date, adjust="")
+
+def fetch_index(symbol, start_date):
+    # 指数接口只认 6 位代码，文件名里的市场前缀去掉
+    return ak.index_zh_a_hist(symbol=symbol[2:], period="daily", start_date=start_date)
+
+def download_item(symbol_short, file_path=None, fetch=fetch_stock):
+    """处理单个股票 (或指数) 的增量下载，指数与个股的 CSV 格式完全相同"""
+    file_path = file_path or os.path.join(DATA_DIR, f"{symbol_short}.csv")
     try:
         existing_dates = set()
         start_date = "19900101"
@@ -37,7 +51,7 @@ def download_item(symbol_short):
                 print(f"读取旧文件失败 {symbol_short}, 重新全量下载: {e}")
 
         # 2. 调用 akshare 接口
-        df = ak.stock_zh_a_hist(symbol=symbol_short, period="daily", start_date=start_date, adjust="")
+        df = fetch(symbol_short, start_date)
         
         if df is not None and not df.empty:
             df = df.rename(columns=COLUMN_MAPPING)
@@ -65,6 +79,14 @@ def download_item(symbol_short):
         print(f"下载异常 {symbol_short}: {e}")
         return False
 
+def download_indices():
+    """基准指数数量少，每轮都全部增量更新；失败只提示，不影响个股下载与断点"""
+    if not os.path.exists(INDEX_DIR):
+        os.makedirs(INDEX_DIR)
+    for symbol, name in INDEX_LIST.items():
+        if not download_item(symbol, os.path.join(INDEX_DIR, f"{symbol}.csv"), fetch_index):
+            print(f"⚠️ 指数 {name} ({symbol}) 下载失败，下轮重试")
+
 def main():
     # 确保目录存在
     if not os.path.exists(DATA_DIR): 
@@ -78,6 +100,8 @@ def main():
         print("错误: 找不到名单文件 filtered_stock_list.csv")
         sys.exit(1)
 
+    download_indices()
+
     # 读取名单
     df_list = pd.read_csv(FILTERED_LIST_PATH)
     symbols = df_list['代码'].astype(str).str.zfill(6).tolist()
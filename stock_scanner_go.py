@@ -2,9 +2,9 @@ import pandas as pd
 from datetime import datetime
 import os
 import pytz
-import glob
-from multiprocessing import Pool, cpu_count, Manager
-import numpy as np
+import strategy_registry as sr
+import indicators as ta
+import indicator_state as ist
 
 # ==================== 2026“量价齐升”核心参数 (金标准) ===================
 MIN_PRICE = 5.0              # 股价门槛：过滤垃圾低价股
@@ -26,155 +26,145 @@ SHANGHAI_TZ = pytz.timezone('Asia/Shanghai')
 STOCK_DATA_DIR = 'stock_data'
 NAME_MAP_FILE = 'stock_names.csv' 
 
-def calculate_indicators(df):
+def calculate_indicators(df, symbol=None):
     """
     计算核心指标体系：含MA、RSI、KDJ、MACD及量能变化
+    (指标来自共享指标库并按股票缓存，直接在读入的表上加列)
     """
-    df = df.reset_index(drop=True)
-    close = df['收盘']
-    delta = close.diff()
-    
+    ind = ta.Indicators(df, symbol)
+
     # 1. RSI计算 (6日 & 14日)
-    def get_rsi(period):
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-        rs = gain / loss.replace(0, np.nan)
-        return 100 - (100 / (1 + rs))
-
-    df['rsi6'] = get_rsi(6)
-    df['rsi14'] = get_rsi(14)
+    df['rsi6'] = ind.rsi(6)
+    df['rsi14'] = ind.rsi(14)
     
     # 2. KDJ计算 (9,3,3)
-    low_list = df['最低'].rolling(window=9).min()
-    high_list = df['最高'].rolling(window=9).max()
-    rsv = (df['收盘'] - low_list) / (high_list - low_list) * 100
-    df['kdj_k'] = rsv.ewm(com=2).mean()
-    df['kdj_d'] = df['kdj_k'].ewm(com=2).mean()
+    df['kdj_k'], df['kdj_d'], _ = ind.kdj()
     df['kdj_gold'] = (df['kdj_k'] > df['kdj_d']) & (df['kdj_k'].shift(1) <= df['kdj_d'].shift(1))
     
     # 3. MACD计算 (12, 26, 9)
-    df['ema12'] = close.ewm(span=12, adjust=False).mean()
-    df['ema26'] = close.ewm(span=26, adjust=False).mean()
-    df['diff'] = df['ema12'] - df['ema26']
-    df['dea'] = df['diff'].ewm(span=9, adjust=False).mean()
-    df['macd_hist'] = (df['diff'] - df['dea']) * 2
+    df['ema12'] = ind.ema(12)
+    df['ema26'] = ind.ema(26)
+    df['diff'], df['dea'], df['macd_hist'] = ind.macd()
     # MACD金叉判断
     df['macd_gold'] = (df['diff'] > df['dea']) & (df['diff'].shift(1) <= df['dea'].shift(1))
     # MACD能量增强：绿柱缩短或翻红
     df['macd_improving'] = df['macd_hist'] > df['macd_hist'].shift(1)
 
     # 4. 均线与量能指标
-    df['ma5'] = close.rolling(window=5).mean()
-    df['ma60'] = close.rolling(window=60).mean()
-    df['avg_turnover_30'] = df['换手率'].rolling(window=30).mean()
-    df['vol_ma5'] = df['成交量'].shift(1).rolling(window=5).mean()
+    df['ma5'] = ind.ma(5)
+    df['ma60'] = ind.ma(60)
+    df['avg_turnover_30'] = ind.ma(30, 'turnover')
+    df['vol_ma5'] = ta.shift(ind.vol_ma(5))
     df['vol_ratio'] = df['成交量'] / df['vol_ma5']
     df['vol_increase'] = df['成交量'] > df['成交量'].shift(1)  # 较昨日放量
     return df
 
-def process_single_stock(args):
-    file_path, name_map, stats_dict = args
-    stock_code = os.path.basename(file_path).split('.')[0]
-    stock_name = name_map.get(stock_code, "未知")
+def latest_indicators(df, symbol=None):
+    """
+    最新一根K线的指标 (Series)：优先取 indicator_state 的增量状态，values 为最新一根、prev 为上一根，
+    金叉/柱线变化/前一日量能都由这两根推出；没有状态或历史被改写需要重建时退回全量计算。
+    """
+    state = ist.current(symbol, df)
+    if state is None:
+        return calculate_indicators(df.copy(), symbol).iloc[-1]
+    cur, prev = state.values, state.prev
+    latest = df.iloc[-1].to_dict()
+    latest.update({k: cur[k] for k in ('rsi6', 'rsi14', 'kdj_k', 'kdj_d', 'ema12', 'ema26',
+                                       'diff', 'dea', 'macd_hist', 'ma5', 'ma60')})
+    latest['kdj_gold'] = cur['kdj_k'] > cur['kdj_d'] and prev['kdj_k'] <= prev['kdj_d']
+    latest['macd_gold'] = cur['diff'] > cur['dea'] and prev['diff'] <= prev['dea']
+    latest['macd_improving'] = cur['macd_hist'] > prev['macd_hist']
+    latest['avg_turnover_30'] = cur['turnover_ma30']
+    latest['vol_ma5'] = prev['vol_ma5']
+    latest['vol_ratio'] = df['成交量'].iat[-1] / latest['vol_ma5']   # NumPy 标量除法，与全量计算同为 inf/NaN 语义
+    latest['vol_increase'] = df['成交量'].iat[-1] > df['成交量'].iat[-2]
+    return pd.Series(latest)
+
+def evaluate(df_raw, stock_code, stock_name=None):
+    """
+    对已读入的单只股票K线做判定 (单独运行与统一调度器共用)。
+    返回 (入选记录或None, 掉队原因列表)，由调度器汇总成漏斗；ST/K线不足返回 None (不计入统计)。
+    """
+    stock_name = stock_name or "未知"
     if "ST" in stock_name.upper(): return None
+    if len(df_raw) < 60: return None
 
-    try:
-        df_raw = pd.read_csv(file_path)
-        if len(df_raw) < 60: return None
-        df = calculate_indicators(df_raw)
-        latest = df.iloc[-1]
-        
-        # --- 关卡式统计 (不精简，严格记录掉队原因) ---
-        stats_dict['total_scanned'] += 1
-        
-        # 1. 基础门槛统计
-        if latest['收盘'] < MIN_PRICE:
-            stats_dict['fail_price'] += 1
-            return None
-        if latest['avg_turnover_30'] > MAX_AVG_TURNOVER_30:
-            stats_dict['fail_turnover'] += 1
-            return None
-        
-        # 2. 空间门槛统计
-        potential = (latest['ma60'] - latest['收盘']) / latest['收盘'] * 100
-        if potential < MIN_PROFIT_POTENTIAL:
-            stats_dict['fail_potential'] += 1
-        
-        # 3. 指标超跌统计
-        is_oversold = latest['rsi6'] <= RSI6_MAX and latest['rsi14'] <= RSI14_MAX and latest['kdj_k'] <= KDJ_K_MAX
-        if not is_oversold:
-            stats_dict['fail_rsi_kdj'] += 1
-        
-        # 4. 缩量逻辑统计
-        is_shrink_vol = MIN_VOLUME_RATIO <= latest['vol_ratio'] <= MAX_VOLUME_RATIO
-        if not is_shrink_vol:
-            stats_dict['fail_volume'] += 1
-
-        # 5. 形态门槛统计
-        change = latest['涨跌幅'] if '涨跌幅' in latest else 0
-        is_small_body = abs(change) <= MAX_TODAY_CHANGE
-        if not is_small_body:
-            stats_dict['fail_shape'] += 1
-
-        # --- 瞄准“量价齐升”与“共振”判定 ---
-        strategy_tag = ""
-
-        # 【0级：点火启动】解决时间成本。逻辑：超跌 + 站上5日线 + 较昨日放量 + MACD改善
-        if is_oversold and latest['收盘'] > latest['ma5'] and latest['vol_increase'] and latest['vol_ratio'] > 0.6:
-            if latest['macd_improving']:
-                strategy_tag = "0-点火启动(即买即涨)"
-
-        # 【1级：共振金叉】追求技术指标的一致性。逻辑：超跌 + KDJ金叉 + MACD改善
-        if strategy_tag == "" and is_oversold and latest['kdj_gold'] and latest['macd_improving']:
-            strategy_tag = "1-多指标共振金叉"
-
-        # 【2级：极致潜伏】追求极致安全。逻辑：超跌 + 极致缩量 + 小阴小阳
-        if strategy_tag == "" and is_oversold and is_shrink_vol and is_small_body and potential >= MIN_PROFIT_POTENTIAL:
-            strategy_tag = "2-极致缩量潜伏"
-
-        # 【3级：准入选观察】宽限条件，进入蓄势区
-        elif strategy_tag == "" and is_oversold and latest['vol_ratio'] <= 1.1 and potential >= 10.0:
-            strategy_tag = "3-准入选观察池"
-
-        if strategy_tag:
-            macd_status = "金叉" if latest['macd_gold'] else ("红柱" if latest['macd_hist'] > 0 else "绿柱缩短")
-            return {
-                '类型': strategy_tag,
-                '代码': stock_code,
-                '名称': stock_name,
-                '现价': round(latest['收盘'], 2),
-                '量比': round(latest['vol_ratio'], 2),
-                'RSI6/14': f"{round(latest['rsi6'],1)}/{round(latest['rsi14'],1)}",
-                'KDJ/MACD': f"{'金叉' if latest['kdj_gold'] else '底位'}/{macd_status}",
-                '距60日线': f"{round(potential, 1)}%",
-                '今日涨跌': f"{round(change, 1)}%"
-            }
-    except:
-        return None
-    return None
-
-def main():
+    latest = latest_indicators(df_raw, stock_code)
+    
+    # --- 关卡式统计 (不精简，严格记录掉队原因) ---
+    fails = []
+    
+    # 1. 基础门槛统计
+    if latest['收盘'] < MIN_PRICE:
+        return None, ['fail_price']
+    if latest['avg_turnover_30'] > MAX_AVG_TURNOVER_30:
+        return None, ['fail_turnover']
+    
+    # 2. 空间门槛统计
+    potential = (latest['ma60'] - latest['收盘']) / latest['收盘'] * 100
+    if potential < MIN_PROFIT_POTENTIAL:
+        fails.append('fail_potential')
+    
+    # 3. 指标超跌统计
+    is_oversold = latest['rsi6'] <= RSI6_MAX and latest['rsi14'] <= RSI14_MAX and latest['kdj_k'] <= KDJ_K_MAX
+    if not is_oversold:
+        fails.append('fail_rsi_kdj')
+    
+    # 4. 缩量逻辑统计
+    is_shrink_vol = MIN_VOLUME_RATIO <= latest['vol_ratio'] <= MAX_VOLUME_RATIO
+    if not is_shrink_vol:
+        fails.append('fail_volume')
+
+    # 5. 形态门槛统计
+    change = latest['涨跌幅'] if '涨跌幅' in latest else 0
+    is_small_body = abs(change) <= MAX_TODAY_CHANGE
+    if not is_small_body:
+        fails.append('fail_shape')
+
+    # --- 瞄准“量价齐升”与“共振”判定 ---
+    strategy_tag = ""
+
+    # 【0级：点火启动】解决时间成本。逻辑：超跌 + 站上5日线 + 较昨日放量 + MACD改善
+    if is_oversold and latest['收盘'] > latest['ma5'] and latest['vol_increase'] and latest['vol_ratio'] > 0.6:
+        if latest['macd_improving']:
+            strategy_tag = "0-点火启动(即买即涨)"
+
+    # 【1级：共振金叉】追求技术指标的一致性。逻辑：超跌 + KDJ金叉 + MACD改善
+    if strategy_tag == "" and is_oversold and latest['kdj_gold'] and latest['macd_improving']:
+        strategy_tag = "1-多指标共振金叉"
+
+    # 【2级：极致潜伏】追求极致安全。逻辑：超跌 + 极致缩量 + 小阴小阳
+    if strategy_tag == "" and is_oversold and is_shrink_vol and is_small_body and potential >= MIN_PROFIT_POTENTIAL:
+        strategy_tag = "2-极致缩量潜伏"
+
+    # 【3级：准入选观察】宽限条件，进入蓄势区
+    elif strategy_tag == "" and is_oversold and latest['vol_ratio'] <= 1.1 and potential >= 10.0:
+        strategy_tag = "3-准入选观察池"
+
+    if not strategy_tag:
+        return None, fails
+    macd_status = "金叉" if latest['macd_gold'] else ("红柱" if latest['macd_hist'] > 0 else "绿柱缩短")
+    return {
+        '类型': strategy_tag,
+        '代码': stock_code,
+        '名称': stock_name,
+        '现价': round(latest['收盘'], 2),
+        '量比': round(latest['vol_ratio'], 2),
+        'RSI6/14': f"{round(latest['rsi6'],1)}/{round(latest['rsi14'],1)}",
+        'KDJ/MACD': f"{'金叉' if latest['kdj_gold'] else '底位'}/{macd_status}",
+        '距60日线': f"{round(potential, 1)}%",
+        '今日涨跌': f"{round(change, 1)}%"
+    }, fails
+
+def save_results(results, names_df):
     now_shanghai = datetime.now(SHANGHAI_TZ)
-    print(f"🚀 量价齐升版扫描开始... (当前时间: {now_shanghai.strftime('%Y-%m-%d %H:%M')})")
-
-    manager = Manager()
-    stats_dict = manager.dict({
-        'total_scanned': 0, 'fail_price': 0, 'fail_turnover': 0,
+    # 掉队原因由调度器按 evaluate 返回的原因键汇总 (同时写入 results/funnel/)
+    funnel = STRATEGY.last_funnel or {}
+    stats_dict = {
+        'total_scanned': funnel.get('universe', 0), 'fail_price': 0, 'fail_turnover': 0,
         'fail_potential': 0, 'fail_rsi_kdj': 0, 'fail_volume': 0, 'fail_shape': 0
-    })
-
-    name_map = {}
-    if os.path.exists(NAME_MAP_FILE):
-        n_df = pd.read_csv(NAME_MAP_FILE, dtype={'code': str})
-        name_map = dict(zip(n_df['code'].str.zfill(6), n_df['name']))
-
-    file_list = glob.glob(os.path.join(STOCK_DATA_DIR, '*.csv'))
-    tasks = [(f, name_map, stats_dict) for f in file_list]
-
-    with Pool(processes=cpu_count()) as pool:
-        raw_results = pool.map(process_single_stock, tasks)
-
-    results = [r for r in raw_results if r is not None]
+    }
+    stats_dict.update({c['condition']: c['fail'] for c in funnel.get('conditions', [])})
     
     # --- 输出诊断报告 (保留所有精细化统计) ---
     print("\n" + "="*50)
@@ -200,5 +190,13 @@ def main():
     else:
         print("\n😱 诊断结果：未发现符合“量价齐升”或“超跌潜伏”的极品标的。")
 
+# KDJ/MACD 为递推指标，需要全部历史 (indicator_state 有状态时只推进新K线)；ST 判断在 evaluate 内按名称大写匹配
+STRATEGY = sr.register('stock_scanner_go', evaluate, save_results, funnel=True)
+
+def main():
+    now_shanghai = datetime.now(SHANGHAI_TZ)
+    print(f"🚀 量价齐升版扫描开始... (当前时间: {now_shanghai.strftime('%Y-%m-%d %H:%M')})")
+    sr.run_strategies([STRATEGY], STOCK_DATA_DIR, NAME_MAP_FILE)
+
 if __name__ == "__main__":
     main()
@@ -2,9 +2,9 @@ import pandas as pd
 from datetime import datetime
 import os
 import pytz
-import glob
-from multiprocessing import Pool, cpu_count
-import numpy as np
+import strategy_registry as sr
+import indicators as ta
+import indicator_state as ist
 
 # ==================== 2025“温和低吸”精选参数 (已优化) ===================
 MIN_PRICE = 5.0              # 股价门槛
@@ -27,99 +27,93 @@ SHANGHAI_TZ = pytz.timezone('Asia/Shanghai')
 STOCK_DATA_DIR = 'stock_data'
 NAME_MAP_FILE = 'stock_names.csv' 
 
-def calculate_indicators(df):
-    """计算核心指标"""
-    df = df.reset_index(drop=True)
-    close = df['收盘']
+def calculate_indicators(df, symbol=None):
+    """计算核心指标 (共享指标库，按股票缓存)"""
+    ind = ta.Indicators(df, symbol)
     
     # 1. RSI6
-    delta = close.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=6).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=6).mean()
-    rs = gain / loss.replace(0, np.nan)
-    df['rsi6'] = 100 - (100 / (1 + rs))
+    df['rsi6'] = ind.rsi(6)
     
     # 2. KDJ (9,3,3)
-    low_list = df['最低'].rolling(window=9).min()
-    high_list = df['最高'].rolling(window=9).max()
-    rsv = (df['收盘'] - low_list) / (high_list - low_list) * 100
-    df['kdj_k'] = rsv.ewm(com=2).mean()
+    df['kdj_k'] = ind.kdj()[0]
     
     # 3. MA5 & MA60
-    df['ma5'] = close.rolling(window=5).mean()
-    df['ma60'] = close.rolling(window=60).mean()
+    df['ma5'] = ind.ma(5)
+    df['ma60'] = ind.ma(60)
     
     # 4. 换手率均值与量比
-    df['avg_turnover_30'] = df['换手率'].rolling(window=30).mean()
-    df['vol_ma5'] = df['成交量'].shift(1).rolling(window=5).mean()
+    df['avg_turnover_30'] = ind.ma(30, 'turnover')
+    df['vol_ma5'] = ta.shift(ind.vol_ma(5))
     df['vol_ratio'] = df['成交量'] / df['vol_ma5']
     
     return df
 
-def process_single_stock(args):
-    file_path, name_map = args
-    stock_code = os.path.basename(file_path).split('.')[0]
-    stock_name = name_map.get(stock_code, "未知")
+def latest_indicators(df, symbol=None):
+    """最新一根K线的指标：优先取 indicator_state 的增量状态 (量比用上一根的5日均量)，无状态或需重建时全量计算"""
+    state = ist.current(symbol, df)
+    if state is None:
+        return calculate_indicators(df.copy(), symbol).iloc[-1]
+    latest = df.iloc[-1].to_dict()
+    latest.update({k: state.values[k] for k in ('rsi6', 'kdj_k', 'ma5', 'ma60')})
+    latest['avg_turnover_30'] = state.values['turnover_ma30']
+    latest['vol_ma5'] = state.prev['vol_ma5']
+    latest['vol_ratio'] = df['成交量'].iat[-1] / latest['vol_ma5']   # NumPy 标量除法，与全量计算同为 inf/NaN 语义
+    return pd.Series(latest)
+
+def evaluate(df_raw, stock_code, stock_name=None):
+    """
+    对已读入的单只股票K线做判定 (单独运行与统一调度器共用)。
+    返回 (入选记录或None, 未通过的条件键列表)，由调度器汇总成漏斗；ST/K线不足返回 None (不计入统计)。
+    """
+    stock_name = stock_name or "未知"
     
     if "ST" in stock_name.upper():
         return None
 
-    try:
-        df_raw = pd.read_csv(file_path)
-        if len(df_raw) < 60: return None
-        
-        df = calculate_indicators(df_raw)
-        latest = df.iloc[-1]
-        
-        if latest['收盘'] < MIN_PRICE or latest['avg_turnover_30'] > MAX_AVG_TURNOVER_30:
-            return None
-        
-        potential = (latest['ma60'] - latest['收盘']) / latest['收盘'] * 100
-        change = latest['涨跌幅'] if '涨跌幅' in latest else 0
-        
-        if potential < MIN_PROFIT_POTENTIAL or change > MAX_TODAY_CHANGE:
-            return None
-        
-        if latest['rsi6'] > RSI6_MAX or latest['kdj_k'] > KDJ_K_MAX:
-            return None
+    if len(df_raw) < 60: return None
+    
+    latest = latest_indicators(df_raw, stock_code)
+    
+    # 价格/换手为硬门槛，不达标直接淘汰；其余关卡全部判定，记下所有未通过的条件
+    if latest['收盘'] < MIN_PRICE:
+        return None, ['fail_price']
+    if latest['avg_turnover_30'] > MAX_AVG_TURNOVER_30:
+        return None, ['fail_turnover']
+    
+    potential = (latest['ma60'] - latest['收盘']) / latest['收盘'] * 100
+    change = latest['涨跌幅'] if '涨跌幅' in latest else 0
+    
+    fails = []
+    if potential < MIN_PROFIT_POTENTIAL:
+        fails.append('fail_potential')
+    if change > MAX_TODAY_CHANGE:
+        fails.append('fail_change')
+    
+    if latest['rsi6'] > RSI6_MAX or latest['kdj_k'] > KDJ_K_MAX:
+        fails.append('fail_rsi_kdj')
+    
+    if latest['收盘'] < latest['ma5']:
+        fails.append('fail_ma5')
         
-        if latest['收盘'] < latest['ma5']:
-            return None
-            
-        if not (MIN_VOLUME_RATIO <= latest['vol_ratio'] <= MAX_VOLUME_RATIO):
-            return None
+    if not (MIN_VOLUME_RATIO <= latest['vol_ratio'] <= MAX_VOLUME_RATIO):
+        fails.append('fail_volume')
 
-        return {
-            '代码': stock_code,
-            '名称': stock_name,
-            '最新日期': latest['日期'],
-            '现价': round(latest['收盘'], 2),
-            '今日量比': round(latest['vol_ratio'], 2),
-            'RSI6': round(latest['rsi6'], 1),
-            'K值': round(latest['kdj_k'], 1),
-            '距60日线空间': f"{round(potential, 1)}%",
-            '今日涨跌': f"{round(change, 1)}%"
-        }
-    except:
-        return None
+    if fails:
+        return None, fails
+    return {
+        '代码': stock_code,
+        '名称': stock_name,
+        '最新日期': latest['日期'],
+        '现价': round(latest['收盘'], 2),
+        '今日量比': round(latest['vol_ratio'], 2),
+        'RSI6': round(latest['rsi6'], 1),
+        'K值': round(latest['kdj_k'], 1),
+        '距60日线空间': f"{round(potential, 1)}%",
+        '今日涨跌': f"{round(change, 1)}%"
+    }, fails
 
-def main():
+def save_results(results, names_df):
     now_shanghai = datetime.now(SHANGHAI_TZ)
-    print(f"🚀 温和版精选扫描开始... 寻找稳健低吸机会")
-
-    name_map = {}
-    if os.path.exists(NAME_MAP_FILE):
-        n_df = pd.read_csv(NAME_MAP_FILE, dtype={'code': str})
-        name_map = dict(zip(n_df['code'].str.zfill(6), n_df['name']))
-
-    file_list = glob.glob(os.path.join(STOCK_DATA_DIR, '*.csv'))
-    tasks = [(file_path, name_map) for file_path in file_list]
-
-    with Pool(processes=cpu_count()) as pool:
-        raw_results = pool.map(process_single_stock, tasks)
-
-    results = [r for r in raw_results if r is not None]
-        
     if results:
         df_result = pd.DataFrame(results)
         df_result = df_result.sort_values(by='今日量比', ascending=True)
@@ -138,5 +132,12 @@ def main():
     else:
         print("\n😱 即使放宽条件仍无标的，说明目前市场整体强度较高或处于普涨中，无需刻意抄底。")
 
+# KDJ 为递推指标，需要全部历史 (indicator_state 有状态时只推进新K线)；ST 判断在 evaluate 内按名称大写匹配
+STRATEGY = sr.register('stock_scanner_w', evaluate, save_results, funnel=True)
+
+def main():
+    print(f"🚀 温和版精选扫描开始... 寻找稳健低吸机会")
+    sr.run_strategies([STRATEGY], STOCK_DATA_DIR, NAME_MAP_FILE)
+
 if __name__ == "__main__":
     main()
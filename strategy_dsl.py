@@ -0,0 +1,362 @@
+import os
+import ast
+import re
+import time
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import indicators as ta
+import feature_graph as fg
+import cross_section as cs
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/strategy_dsl'
+PANEL_TAIL = 600             # 只装载最近600根K线 (足够MA250与EMA/KDJ预热)；None 为全部历史
+
+# 新战法只需在这里加一行表达式，语法见 parse 的说明
+STRATEGIES = {
+    # stock_scanner_go 的超跌共振关卡：RSI6/RSI14/KDJ_K 同时处于底部，且站上5日线、放量、MACD柱改善
+    'go_oversold_ignite': "bars >= 60 & ~(close < 5) & ~(ma(turnover, 30) > 2.5)"
+                          " & rsi6 <= 25 & rsi14 <= 35 & kdj_k <= 30"
+                          " & close > ma5 & volume > ref(volume, 1) & volume / ref(vol_ma5, 1) > 0.6 & macd > ref(macd, 1)",
+    # duck_hunter 的 A 级：强势突破 + 多头排列 + 量能配合
+    'duck_a': "bars >= 180 & 5 <= close <= 28 & pct_chg >= 3 & turnover > 3"
+              " & close > ma5 > ma10 & ma5 > ref(ma5, 1)"
+              " & (volume > vol_ma5 * 1.2 | close >= ma10 & volume <= vol_ma5)",
+    # duck_hunter A 级的趋势质量版：单日的 ma5 抬头换成近20日回归斜率 + R² + ADX，要求一段干净的上行
+    'duck_a_trend': "bars >= 180 & 5 <= close <= 28 & pct_chg >= 3 & turnover > 3"
+                    " & close > ma5 > ma10 & slope20 > 0.2 & rsq20 >= 0.6 & adx14 >= 20"
+                    " & (volume > vol_ma5 * 1.2 | close >= ma10 & volume <= vol_ma5)",
+    # duck_hunter 的 AAA 级：A 级之上 60日线抬头、MACD柱放大、近20日冲高过 60日线 8%、近10日出现地量、DIFF 在水上
+    'duck_aaa': "bars >= 180 & 5 <= close <= 28 & pct_chg >= 3 & turnover > 3"
+                " & close > ma5 > ma10 & ma5 > ref(ma5, 1)"
+                " & (volume > vol_ma5 * 1.2 | close >= ma10 & volume <= vol_ma5)"
+                " & ma60 > ref(ma60, 4) & macd > ref(macd, 1)"
+                " & hhv(ref(high, 1), 19) > ma60 * 1.08 & llv(ref(volume, 1), 9) < vol_ma60 * 0.8 & diff > 0",
+    # golden_pit：60日线附近的缩量坑底放量反转
+    'golden_pit': "bars >= 120 & 5 <= close <= 25 & close > ma60 * 0.97"
+                  " & llv(ref(volume, 2), 13) < vol_ma20 * 0.6"
+                  " & volume > vol_ma20 * 1.1 & close > ma5 & close > ma10"
+                  " & 0.03 < close / llv(low, 20) - 1 < 0.15 & all(close / open > 0.95, 3)"
+                  " & (high - low) / ref(close, 1) > 0.03 & close > open",
+    # golden_pit 的自适应版：坑底地量与振幅改用个股自身近120日的百分位，大盘股与小盘股各按自己的常态衡量
+    'golden_pit_adaptive': "bars >= 120 & 5 <= close <= 25 & close > ma60 * 0.97"
+                           " & llv(ref(rank(volume, 120), 2), 13) <= 0.1"
+                           " & volume > vol_ma20 * 1.1 & close > ma5 & close > ma10"
+                           " & 0.03 < close / llv(low, 20) - 1 < 0.15 & all(close / open > 0.95, 3)"
+                           " & rank(amplitude, 120) >= 0.6 & close > open",
+}
+
+# 股票池：表达式只看K线，板块与名称过滤按原脚本的规则写在这里 (prefixes 只保留这些代码前缀，
+# exclude_names 排除名称匹配该正则的股票，require_name 只要名称表里有的股票)；未列出的战法扫描全部股票
+UNIVERSE = {
+    'go_oversold_ignite': {'exclude_names': r'(?i)ST'},
+    'duck_a': {'prefixes': ('60', '00'), 'exclude_names': r'ST|退', 'require_name': True},
+    'duck_a_trend': {'prefixes': ('60', '00'), 'exclude_names': r'ST|退', 'require_name': True},
+    'duck_aaa': {'prefixes': ('60', '00'), 'exclude_names': r'ST|退', 'require_name': True},
+    'golden_pit': {'prefixes': ('60', '00', '688'), 'exclude_names': r'ST'},
+    'golden_pit_adaptive': {'prefixes': ('60', '00', '688'), 'exclude_names': r'ST'},
+}
+
+NAME_ALIAS = {'vol': 'volume', 'pct': 'pct_chg'}
+FG_PREFIX = {'close': '', 'volume': 'vol_'}     # 与 feature_graph.PREFIX_ALIAS 相反方向
+ROLLING_FG_OP = {'ma': 'ma', 'ema': 'ema', 'std': 'std', 'hhv': 'max', 'llv': 'min', 'rank': 'rank',
+                 'slope': 'slope', 'rsq': 'rsq'}
+
+# 函数表：名字 -> (参数个数, 最后一个参数是否为窗口整数, 实现)
+FUNCTIONS = {
+    'ma':    (2, True, lambda x, n: ta.rolling_mean(x, n)),
+    'ema':   (2, True, lambda x, n: ta.ewm_mean(x, span=n, adjust=False)),
+    'std':   (2, True, lambda x, n: ta.rolling_std(x, n)),
+    'sum':   (2, True, lambda x, n: ta.rolling_sum(x, n)),
+    'hhv':   (2, True, lambda x, n: ta.rolling_max(x, n)),
+    'llv':   (2, True, lambda x, n: ta.rolling_min(x, n)),
+    'rank':  (2, True, lambda x, n: ta.rolling_rank(x, n)),
+    'slope': (2, True, lambda x, n: ta.rolling_linreg(x, n)[0]),
+    'rsq':   (2, True, lambda x, n: ta.rolling_linreg(x, n)[1]),
+    'ref':   (2, True, lambda x, n: ta.shift(x, n)),
+    'count': (2, True, lambda c, n: ta.rolling_sum(np.asarray(c, dtype=float), n)),
+    'any':   (2, True, lambda c, n: ta.window_any(c, n)),
+    'all':   (2, True, lambda c, n: ta.rolling_sum(np.asarray(c, dtype=float), n) == n),
+    'cross': (2, False, lambda a, b: (a > b) & (ta.shift(a) <= ta.shift(b))),
+    'abs':   (1, False, np.abs),
+    'max':   (2, False, np.maximum),
+    'min':   (2, False, np.minimum),
+    # 横截面：同一交易日在全部股票之间比较 (面板输入)
+    'cs_rank': (1, False, cs.rank),
+    'cs_pct':  (1, False, cs.percentile),
+    'cs_z':    (1, False, cs.zscore),
+    'cs_top':  (2, True, lambda x, k: cs.top_k(x, k)),
+}
+
+BINARY = {ast.Add: ('add', np.add), ast.Sub: ('sub', np.subtract), ast.Mult: ('mul', np.multiply), ast.Div: ('div', np.divide)}
+COMPARE = {ast.Lt: ('lt', np.less), ast.LtE: ('le', np.less_equal), ast.Gt: ('gt', np.greater),
+           ast.GtE: ('ge', np.greater_equal), ast.Eq: ('eq', np.equal), ast.NotEq: ('ne', np.not_equal)}
+SWAPPED = {'gt': 'lt', 'ge': 'le'}              # a > b 与 b < a 结果逐位相同，统一写法便于去重
+COMMUTATIVE = {'add', 'mul', 'and', 'or', 'eq', 'ne'}
+OPS = {name: func for name, func in list(BINARY.values()) + list(COMPARE.values())}
+OPS.update({'and': np.logical_and, 'or': np.logical_or})
+
+
+class Program:
+    """
+    一组具名表达式编译成的计算图：
+    - 叶子为原始列/feature_graph 特征，交给 FeaturePlan 统一去重计算；
+    - 内部节点按结构做公共子表达式合并 (交换律归一、a>b 归一为 b<a)，
+      多条表达式里重复出现的 ma(close,5)、ref(macd,1)、整段条件都只算一次；
+    - 输入是 (T, N) 面板或单只股票的一维数组，输出每条表达式在每根K线上的结果。
+    """
+
+    def __init__(self, exprs):
+        self.exprs = dict(exprs)
+        self.nodes = []          # [(op, args)]，依赖在前
+        self.index = {}          # 结构键 -> 节点号
+        self.features = []
+        self.outputs = {name: self._compile(parse(text)) for name, text in self.exprs.items()}
+        # 漏斗诊断：顶层 & 拆出的各条件也登记为输出 (名为 战法#序号)，结构与整条表达式里的子树相同，不产生新节点
+        self.conditions = {}
+        for name, text in self.exprs.items():
+            nodes = conjuncts(parse(text))
+            self.conditions[name] = [label(node) for node in nodes]
+            for i, node in enumerate(nodes, 1):
+                self.outputs[f'{name}#{i}'] = self._compile(node)
+        self.plan = fg.FeaturePlan({'dsl': (self.features + ['close'], None)})
+
+    # ---------- 编译 ----------
+    def _add(self, op, args):
+        if op in COMMUTATIVE:
+            args = tuple(sorted(args, key=repr))
+        key = (op, args)
+        if key not in self.index:
+            self.index[key] = len(self.nodes)
+            self.nodes.append(key)
+        return ('node', self.index[key])
+
+    def _feature(self, name):
+        name = NAME_ALIAS.get(name, name)
+        if name != 'bars':
+            fg.resolve(name)     # 未知名字在编译期报错
+            if name not in self.features:
+                self.features.append(name)
+        return self._add('feature', (name,))
+
+    def _compile(self, node):
+        if isinstance(node, ast.Expression):
+            return self._compile(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return ('const', float(node.value))
+        if isinstance(node, ast.Name):
+            return self._feature(node.id)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            arg = self._compile(node.operand)
+            return ('const', -arg[1]) if arg[0] == 'const' else self._add('neg', (arg,))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return self._add('not', (self._compile(node.operand),))
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY:
+            return self._add(BINARY[type(node.op)][0], (self._compile(node.left), self._compile(node.right)))
+        if isinstance(node, ast.BoolOp):
+            op = 'and' if isinstance(node.op, ast.And) else 'or'
+            out = self._compile(node.values[0])
+            for v in node.values[1:]:
+                out = self._add(op, (out, self._compile(v)))
+            return out
+        if isinstance(node, ast.Compare):
+            # 连写比较 a < b < c 拆成 (a < b) & (b < c)，中间项只编译一次
+            terms = [self._compile(node.left)] + [self._compile(c) for c in node.comparators]
+            out = None
+            for op, left, right in zip(node.ops, terms, terms[1:]):
+                if type(op) not in COMPARE:
+                    raise SyntaxError(f"不支持的比较: {type(op).__name__}")
+                name = COMPARE[type(op)][0]
+                if name in SWAPPED:
+                    name, left, right = SWAPPED[name], right, left
+                cmp = self._add(name, (left, right))
+                out = cmp if out is None else self._add('and', (out, cmp))
+            return out
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            return self._call(node)
+        raise SyntaxError(f"不支持的语法: {ast.dump(node)[:60]}")
+
+    def _call(self, node):
+        name = node.func.id
+        if name not in FUNCTIONS or node.keywords:
+            raise SyntaxError(f"未知函数: {name}")
+        argc, windowed, _ = FUNCTIONS[name]
+        if len(node.args) != argc:
+            raise SyntaxError(f"{name} 需要 {argc} 个参数")
+        if not windowed:
+            return self._add(name, tuple(self._compile(a) for a in node.args))
+
+        window = node.args[-1]
+        if not (isinstance(window, ast.Constant) and isinstance(window.value, int) and window.value >= 0):
+            raise SyntaxError(f"{name} 的窗口必须是非负整数")
+        n = window.value
+        # 原始列上的滚动指标改写成 feature_graph 特征名，与直接写 ma20 / vol_ma5 的表达式共用一个节点
+        arg = node.args[0]
+        if name in ROLLING_FG_OP and isinstance(arg, ast.Name):
+            col = NAME_ALIAS.get(arg.id, arg.id)
+            if col in fg.SERIES_FIELDS:
+                return self._feature(f"{FG_PREFIX.get(col, col + '_')}{ROLLING_FG_OP[name]}{n}")
+        x = self._compile(arg)
+        if name == 'ref' and n == 0:
+            return x
+        return self._add(name, (x, n))
+
+    # ---------- 执行 ----------
+    @property
+    def raw_fields(self):
+        return self.plan.raw_fields
+
+    def _bars(self, source, close):
+        """截至每根K线的上市K线数；面板只装载了尾部时，补上被截掉的部分"""
+        valid = ~np.isnan(close)
+        bars = np.cumsum(valid, axis=0)
+        if isinstance(source, pe.Panel):
+            bars = bars + (source.length - valid.sum(axis=0))
+        return bars
+
+    def run(self, source, names=None):
+        """
+        source: Panel 或 {字段: 数组}，返回 {表达式名: 与输入同形的数组}；
+        names 缺省为全部表达式，单个条件用 '战法#序号' 取出 (见 conditions)
+        """
+        feats = self.plan.compute(source)
+        values = []
+
+        def arg(a):
+            return a[1] if a[0] == 'const' else values[a[1]]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for op, args in self.nodes:
+                if op == 'feature':
+                    name = args[0]
+                    out = self._bars(source, feats['close']) if name == 'bars' else feats[name]
+                elif op == 'neg':
+                    out = -arg(args[0])
+                elif op == 'not':
+                    out = ~np.asarray(arg(args[0]), dtype=bool)
+                elif op in OPS:
+                    out = OPS[op](arg(args[0]), arg(args[1]))
+                elif FUNCTIONS[op][1]:
+                    out = FUNCTIONS[op][2](np.asarray(arg(args[0]), dtype=float), args[1])
+                else:
+                    out = FUNCTIONS[op][2](*(arg(a) for a in args))
+                values.append(out)
+        return {name: arg(self.outputs[name]) for name in (names or self.exprs)}
+
+    def describe(self):
+        n_feat = sum(1 for op, _ in self.nodes if op == 'feature')
+        return f"{len(self.exprs)} 条表达式 -> {len(self.nodes) - n_feat} 个运算节点 + {n_feat} 个特征 ({', '.join(self.features)})"
+
+
+_LOGIC_WORDS = {'&': ' and ', '|': ' or ', '~': ' not '}
+
+def parse(text):
+    """
+    表达式语法 (Python 表达式子集，ast 白名单解析，不执行任何代码)：
+    - 变量: 原始列 open/high/low/close/volume(vol)/amount/amplitude/pct_chg(pct)/turnover 与实体 body，
+            feature_graph 特征 ma20 / vol_ma5 / ema12 / diff / dea / macd / rsi6 / kdj_k / vol_rank120 ...，
+            adx14 / pdi14 / mdi14 趋势强度与方向，bars 为截至该K线的上市K线数
+    - 运算: + - * /，比较可连写 (5 <= close <= 28)，& | ~ 为逐元素与/或/非 (优先级低于比较)
+    - 函数: ma/ema/std/sum/hhv/llv(x, n) 滚动，rank(x, n) 当前值在自身近 n 根中的百分位 (0~1)，ref(x, n) 前 n 根，
+            slope/rsq(x, n) 近 n 根直线回归的斜率 (%/根) 与 R²，
+            count/any/all(条件, n) 最近 n 根内计数/出现/全部，cross(a, b) 上穿，abs(x)，max/min(a, b) 逐元素，
+            cs_rank/cs_pct/cs_z(x) 当日全市场名次/百分位/z 分数，cs_top(x, k) 当日取值最大的 k 只
+    """
+    text = re.sub(r'[&|~]', lambda m: _LOGIC_WORDS[m.group(0)], text)
+    return ast.parse(text.strip(), mode='eval')
+
+
+def conjuncts(tree):
+    """表达式顶层 & 连接的各个条件 (括号内嵌套的 & 一并展开)，其余写法整体算一个条件"""
+    node = tree.body if isinstance(tree, ast.Expression) else tree
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        return [c for v in node.values for c in conjuncts(v)]
+    return [node]
+
+
+def label(node):
+    """条件的可读写法 (还原成 & | ~)"""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return f"~({label(node.operand)})"
+    return ast.unparse(node).replace(' and ', ' & ').replace(' or ', ' | ').replace('not ', '~')
+
+
+def universe_mask(codes, name_map, prefixes=None, exclude_names=None, require_name=False):
+    """按 UNIVERSE 的规则得到参与该战法的股票 (bool，长 N)"""
+    pattern = re.compile(exclude_names) if exclude_names else None
+    out = np.ones(len(codes), dtype=bool)
+    for j, code in enumerate(codes):
+        name = name_map.get(code)
+        if prefixes is not None and not code.startswith(tuple(prefixes)):
+            out[j] = False
+        elif name is None:
+            out[j] = not require_name
+        elif pattern is not None and pattern.search(str(name)):
+            out[j] = False
+    return out
+
+
+def funnel(program, values, universe, valid=None, row=-1):
+    """
+    逐条件漏斗，口径与统一调度器相同 (strategy_registry.summarize_funnel)：values 为 program.run 的输出
+    (含全部 '战法#序号' 条件)，取第 row 行；universe 为参与统计的股票池 (bool，长 N，或 {战法: bool 数组})，
+    valid 为第 row 行有K线的股票，池内没有K线的记为 skip。条件键为条件原文，结果缺失 (NaN 比较) 按未通过计。
+    """
+    out = {}
+    for name, labels in program.conditions.items():
+        pool = np.asarray(universe[name] if isinstance(universe, dict) else universe, dtype=bool)
+        live = pool if valid is None else pool & valid
+        failed = ~np.stack([np.asarray(values[f'{name}#{i}'], dtype=bool)[row][live]
+                            for i in range(1, len(labels) + 1)], axis=1)
+        counts = Counter({('skip', ()): int((pool & ~live).sum())})
+        if len(failed):
+            for pattern, n in zip(*np.unique(failed, axis=0, return_counts=True)):
+                fails = tuple(text for text, f in zip(labels, pattern) if f)
+                counts[('miss' if fails else 'hit', fails)] += int(n)
+        out[name] = sr.summarize_funnel(counts)
+    return out
+
+
+def main():
+    program = Program(STRATEGIES)
+    print(f"表达式战法：{program.describe()}")
+    names_df = sr.load_names(NAMES_FILE)
+    name_map = dict(zip(names_df['code'], names_df['name']))
+
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=program.raw_fields, tail=PANEL_TAIL, align='bar')
+    t1 = time.perf_counter()
+    results = program.run(panel, list(program.outputs))
+    t2 = time.perf_counter()
+    print(f"装载 {panel.shape[1]} 只股票 {panel.shape[0]} 根K线 {t1 - t0:.1f}s，计算 {t2 - t1:.2f}s")
+    pools = {name: universe_mask(panel.codes, name_map, **UNIVERSE.get(name, {})) for name in program.exprs}
+    diagnostics = funnel(program, results, pools, panel.mask[-1])
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    date_str = datetime.now().strftime('%Y%m%d')
+    for name in program.exprs:
+        hit = np.asarray(results[name], dtype=bool) & pools[name]
+        latest = np.flatnonzero(hit[-1])
+        rows = [{'date': panel.dates[-1, j], 'code': panel.codes[j], 'name': name_map.get(panel.codes[j], ''),
+                 'close': panel['close'][-1, j]} for j in latest]
+        pd.DataFrame(rows, columns=['date', 'code', 'name', 'close']).to_csv(
+            os.path.join(OUTPUT_DIR, f"{name}_{date_str}.csv"), index=False, encoding='utf-8-sig')
+        print(f"  {name:<20}最新K线 {len(latest):>4} 只，装载区间内历史命中 {int(hit.sum()):>6} 次")
+
+    # 漏斗诊断 (最新K线)：与统一调度器写入同一份 results/funnel/ 日报，战法名加 strategy_dsl/ 前缀以免与脚本战法重名
+    path = sr.save_funnel({f'strategy_dsl/{name}': d for name, d in diagnostics.items()})
+    print(f"条件漏斗已写入 {path}")
+    for name, d in diagnostics.items():
+        worst = max(d['conditions'], key=lambda c: c['only_fail'], default=None)
+        stuck = f"{worst['condition']} ({worst['only_fail']} 只)" if worst else '无'
+        print(f"  {name:<20}{d['universe']} -> {d['hits']} 只，单独卡住最多: {stuck}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import time
+from datetime import datetime
+from collections import Counter, defaultdict
+from multiprocessing import Pool, cpu_count
+import pandas as pd
+import indicators as ta
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+NAMES_FILE = 'stock_names.csv'
+POOL_CHUNKSIZE = 16          # 每次派发给子进程的文件数
+FUNNEL_DIR = 'results/funnel'   # 每日各战法的漏斗诊断 funnel_<日期>.json
+
+REGISTRY = {}
+
+
+class Strategy:
+    """
+    一个可插拔战法：
+    - evaluate(df, code, name): 对已读入的原始K线(中文表头)做判定，返回结果或 None；
+                                同一个 df 依次交给各战法，需要加列/改列的先自行 rename 或 copy
+    - save(results, names_df):  把全部非空结果写到该战法原有的 results/ 位置
+    - lookback:   判定需要的尾部K线数，None 表示需要全部历史 (EMA/MACD/KDJ 等递推指标)
+    - 股票池规则: exclude_prefixes 排除代码前缀，exclude_names 排除名称匹配该正则的股票，
+                  require_name 只扫描名称表里有的股票
+    - funnel:     True 时 evaluate 返回 (结果或 None, 未通过的条件键列表)，单独返回 None 表示不在股票池内
+                  (如 ST、K线不足)；调度器按条件键汇总漏斗，run_strategies 之后可从 last_funnel 读取
+    """
+
+    def __init__(self, name, evaluate, save, lookback=None, exclude_prefixes=(), exclude_names=None, require_name=False,
+                 funnel=False):
+        self.name = name
+        self.evaluate = evaluate
+        self.save = save
+        self.lookback = lookback
+        self.funnel = funnel
+        self.last_funnel = None
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.exclude_names = re.compile(exclude_names) if exclude_names else None
+        self.require_name = require_name
+
+    def accepts(self, code, name):
+        if code.startswith(self.exclude_prefixes):
+            return False
+        if name is None:
+            return not self.require_name
+        return not (self.exclude_names and self.exclude_names.search(str(name)))
+
+    def __repr__(self):
+        return f"Strategy({self.name}, lookback={self.lookback})"
+
+
+def register(name, evaluate, save, **universe):
+    """在模块导入时登记战法，返回 Strategy 供脚本自身的 main 复用"""
+    strategy = Strategy(name, evaluate, save, **universe)
+    REGISTRY[name] = strategy
+    return strategy
+
+
+def load_names(path=NAMES_FILE):
+    """读取名称表，代码统一为6位字符串"""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['code', 'name'])
+    names_df = pd.read_csv(path, dtype={'code': str})
+    names_df['code'] = names_df['code'].str.split('.').str[0].str.zfill(6)
+    return names_df
+
+
+def list_stock_files(data_dir=DATA_DIR):
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith('.csv'))
+    return [os.path.join(data_dir, f) for f in files if f.split('.')[0].isdigit()]
+
+
+_WORKER = {}
+
+def _init_worker(strategies, name_map):
+    _WORKER['strategies'] = strategies
+    _WORKER['name_map'] = name_map
+
+
+def scan_file(file_path):
+    """
+    读一次CSV，依次交给每个适用的战法。
+    返回 (code, {战法: 结果}, {战法: 耗时秒}, [(战法, 异常类型, 信息)], 漏斗计数)，
+    漏斗计数为 Counter{(战法, 'hit'/'miss'/'skip'/'error', 未通过条件元组): 1}，由调用方合并
+    """
+    code = os.path.basename(file_path).split('.')[0]
+    name = _WORKER['name_map'].get(code)
+    todo = [s for s in _WORKER['strategies'] if s.accepts(code, name)]
+    hits, timings, errors, funnel = {}, {}, [], Counter()
+    if not todo:
+        return code, hits, timings, errors, funnel
+
+    t0 = time.perf_counter()
+    try:
+        df = pd.read_csv(file_path)
+    except Exception as e:
+        errors.append(('load', type(e).__name__, str(e)))
+        return code, hits, timings, errors, funnel
+    timings['load'] = time.perf_counter() - t0
+
+    for s in todo:
+        t0 = time.perf_counter()
+        try:
+            sub = df if s.lookback is None else df.iloc[-s.lookback:]
+            res = s.evaluate(sub, code, name)
+            if not s.funnel:
+                outcome, fails = ('miss' if res is None else 'hit'), ()
+            elif res is None:
+                outcome, fails = 'skip', ()
+            else:
+                res, fails = res
+                outcome = 'miss' if res is None else 'hit'
+            if res is not None:
+                hits[s.name] = res
+            funnel[(s.name, outcome, tuple(fails))] += 1
+        except Exception as e:
+            errors.append((s.name, type(e).__name__, str(e)))
+            funnel[(s.name, 'error', ())] += 1
+        timings[s.name] = time.perf_counter() - t0
+    # 指标缓存只在同一只股票的各战法之间复用，处理完即释放
+    ta.clear_cache()
+    return code, hits, timings, errors, funnel
+
+
+def summarize_funnel(counts):
+    """
+    单个战法的漏斗：counts 为 {(结果, 未通过条件元组): 股票数}。
+    scanned 为交给 evaluate 的股票数，universe 去掉股票池外 (skip) 与出错的；
+    各条件给出未通过数、只卡在该条件上的股票数 (未命中且没有别的未通过条件)，以及两两同时未通过的计数。
+    """
+    outcomes, fail, only, co = Counter(), Counter(), Counter(), defaultdict(Counter)
+    for (outcome, fails), n in counts.items():
+        outcomes[outcome] += n
+        for k in fails:
+            fail[k] += n
+            for k2 in fails:
+                co[k][k2] += n
+        if outcome == 'miss' and len(fails) == 1:
+            only[fails[0]] += n
+    keys = [k for k, _ in fail.most_common()]
+    return {
+        'scanned': sum(outcomes.values()),
+        'skipped': outcomes['skip'],
+        'errors': outcomes['error'],
+        'universe': outcomes['hit'] + outcomes['miss'],
+        'hits': outcomes['hit'],
+        'conditions': [{'condition': k, 'fail': fail[k], 'only_fail': only[k]} for k in keys],
+        'co_fail': {k: {k2: co[k][k2] for k2 in keys if co[k][k2]} for k in keys},
+    }
+
+
+def save_funnel(summaries, funnel_dir=FUNNEL_DIR):
+    """写入当日漏斗 JSON；同一天里单独运行某个战法只覆盖它自己的条目"""
+    os.makedirs(funnel_dir, exist_ok=True)
+    date_str = datetime.now().strftime('%Y%m%d')
+    path = os.path.join(funnel_dir, f"funnel_{date_str}.json")
+    data = {'date': date_str, 'strategies': {}}
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except ValueError:
+            pass
+    data['strategies'].update(summaries)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+    return path
+
+
+def run_strategies(strategies, data_dir=DATA_DIR, names_file=NAMES_FILE, processes=None):
+    """单次遍历：每只股票只读一次，跑完全部战法后各自保存结果"""
+    strategies = list(strategies)
+    names_df = load_names(names_file)
+    name_map = dict(zip(names_df['code'], names_df['name']))
+    files = list_stock_files(data_dir)
+    print(f"统一调度：{len(strategies)} 个战法，{len(files)} 只股票")
+
+    results = {s.name: [] for s in strategies}
+    timings, errors, funnel = defaultdict(float), [], Counter()
+    t0 = time.perf_counter()
+    with Pool(processes or cpu_count(), initializer=_init_worker, initargs=(strategies, name_map)) as pool:
+        for code, hits, cost, errs, counts in pool.imap(scan_file, files, chunksize=POOL_CHUNKSIZE):
+            for k, res in hits.items():
+                results[k].append(res)
+            for k, v in cost.items():
+                timings[k] += v
+            errors.extend((code, e) for e in errs)
+            funnel.update(counts)
+    print(f"扫描耗时 {time.perf_counter() - t0:.1f}s (读取CSV累计 {timings.pop('load', 0):.1f}s)")
+
+    by_strategy = defaultdict(Counter)
+    for (k, outcome, fails), n in funnel.items():
+        by_strategy[k][(outcome, fails)] += n
+    for s in strategies:
+        s.last_funnel = summarize_funnel(by_strategy[s.name])
+        print(f"  {s.name:<20}{s.last_funnel['universe']:>5} 只 -> 命中 {len(results[s.name]):>4} 只，"
+              f"累计 {timings.get(s.name, 0):.2f}s")
+    path = save_funnel({s.name: s.last_funnel for s in strategies})
+    print(f"漏斗诊断已写入 {path}")
+    if errors:
+        by_kind = Counter((k, kind) for _, (k, kind, _) in errors)
+        print(f"⚠️ 处理出错 {len(errors)} 次:")
+        for (k, kind), n in by_kind.most_common():
+            print(f"  [{k}] {kind}: {n} 次")
+
+    for s in strategies:
+        s.save(results[s.name], names_df)
+    return results
@@ -0,0 +1,28 @@
+import importlib
+import time
+import strategy_registry as sr
+
+# --- 配置区 ---
+# 导入即登记：每个脚本在模块级调用 sr.register，结果仍写回各自原有的 results/ 目录
+STRATEGY_MODULES = [
+    'big_yin_bottom_filter', 'consecutive_sun_filter', 'dragon_returns_filter', 'duck_hunter',
+    'geshan_daniu_filter', 'golden_pit', 'high_volume_retest_filter', 'limit_up_rebound_20ma',
+    'limit_up_squad_filter', 'macd_dynamic_filter', 'macd_water_float', 'market_beast_engine',
+    'one_sun_three_lines', 'stock_scanner_go', 'stock_scanner_w', 'weekly_trend_filter',
+    'willow_pull_filter', 'yangjia_low_buy_filter', 'yin_line_logic',
+]
+DISABLED = []                # 暂停的战法 (填 register 时的名字)
+
+
+def main():
+    for module in STRATEGY_MODULES:
+        importlib.import_module(module)
+    strategies = [s for name, s in sr.REGISTRY.items() if name not in DISABLED]
+
+    t0 = time.perf_counter()
+    sr.run_strategies(strategies)
+    print(f"全部战法完成，总耗时 {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
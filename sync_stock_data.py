@@ -2,11 +2,7 @@ import os
 import shutil
 import glob
 
-def sync_csv_files():
-    # 保持你原始脚本的路径变量名不变
-    source_dir = 'source_repo/stock_data' 
-    target_dir = 'main_repo/stock_data'
-
+def sync_csv_files(source_dir='source_repo/stock_data', target_dir='main_repo/stock_data'):
     if not os.path.exists(target_dir):
         os.makedirs(target_dir)
 
@@ -40,3 +36,6 @@ def sync_csv_files():
 
 if __name__ == "__main__":
     sync_csv_files()
+    # 基准指数 (与个股同格式)，源仓库尚未生成时跳过
+    if os.path.isdir('source_repo/index_data'):
+        sync_csv_files('source_repo/index_data', 'main_repo/index_data')
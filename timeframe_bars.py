@@ -0,0 +1,230 @@
+import os
+import io
+import re
+import pickle
+import time
+import numpy as np
+import pandas as pd
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+BARS_DIR = 'cache/bars'                  # 周期K线按 cache/bars/<周期>/<代码>.csv 存放，格式与 stock_data 相同
+STATE_FILE = 'cache/bars/state.pkl'
+PERIODS = ['W', 'M']                     # W 周线 (周一至周日)，M 月线，nD 为每 n 个交易日一根 (如 '3D')
+
+# 与日线相同的中文表头；日期为该周期内最后一个交易日
+COLUMNS = ['日期', '股票代码', '开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '涨跌额', '换手率']
+SUM_FIELDS = ['成交量', '成交额', '换手率']
+NDAY_PATTERN = re.compile(r'^(\d+)D$')
+
+
+def bar_dir(period):
+    """周期K线目录，可直接作为 DATA_DIR 交给 panel_engine.load_panel / strategy_registry.run_strategies"""
+    return os.path.join(BARS_DIR, period)
+
+
+def period_keys(dates, period, start=0):
+    """每根日K所属周期的编号；start 为第一行在全部日K中的行号 (nD 周期按交易日计数)"""
+    m = NDAY_PATTERN.match(period)
+    if m:
+        return (np.arange(len(dates)) + start) // int(m.group(1))
+    days = np.asarray(dates, dtype='datetime64[D]')
+    if period == 'W':
+        # 1970-01-01 为周四，(天数 + 3) % 7 即周一为 0
+        return days.astype(np.int64) - (days.astype(np.int64) + 3) % 7
+    if period == 'M':
+        return days.astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"未知周期: {period}")
+
+
+def aggregate(df, period, start=0):
+    """
+    日K (中文表头) 合成为周期K线。涨跌额/涨跌幅/振幅以周期第一根日K的前收盘 (收盘 - 涨跌额) 为基准，
+    每根周期K线只依赖本周期内的日K，因此可以只重算仍未结束的最后一个周期。
+    """
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    keys = period_keys(df['日期'].astype(str).values, period, start)
+    num = {c: pd.to_numeric(df[c], errors='coerce').values if c in df.columns else np.full(len(df), np.nan)
+           for c in COLUMNS[2:]}
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(df)] - 1
+
+    out = {
+        '日期': df['日期'].astype(str).values[ends],
+        '股票代码': df['股票代码'].values[starts] if '股票代码' in df.columns else '',
+        '开盘': num['开盘'][starts],
+        '收盘': num['收盘'][ends],
+        '最高': np.fmax.reduceat(num['最高'], starts),
+        '最低': np.fmin.reduceat(num['最低'], starts),
+    }
+    for c in SUM_FIELDS:
+        out[c] = np.add.reduceat(np.nan_to_num(num[c]), starts)
+    prev_close = num['收盘'][starts] - num['涨跌额'][starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['涨跌额'] = np.round(out['收盘'] - prev_close, 2)
+        out['涨跌幅'] = np.round(out['涨跌额'] / prev_close * 100, 2)
+        out['振幅'] = np.round((out['最高'] - out['最低']) / prev_close * 100, 2)
+    bars = pd.DataFrame(out)[COLUMNS]
+    if np.all(np.mod(bars['成交量'], 1) == 0):
+        bars['成交量'] = bars['成交量'].astype(np.int64)
+    return bars
+
+
+class BarState:
+    """
+    单只股票单个周期的增量状态：
+    - 日线文件已处理到的字节位置与首/末行原文 (用于识别历史被改写)；
+    - 周期文件最后一行的字节位置，以及最后一个 (仍可能未结束的) 周期包含的日K。
+    """
+
+    def __init__(self):
+        self.first_line = None
+        self.last_line = None
+        self.daily_offset = 0
+        self.n_daily = 0
+        self.bar_offset = 0
+        self.open_rows = None
+
+
+def _read_new_lines(path, state):
+    """返回 (表头, 新增的日线原文行, 是否需要全量重建)；只读取已处理位置之后的部分"""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        first = f.readline()
+        if state is None or first != state.first_line or state.daily_offset < len(state.last_line):
+            f.seek(len(header))
+            return header, f.read(), True
+        f.seek(state.daily_offset - len(state.last_line))
+        if f.readline() != state.last_line:
+            f.seek(len(header))
+            return header, f.read(), True
+        return header, f.read(), False
+
+
+def _csv_bytes(bars):
+    return bars.to_csv(index=False, header=False, lineterminator='\n').encode('utf-8')
+
+
+def _last_line_len(body):
+    return len(body) - (body.rstrip(b'\n').rfind(b'\n') + 1)
+
+
+def update_symbol(code, period, state, data_dir=DATA_DIR):
+    """把一只股票的周期K线推进到日线最新一根；返回 (新状态, 是否全量重建, 新增日K数)"""
+    daily_path = os.path.join(data_dir, f"{code}.csv")
+    out_path = os.path.join(bar_dir(period), f"{code}.csv")
+    if not os.path.exists(out_path):
+        state = None
+    header, raw, rebuilt = _read_new_lines(daily_path, state)
+    if not raw.strip():
+        return state, rebuilt, 0
+
+    lines = raw.splitlines(keepends=True)
+    if not lines[-1].endswith(b'\n'):
+        lines = lines[:-1]           # 末行尚未写完整，下次再处理
+    if not lines:
+        return state, rebuilt, 0
+    new = pd.read_csv(io.BytesIO(header + b''.join(lines)), dtype={'日期': str})
+
+    consumed = (len(header) if rebuilt else state.daily_offset) + sum(len(l) for l in lines)
+    if rebuilt:
+        state = BarState()
+        state.first_line = lines[0]
+        rows, start = new, 0
+    else:
+        rows = pd.concat([state.open_rows, new], ignore_index=True)
+        start = state.n_daily - len(state.open_rows)
+    bars = aggregate(rows, period, start)
+
+    keys = period_keys(rows['日期'].astype(str).values, period, start)
+    state.open_rows = rows[keys == keys[-1]].reset_index(drop=True)
+    state.n_daily = start + len(rows)
+    state.last_line = lines[-1]
+    state.daily_offset = consumed
+
+    # 重建时整份写出；增量时截掉原最后一行 (未结束的周期)，再追加重算后的周期K线
+    os.makedirs(bar_dir(period), exist_ok=True)
+    body = _csv_bytes(bars)
+    if rebuilt:
+        head = (','.join(COLUMNS) + '\n').encode('utf-8')
+        with open(out_path, 'wb') as f:
+            f.write(head + body)
+        state.bar_offset = len(head) + len(body) - _last_line_len(body)
+    else:
+        with open(out_path, 'r+b') as f:
+            f.seek(state.bar_offset)
+            f.truncate()
+            f.write(body)
+        state.bar_offset += len(body) - _last_line_len(body)
+    return state, rebuilt, len(new)
+
+
+def load_bars(code, period):
+    """读取一只股票的周期K线，返回与 pd.read_csv(stock_data/<代码>.csv) 相同格式的 DataFrame"""
+    return pd.read_csv(os.path.join(bar_dir(period), f"{code}.csv"))
+
+
+def get_bars(df, code, period):
+    """
+    战法脚本使用的入口：周期K线库里的数据与传入日K的最后日期一致时直接读取，
+    否则 (库未建立或尚未更新到最新) 用传入的日K现场合成。
+    """
+    path = os.path.join(bar_dir(period), f"{code}.csv")
+    if os.path.exists(path):
+        bars = pd.read_csv(path)
+        if not bars.empty and str(bars['日期'].iloc[-1]) == str(df['日期'].iloc[-1]):
+            return bars
+    return aggregate(df, period)
+
+
+class BarStore:
+    """全市场周期K线库的增量状态，整体持久化为一个 pickle 文件"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.states = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    self.states = pickle.load(f)
+            except Exception as e:
+                print(f"读取周期K线状态失败，将全量重建: {e}")
+
+    def update(self, code, period, data_dir=DATA_DIR):
+        key = (period, code)
+        state, rebuilt, n_new = update_symbol(code, period, self.states.get(key), data_dir)
+        if state is not None:
+            self.states[key] = state
+        return rebuilt, n_new
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.states, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def main():
+    store = BarStore()
+    codes = sorted(f.split('.')[0] for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0].isdigit())
+    t0 = time.perf_counter()
+    for period in PERIODS:
+        rebuilt_count, new_rows = 0, 0
+        for code in codes:
+            try:
+                rebuilt, n_new = store.update(code, period)
+                rebuilt_count += rebuilt
+                new_rows += n_new
+            except Exception as e:
+                print(f"更新 {code} {period} 周期K线失败: {e}")
+        print(f"{period} 周期K线：{len(codes)} 只，全量重建 {rebuilt_count} 只，新增日K {new_rows} 根")
+    store.save()
+    print(f"周期K线更新完成，耗时 {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    # 以模块身份运行，保证 pickle 里的类路径是 timeframe_bars.* 而非 __main__.*
+    import timeframe_bars
+    timeframe_bars.main()
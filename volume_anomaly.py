@@ -0,0 +1,243 @@
+import os
+import pickle
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import panel_engine as pe
+import strategy_registry as sr
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+STATE_FILE = 'cache/volume_anomaly.pkl'
+NAMES_FILE = 'stock_names.csv'
+OUTPUT_DIR = 'results/volume_anomaly'
+WINDOW = 20                  # 滑动窗口 Welford 统计的K线数
+EW_HALFLIFE = 20             # 指数加权版本的半衰期 (K线数)
+MIN_BARS = 20                # 指数加权版本至少积累这么多根才给出 z 值
+WARMUP = 250                 # 重算时回放的K线数 (指数加权截断误差约 0.5^(WARMUP/EW_HALFLIFE))
+CATCHUP = 60                 # 一次增量最多追补的K线数，落后更多则重算
+Z_THRESHOLD = 3.0            # 输出的异常放量阈值 (窗口 z 值)
+
+# A股连续竞价时段 (分钟)：9:30-11:30、13:00-15:00，用于把盘中成交量折算为全天
+SESSIONS = [(9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60)]
+
+ALPHA = 1 - 0.5 ** (1 / EW_HALFLIFE)
+
+# 统计量都建立在 log(成交量) 上 (成交量近似对数正态，倍数关系变为加减)；成交量缺失或为 0 的K线 (停牌) 跳过
+
+
+def _log_volume(volume):
+    volume = np.asarray(volume, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(volume > 0, np.log(volume), np.nan)
+
+
+def session_fraction(now=None):
+    """当前时刻已走过的连续竞价时间占全天的比例 (0~1]，开盘前为 0"""
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute + now.second / 60
+    total = sum(b - a for a, b in SESSIONS)
+    done = sum(min(max(minute - a, 0), b - a) for a, b in SESSIONS)
+    return done / total
+
+
+class AnomalyStore:
+    """
+    全市场成交量流式统计，每只股票一行：
+    - 滑动窗口 Welford：环形缓冲保存最近 WINDOW 个对数成交量，推进时同时加入新值、移出旧值，
+      每绕满一圈用缓冲区重新求均值与平方和，避免增减累积浮点误差；
+    - 指数加权均值/方差 (半衰期 EW_HALFLIFE)，不需要缓冲。
+    每根新K线的 z 值都相对它之前的统计量计算，再把它并入统计，单步 O(1)，整个市场一次向量运算。
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.codes = []
+        self.n_bars = np.zeros(0, dtype=np.int64)
+        self.last_date = np.empty(0, dtype=object)
+        self.last_close = np.zeros(0)
+        self.last_volume = np.zeros(0)
+        self.buf = np.zeros((0, WINDOW))
+        self.pos = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.ew_n = np.zeros(0, dtype=np.int64)
+        self.ew_mean = np.zeros(0)
+        self.ew_var = np.zeros(0)
+        self.z_win = np.zeros(0)
+        self.z_ew = np.zeros(0)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    saved = pickle.load(f)
+                if saved.get('params') == (WINDOW, EW_HALFLIFE):
+                    self.__dict__.update(saved['state'])
+                else:
+                    print("成交量统计参数已变化，将全量重建")
+            except Exception as e:
+                print(f"读取成交量统计失败，将全量重建: {e}")
+        self.row = {c: i for i, c in enumerate(self.codes)}
+
+    _FIELDS = {'n_bars': 0, 'last_date': None, 'last_close': np.nan, 'last_volume': np.nan, 'pos': 0, 'count': 0,
+               'mean': 0.0, 'm2': 0.0, 'ew_n': 0, 'ew_mean': 0.0, 'ew_var': 0.0, 'z_win': np.nan, 'z_ew': np.nan}
+
+    def _ensure(self, codes):
+        new = [c for c in codes if c not in self.row]
+        if not new:
+            return
+        for c in new:
+            self.row[c] = len(self.codes)
+            self.codes.append(c)
+        for name, init in self._FIELDS.items():
+            old = getattr(self, name)
+            setattr(self, name, np.concatenate([old, np.full(len(new), init, dtype=old.dtype)]))
+        self.buf = np.vstack([self.buf, np.full((len(new), WINDOW), np.nan)])
+
+    def _reset(self, idx):
+        for name, init in self._FIELDS.items():
+            getattr(self, name)[idx] = init
+        self.buf[idx] = np.nan
+
+    def score(self, idx, volume):
+        """idx 行股票的成交量相对当前统计量的 (窗口 z, 指数加权 z)，不改变状态"""
+        x = _log_volume(volume)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2[idx] / (self.count[idx] - 1))
+            z_win = np.where((self.count[idx] >= WINDOW) & (std > 0), (x - self.mean[idx]) / std, np.nan)
+            std_ew = np.sqrt(self.ew_var[idx])
+            z_ew = np.where((self.ew_n[idx] >= MIN_BARS) & (std_ew > 0), (x - self.ew_mean[idx]) / std_ew, np.nan)
+        return z_win, z_ew
+
+    def push(self, idx, volume):
+        """idx 行股票各追加一根K线的成交量：先按之前的统计量打分，再并入统计"""
+        self.z_win[idx], self.z_ew[idx] = self.score(idx, volume)
+        self.last_volume[idx] = volume
+        x = _log_volume(volume)
+        ok = ~np.isnan(x)
+        idx, x = idx[ok], x[ok]
+
+        # 滑动窗口 Welford：未满时普通 Welford，满后同时移出最旧的值
+        cnt, mean, m2, pos = self.count[idx], self.mean[idx], self.m2[idx], self.pos[idx]
+        full = cnt >= WINDOW
+        old = self.buf[idx, pos]
+        with np.errstate(invalid='ignore'):
+            cnt_new = np.where(full, cnt, cnt + 1)
+            mean_new = np.where(full, mean + (x - old) / WINDOW, mean + (x - mean) / cnt_new)
+            m2_new = np.where(full, m2 + (x - old) * (x - mean_new + old - mean), m2 + (x - mean) * (x - mean_new))
+        self.count[idx], self.mean[idx], self.m2[idx] = cnt_new, mean_new, np.maximum(m2_new, 0.0)
+        self.buf[idx, pos] = x
+        self.pos[idx] = (pos + 1) % WINDOW
+        wrap = idx[self.pos[idx] == 0]
+        if len(wrap):
+            self.mean[wrap] = self.buf[wrap].mean(axis=1)
+            self.m2[wrap] = ((self.buf[wrap] - self.mean[wrap, None]) ** 2).sum(axis=1)
+
+        # 指数加权均值/方差 (首个值直接作为均值)
+        first = self.ew_n[idx] == 0
+        diff = x - self.ew_mean[idx]
+        incr = ALPHA * diff
+        self.ew_mean[idx] = np.where(first, x, self.ew_mean[idx] + incr)
+        self.ew_var[idx] = np.where(first, 0.0, (1 - ALPHA) * (self.ew_var[idx] + diff * incr))
+        self.ew_n[idx] += 1
+
+    def update_panel(self, panel):
+        """用右对齐面板 (tail >= WARMUP，含 close/volume) 推进，返回 (增量推进的股票数, 重算的股票数)"""
+        self._ensure(panel.codes)
+        T = panel.shape[0]
+        rows = np.array([self.row[c] for c in panel.codes])
+        close, volume = panel['close'], panel['volume']
+        k = panel.length - self.n_bars[rows]
+
+        # 原来的最后一根K线必须还在原位且未被改写，否则重算 (回放面板里最近 WARMUP 根)
+        prev = np.clip(T - 1 - k, 0, T - 1)
+        cols = np.arange(len(rows))
+        same = ((panel.dates[prev, cols] == self.last_date[rows])
+                & (close[prev, cols] == self.last_close[rows]))
+        rebuild = (self.n_bars[rows] == 0) | (k < 0) | (k > min(CATCHUP, T)) | ~same
+        self._reset(rows[rebuild])
+        k = np.where(rebuild, np.minimum(panel.length, min(WARMUP, T)), k)
+
+        for r in range(T - int(k.max(initial=0)), T):
+            sel = np.flatnonzero(r >= T - k)
+            if len(sel):
+                self.push(rows[sel], volume[r, sel])
+
+        done = k > 0
+        self.n_bars[rows[done]] = panel.length[done]
+        self.last_date[rows[done]] = panel.dates[-1, done]
+        self.last_close[rows[done]] = close[-1, done]
+        return int((done & ~rebuild).sum()), int(rebuild.sum())
+
+    def table(self):
+        """每只股票最新一根K线的成交量 z 值，DataFrame (索引为代码)"""
+        return pd.DataFrame({'date': self.last_date, 'volume': self.last_volume,
+                             'z_win': self.z_win, 'z_ew': self.z_ew},
+                            index=pd.Index(self.codes, name='code'))
+
+    def provisional(self, volumes, fraction=None):
+        """
+        盘中临时K线打分：volumes 为 {代码: 当前累计成交量}，按已走过的交易时间比例线性折算为全天后，
+        相对截至昨日的统计量计算 z 值 (不改变状态)。返回 DataFrame[code, volume, projected, z_win, z_ew]。
+        """
+        fraction = session_fraction() if fraction is None else fraction
+        codes = [c for c in volumes if c in self.row]
+        vol = np.array([volumes[c] for c in codes], dtype=float)
+        projected = vol / fraction if fraction > 0 else np.full(len(vol), np.nan)
+        z_win, z_ew = self.score(np.array([self.row[c] for c in codes], dtype=np.int64), projected)
+        return pd.DataFrame({'code': codes, 'volume': vol, 'projected': projected, 'z_win': z_win, 'z_ew': z_ew})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        state = {k: getattr(self, k) for k in ['codes', 'buf'] + list(self._FIELDS)}
+        with open(tmp, 'wb') as f:
+            pickle.dump({'params': (WINDOW, EW_HALFLIFE), 'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+_TABLE = None
+
+def symbol_volume_z(df, code):
+    """
+    战法脚本使用的入口：该股最新一根K线的 (窗口 z, 指数加权 z)。
+    状态库已更新到传入K线的最后日期时直接查表，否则用传入K线的最近 WARMUP 根现场回放。
+    """
+    global _TABLE
+    if _TABLE is None:
+        _TABLE = AnomalyStore().table()
+    date_col = '日期' if '日期' in df.columns else 'date'
+    if code in _TABLE.index and _TABLE.at[code, 'date'] == str(df[date_col].iloc[-1]):
+        return _TABLE.at[code, 'z_win'], _TABLE.at[code, 'z_ew']
+    volume = pd.to_numeric(pe.normalize_columns(df)['volume'], errors='coerce').values[-WARMUP:]
+    store = AnomalyStore(path='')
+    store._ensure([code])
+    idx = np.array([0])
+    for v in volume:
+        store.push(idx, np.array([v]))
+    return store.z_win[0], store.z_ew[0]
+
+
+def main():
+    store = AnomalyStore()
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['close', 'volume'], tail=WARMUP, align='bar')
+    t1 = time.perf_counter()
+    stepped, rebuilt = store.update_panel(panel)
+    store.save()
+    print(f"成交量统计更新完成：{len(panel.codes)} 只，增量 {stepped} 只，重算 {rebuilt} 只，"
+          f"装载 {t1 - t0:.1f}s，统计 {time.perf_counter() - t1:.2f}s")
+
+    table = store.table().reset_index()
+    hits = table[table['z_win'] > Z_THRESHOLD].sort_values('z_win', ascending=False)
+    names_df = sr.load_names(NAMES_FILE)
+    hits.insert(1, 'name', hits['code'].map(dict(zip(names_df['code'], names_df['name']))))
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"volume_anomaly_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    hits.round(3).to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"异常放量 (z > {Z_THRESHOLD}) {len(hits)} 只 -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import pickle
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import panel_engine as pe
+
+# --- 配置区 ---
+DATA_DIR = 'stock_data'
+STATE_FILE = 'cache/volume_profile.pkl'
+OUTPUT_DIR = 'results/volume_profile'
+WINDOWS = [20, 60, 250]          # 成交量分布的统计窗口 (K线根数)
+BIN_PCT = 0.005                  # 价格分档：对数等比网格，每档 0.5%
+N_BINS = 320                     # 每只股票保留的档数 (1.005^320 ≈ 4.9 倍价格区间)，超出区间的K线压到边缘档
+CATCHUP = 60                     # 一次增量最多追补的K线数，落后更多则按窗口重算
+VALUE_AREA = 0.70                # 价值区包含的成交量占比
+
+LOG_STEP = np.log1p(BIN_PCT)
+
+
+def _bin(price):
+    """价格 -> 全局对数网格的档号"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.floor(np.log(price) / LOG_STEP)
+
+
+def bin_price(b):
+    """档号 -> 该档中间价"""
+    return np.exp((b + 0.5) * LOG_STEP)
+
+
+def _spread(high, low, volume, base):
+    """
+    一根K线的成交量在 [最低, 最高] 覆盖的档位上均匀分摊。输入为每只股票一个值的一维数组，
+    返回 ((n, N_BINS) 分摊矩阵, 是否有档位超出该股票的网格范围)。缺失K线贡献为 0。
+    """
+    lo, hi = _bin(low) - base, _bin(high) - base
+    valid = ~(np.isnan(lo) | np.isnan(hi) | np.isnan(volume)) & (volume > 0) & (hi >= lo)
+    outside = valid & ((lo < 0) | (hi >= N_BINS))
+    lo = np.clip(np.where(valid, lo, 0), 0, N_BINS - 1)
+    hi = np.clip(np.where(valid, hi, 0), 0, N_BINS - 1)
+    idx = np.arange(N_BINS)
+    mask = (idx >= lo[:, None]) & (idx <= hi[:, None])
+    share = np.where(valid, volume, 0.0) / (hi - lo + 1)
+    return mask * share[:, None], outside
+
+
+class ProfileStore:
+    """
+    全市场成交量分布：每个窗口一张 (股票数, N_BINS) 的成交量矩阵，base 为每只股票网格第 0 档的全局档号。
+    增量更新时把新K线加入、把滑出窗口的K线减去 (两者来自同一个右对齐面板)，
+    查询 (控制点 / 价值区) 一次对整张矩阵做向量运算。
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.codes = []
+        self.base = np.zeros(0)
+        self.n_bars = np.zeros(0, dtype=np.int64)
+        self.last_date = np.empty(0, dtype=object)
+        self.last_close = np.zeros(0)
+        self.hist = {w: np.zeros((0, N_BINS)) for w in WINDOWS}
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    saved = pickle.load(f)
+                if saved.get('windows') == WINDOWS and saved.get('bins') == (BIN_PCT, N_BINS):
+                    self.__dict__.update(saved['state'])
+                else:
+                    print("成交量分布参数已变化，将全量重建")
+            except Exception as e:
+                print(f"读取成交量分布失败，将全量重建: {e}")
+        self.row = {c: i for i, c in enumerate(self.codes)}
+
+    def _ensure(self, codes):
+        new = [c for c in codes if c not in self.row]
+        if not new:
+            return
+        n = len(new)
+        for c in new:
+            self.row[c] = len(self.codes)
+            self.codes.append(c)
+        self.base = np.concatenate([self.base, np.zeros(n)])
+        self.n_bars = np.concatenate([self.n_bars, np.zeros(n, dtype=np.int64)])
+        self.last_date = np.concatenate([self.last_date, np.full(n, None, dtype=object)])
+        self.last_close = np.concatenate([self.last_close, np.full(n, np.nan)])
+        for w in WINDOWS:
+            self.hist[w] = np.vstack([self.hist[w], np.zeros((n, N_BINS))])
+
+    def update_panel(self, panel):
+        """用右对齐面板 (tail >= max(WINDOWS) + CATCHUP) 推进，返回 (增量推进的股票数, 重算的股票数)"""
+        self._ensure(panel.codes)
+        T = panel.shape[0]
+        rows = np.array([self.row[c] for c in panel.codes])
+        high, low, close, vol = panel['high'], panel['low'], panel['close'], panel['volume']
+        k = panel.length - self.n_bars[rows]             # 每只股票新增的K线数
+
+        # 原来的最后一根K线必须还在原位且未被改写，否则重算
+        prev = np.clip(T - 1 - k, 0, T - 1)
+        cols = np.arange(len(rows))
+        same = ((panel.dates[prev, cols] == self.last_date[rows])
+                & (close[prev, cols] == self.last_close[rows]))
+        rebuild = (self.n_bars[rows] == 0) | (k < 0) | (k > min(CATCHUP, T - max(WINDOWS))) | ~same
+        step = ~rebuild & (k > 0)
+
+        for r in range(T - int(k[step].max(initial=0)), T):
+            sel = np.flatnonzero(step & (r >= T - k))
+            if not len(sel):
+                continue
+            add, outside = _spread(high[r, sel], low[r, sel], vol[r, sel], self.base[rows[sel]])
+            rebuild[sel[outside]] = True
+            for w in WINDOWS:
+                drop, _ = _spread(high[r - w, sel], low[r - w, sel], vol[r - w, sel], self.base[rows[sel]])
+                self.hist[w][rows[sel]] += add - drop
+        for w in WINDOWS:
+            np.maximum(self.hist[w], 0.0, out=self.hist[w])      # 加减抵消后的浮点残差
+
+        sel = np.flatnonzero(rebuild)
+        if len(sel):
+            self._rebuild(panel, sel, rows[sel])
+
+        self.n_bars[rows] = panel.length
+        self.last_date[rows] = panel.dates[-1]
+        self.last_close[rows] = close[-1]
+        return int(step.sum() - (step & rebuild).sum()), int(rebuild.sum())
+
+    def _rebuild(self, panel, cols, rows):
+        """按面板最近 max(WINDOWS) 根K线重算这些股票，网格以该区间的中点居中"""
+        T = panel.shape[0]
+        span = min(max(WINDOWS), T)
+        tail = slice(T - span, T)
+        with np.errstate(invalid='ignore'):
+            top = np.nanmax(panel['high'][tail][:, cols], axis=0)
+            bottom = np.nanmin(panel['low'][tail][:, cols], axis=0)
+        center = np.floor(np.nan_to_num((_bin(top) + _bin(bottom)) / 2))
+        self.base[rows] = center - N_BINS // 2
+        for w in WINDOWS:
+            self.hist[w][rows] = 0.0
+        for r in range(T - span, T):
+            add, _ = _spread(panel['high'][r, cols], panel['low'][r, cols], panel['volume'][r, cols], self.base[rows])
+            for w in WINDOWS:
+                if r >= T - w:
+                    self.hist[w][rows] += add
+
+    # ---------- 查询 ----------
+    def levels(self, window, value_area=VALUE_AREA):
+        """
+        全市场一次性给出控制点 (成交量最大的价位) 与价值区上下沿：
+        价值区取成交量从大到小累计达到 value_area 的档位，上下沿为其中最高/最低档的中间价。
+        """
+        h = np.round(self.hist[window], 3)             # 抹掉增量加减的浮点残差，成交量相同的档位按价格从低到高排
+        order = np.argsort(-h, axis=1, kind='stable')
+        vols = np.take_along_axis(h, order, axis=1)
+        total = vols.sum(axis=1, keepdims=True)
+        inside = (np.cumsum(vols, axis=1) - vols) < total * value_area
+        inside &= vols > 0
+        top = np.where(inside, order, -1).max(axis=1)
+        bottom = np.where(inside, order, N_BINS).min(axis=1)
+        empty = total[:, 0] <= 0
+        out = pd.DataFrame({
+            'poc': np.where(empty, np.nan, bin_price(self.base + order[:, 0])),
+            'val': np.where(empty, np.nan, bin_price(self.base + bottom)),
+            'vah': np.where(empty, np.nan, bin_price(self.base + top)),
+            'last_close': self.last_close,
+        }, index=pd.Index(self.codes, name='code'))
+        return out
+
+    def profile(self, code, window):
+        """单只股票的成交量分布，DataFrame[price, volume] (只含非零档)"""
+        h = self.hist[window][self.row[code]]
+        nz = np.flatnonzero(h)
+        return pd.DataFrame({'price': bin_price(self.base[self.row[code]] + nz), 'volume': h[nz]})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        state = {k: getattr(self, k) for k in ('codes', 'base', 'n_bars', 'last_date', 'last_close', 'hist')}
+        with open(tmp, 'wb') as f:
+            pickle.dump({'windows': WINDOWS, 'bins': (BIN_PCT, N_BINS), 'state': state}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def main():
+    store = ProfileStore()
+    t0 = time.perf_counter()
+    panel = pe.load_panel(DATA_DIR, fields=['high', 'low', 'close', 'volume'],
+                          tail=max(WINDOWS) + CATCHUP, align='bar')
+    stepped, rebuilt = store.update_panel(panel)
+    store.save()
+    print(f"成交量分布更新完成：{len(panel.codes)} 只，增量 {stepped} 只，重算 {rebuilt} 只，"
+          f"耗时 {time.perf_counter() - t0:.1f}s")
+
+    frames = []
+    for w in WINDOWS:
+        lv = store.levels(w).drop(columns='last_close').add_suffix(f'_{w}')
+        frames.append(lv)
+    out = pd.concat(frames, axis=1).join(store.levels(WINDOWS[0])['last_close']).round(3).reset_index()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"levels_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    out.to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"控制点/价值区已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
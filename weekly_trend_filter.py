@@ -1,8 +1,9 @@
 import os
-import pandas as pd
 import numpy as np
+import indicators as ta
+import timeframe_bars as tb
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import strategy_registry as sr
 
 # 配置参数
 DATA_DIR = 'stock_data'
@@ -19,15 +20,7 @@ COL_MAP = {
     '成交量': 'volume'
 }
 
-def calculate_macd(prices, fast=12, slow=26, signal=9):
-    """计算 MACD 指标"""
-    exp1 = prices.ewm(span=fast, adjust=False).mean()
-    exp2 = prices.ewm(span=slow, adjust=False).mean()
-    dif = exp1 - exp2
-    dea = dif.ewm(span=signal, adjust=False).mean()
-    return dif, dea
-
-def check_strategy(df):
+def check_strategy(df, symbol=None):
     """
     实现图片中的筛选逻辑：
     1. MACD 水上：DIF > 0 且 DEA > 0
@@ -36,10 +29,10 @@ def check_strategy(df):
     """
     if len(df) < 35: return False
     
-    dif, dea = calculate_macd(df['close'])
+    dif, dea, _ = ta.Indicators(df, symbol).macd()
     
-    last_dif = dif.iloc[-1]
-    last_dea = dea.iloc[-1]
+    last_dif = dif[-1]
+    last_dea = dea[-1]
     last_vol = df['volume'].iloc[-1]
     avg_vol = df['volume'].iloc[-6:-1].mean() # 过去5个周期的均量
     
@@ -50,63 +43,29 @@ def check_strategy(df):
     
     return is_water_up and is_gold_cross and vol_breakout
 
-def process_stock(file_name):
-    code = file_name.split('.')[0]
-    # 排除 30 开头的创业板
-    if code.startswith('30'): return None
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做日线/周线判定 (单独运行与统一调度器共用)"""
+    df_raw, df = df, df.rename(columns=COL_MAP)
     
-    try:
-        file_path = os.path.join(DATA_DIR, file_name)
-        # 读取CSV并重命名表头以便处理
-        df = pd.read_csv(file_path)
-        df = df.rename(columns=COL_MAP)
-        
-        if df.empty or len(df) < 30: return None
-        
-        # 基础过滤：价格 5.0 - 20.0 元
-        last_price = df['close'].iloc[-1]
-        if not (5.0 <= last_price <= 20.0): return None
-        
-        # --- 日线筛选 ---
-        is_daily_hit = check_strategy(df)
-        
-        # --- 周线筛选 ---
-        df['date'] = pd.to_datetime(df['date'])
-        df_weekly = df.resample('W', on='date').agg({
-            'open':'first', 
-            'high':'max', 
-            'low':'min', 
-            'close':'last', 
-            'volume':'sum'
-        }).dropna()
-        is_weekly_hit = check_strategy(df_weekly)
-        
-        return {'code': code, 'daily': is_daily_hit, 'weekly': is_weekly_hit}
-    except:
-        return None
-
-def main():
-    # 1. 加载名称并排除 ST
-    if not os.path.exists(NAMES_FILE): return
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    names_df = names_df[~names_df['name'].str.contains('ST|st')]
-    valid_codes = set(names_df['code'])
-
-    # 2. 扫描数据目录并并行执行
-    if not os.path.exists(DATA_DIR): return
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
+    if df.empty or len(df) < 30: return None
+    
+    # 基础过滤：价格 5.0 - 20.0 元
+    last_price = df['close'].iloc[-1]
+    if not (5.0 <= last_price <= 20.0): return None
     
-    daily_list, weekly_list = [], []
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_stock, files))
+    # --- 日线筛选 ---
+    is_daily_hit = check_strategy(df, code)
     
-    for res in results:
-        if res:
-            if res['daily']: daily_list.append(res['code'])
-            if res['weekly']: weekly_list.append(res['code'])
+    # --- 周线筛选 (优先读取 timeframe_bars 维护的周线库，未更新时现场合成) ---
+    df_weekly = tb.get_bars(df_raw, code, 'W').rename(columns=COL_MAP)
+    is_weekly_hit = check_strategy(df_weekly)
+    
+    return {'code': code, 'daily': is_daily_hit, 'weekly': is_weekly_hit}
+
+def save_results(results, names_df):
+    daily_list = [res['code'] for res in results if res['daily']]
+    weekly_list = [res['code'] for res in results if res['weekly']]
 
-    # 3. 输出与保存
     now = datetime.now()
     month_dir = os.path.join(OUTPUT_BASE, now.strftime('%Y%m'))
     os.makedirs(month_dir, exist_ok=True)
@@ -118,5 +77,14 @@ def main():
         out_df.to_csv(os.path.join(month_dir, file_name), index=False, encoding='utf-8-sig')
         print(f"{label} 筛选完成，匹配到 {len(out_df)} 只股票")
 
+# 排除 30 开头的创业板与 ST 股；MACD 与周线合成都需要全部历史
+STRATEGY = sr.register('weekly_trend', evaluate, save_results,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE): return
+    if not os.path.exists(DATA_DIR): return
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
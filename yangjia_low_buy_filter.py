@@ -1,8 +1,9 @@
 import os
 import pandas as pd
 import numpy as np
+import indicators as ta
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import strategy_registry as sr
 
 # 配置参数
 DATA_DIR = 'stock_data'
@@ -15,15 +16,7 @@ COL_MAP = {
     '最低': 'low', '收盘': 'close', '成交量': 'volume'
 }
 
-def calculate_macd(prices):
-    exp1 = prices.ewm(span=12, adjust=False).mean()
-    exp2 = prices.ewm(span=26, adjust=False).mean()
-    dif = exp1 - exp2
-    dea = dif.ewm(span=9, adjust=False).mean()
-    hist = 2 * (dif - dea)
-    return dif, dea, hist
-
-def check_yangjia_logic(df):
+def check_yangjia_logic(df, symbol=None):
     """
     战法名称：炒股养家低吸战法（包含四种核心策略）
     """
@@ -37,10 +30,11 @@ def check_yangjia_logic(df):
     # 基础过滤：价格 5-20 元
     if not (5.0 <= close[-1] <= 20.0): return None
 
-    # 计算技术指标
-    ma10 = df['close'].rolling(10).mean().values
-    ma20 = df['close'].rolling(20).mean().values
-    dif, dea, hist = calculate_macd(df['close'])
+    # 计算技术指标 (共享指标库，按股票缓存)
+    ind = ta.Indicators(df, symbol)
+    ma10 = ind.ma(10)
+    ma20 = ind.ma(20)
+    dif, dea, hist = ind.macd()
     
     # --- 策略一：突破回踩低吸 ---
     # 逻辑：近期有放量突破前期高点，目前缩量回踩不破
@@ -52,15 +46,15 @@ def check_yangjia_logic(df):
     # --- 策略二：MACD底背离 ---
     # 逻辑：股价创新低，但DIF不创新低
     if close[-1] < close[-20:-1].min(): # 股价创新低
-        recent_dif = dif.tail(20).values
+        recent_dif = dif[-20:]
         if recent_dif[-1] > recent_dif[:-1].min(): # DIF未创新低
-            if hist.iloc[-1] > hist.iloc[-2]: # 动能开始转强
+            if hist[-1] > hist[-2]: # 动能开始转强
                 return "MACD底背离"
 
     # --- 策略三：重要支撑位（均线支撑） ---
     # 逻辑：回踩半年线(120)或年线(250)企稳
     if len(df) >= 250:
-        ma120 = df['close'].rolling(120).mean().values[-1]
+        ma120 = ind.ma(120)[-1]
         if abs(close[-1] - ma120) / ma120 < 0.02 and close[-1] > ma120:
             if vol[-1] < vol[-5:-1].mean(): # 缩量企稳
                 return "长线均线支撑"
@@ -74,37 +68,17 @@ def check_yangjia_logic(df):
 
     return None
 
-def process_stock(file_name):
-    code = file_name.split('.')[0]
-    if code.startswith('30'): return None
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做判定 (单独运行与统一调度器共用)"""
+    df = df.rename(columns=COL_MAP)
+    if df.empty: return None
     
-    try:
-        df = pd.read_csv(os.path.join(DATA_DIR, file_name))
-        df = df.rename(columns=COL_MAP)
-        if df.empty: return None
-        
-        signal = check_yangjia_logic(df)
-        if signal:
-            return {'code': code, 'signal': signal}
-    except:
-        return None
+    signal = check_yangjia_logic(df, code)
+    if signal:
+        return {'code': code, 'signal': signal}
     return None
 
-def main():
-    if not os.path.exists(NAMES_FILE): return
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    names_df = names_df[~names_df['name'].str.contains('ST|st')]
-    valid_codes = set(names_df['code'])
-
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv') and f.split('.')[0] in valid_codes]
-    
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_stock, files))
-    
-    found = [r for r in results if r is not None]
-    
-    # 输出结果
+def save_results(found, names_df):
     now = datetime.now()
     month_dir = os.path.join(OUTPUT_BASE, now.strftime('%Y%m'))
     os.makedirs(month_dir, exist_ok=True)
@@ -117,5 +91,13 @@ def main():
         final_df.to_csv(file_path, index=False, encoding='utf-8-sig')
         print(f"筛选完成：匹配到 {len(final_df)} 只符合低吸条件的个股。")
 
+# MACD 为递推指标，需要全部历史
+STRATEGY = sr.register('yangjia_low_buy', evaluate, save_results,
+                       exclude_prefixes=('30',), exclude_names='ST|st', require_name=True)
+
+def main():
+    if not os.path.exists(NAMES_FILE): return
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == '__main__':
     main()
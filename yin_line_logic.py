@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
+import indicators as ta
 import os
-import glob
+import strategy_registry as sr
 from datetime import datetime
 
 # --- 配置区 ---
@@ -9,15 +10,15 @@ DATA_DIR = 'stock_data'
 OUTPUT_DIR = 'results/online_yin_final'
 NAMES_FILE = 'stock_names.csv'
 
-def get_indicators(df):
-    df = df.copy()
-    # 核心均线系统
+def get_indicators(df, symbol=None):
+    # 核心均线系统 (共享指标库，直接在读入的表上加列)
+    ind = ta.Indicators(df, symbol)
     for m in [5, 10, 20, 60]:
-        df[f'ma{m}'] = df['收盘'].rolling(m).mean()
+        df[f'ma{m}'] = ind.ma(m)
     
     # 趋势指标
     df['ma10_up'] = df['ma10'] > df['ma10'].shift(1)
-    df['v_ma5'] = df['成交量'].rolling(5).mean()
+    df['v_ma5'] = ind.vol_ma(5)
     df['change'] = df['收盘'].pct_change() * 100
     return df
 
@@ -58,45 +59,31 @@ def check_logic(df):
     
     return None, None
 
-def main():
-    if not os.path.exists(OUTPUT_DIR): os.makedirs(OUTPUT_DIR, exist_ok=True)
+def evaluate(df, code, name=None):
+    """对已读入的单只股票K线做判定 (单独运行与统一调度器共用)"""
+    df = get_indicators(df.rename(columns=str.strip), code)
+    match_type, ma_key = check_logic(df)
+    if not match_type:
+        return None
+
+    curr_p = df['收盘'].iloc[-1]
+    ma_val = df[ma_key].iloc[-1]
+    # 计算并四舍五入偏离度
+    bias = round((curr_p - ma_val) / ma_val * 100, 2)
     
-    name_map = {}
-    if os.path.exists(NAMES_FILE):
-        try:
-            n_df = pd.read_csv(NAMES_FILE, dtype={'code': str})
-            name_map = dict(zip(n_df['code'], n_df['name']))
-        except: pass
+    return {
+        '日期': datetime.now().strftime('%Y-%m-%d'),
+        '代码': code,
+        '名称': name or '未知',
+        '当前价': round(curr_p, 2),
+        '形态类型': match_type,
+        '偏离度%': bias,
+        '成交额(亿)': round(df['成交额'].iloc[-1] / 100000000, 2)
+    }
 
-    files = glob.glob(f"{DATA_DIR}/*.csv")
+def save_results(results, names_df):
     date_str = datetime.now().strftime('%Y-%m-%d')
-    results = []
-
-    for f in files:
-        try:
-            df = pd.read_csv(f)
-            df.columns = [c.strip() for c in df.columns]
-            df = get_indicators(df)
-            match_type, ma_key = check_logic(df)
-            
-            if match_type:
-                code = os.path.basename(f).replace('.csv', '')
-                curr_p = df['收盘'].iloc[-1]
-                ma_val = df[ma_key].iloc[-1]
-                # 计算并四舍五入偏离度
-                bias = round((curr_p - ma_val) / ma_val * 100, 2)
-                
-                results.append({
-                    '日期': date_str,
-                    '代码': code,
-                    '名称': name_map.get(code, '未知'),
-                    '当前价': round(curr_p, 2),
-                    '形态类型': match_type,
-                    '偏离度%': bias,
-                    '成交额(亿)': round(df['成交额'].iloc[-1] / 100000000, 2)
-                })
-        except: continue
-
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     if results:
         res_df = pd.DataFrame(results)
         # 核心逻辑：按偏离度的绝对值升序排。离均线0%最近的排在最前面
@@ -112,5 +99,11 @@ def main():
     else:
         print("今日未发现符合严苛条件的“贴线”信号。")
 
+# 判定只看最近60根K线 (MA60 与15日强势基因)
+STRATEGY = sr.register('yin_line', evaluate, save_results, lookback=60)
+
+def main():
+    sr.run_strategies([STRATEGY], DATA_DIR, NAMES_FILE)
+
 if __name__ == "__main__":
     main()